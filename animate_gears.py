@@ -7,18 +7,20 @@ Animation for Pygear - GIF
 - Shows animation popup window
 - One full 360-degree rotation
 
+Frames are rendered straight from the gear bitmaps by gear_animation.py
+(no matplotlib needed).
+
 @author: beebowman
 @Date: January 4, 2026 
 
 """
 
 import numpy as np
-from PIL import Image
-import matplotlib.pyplot as plt
-from matplotlib import animation
-from matplotlib.animation import PillowWriter
+import tkinter as tk
+from PIL import ImageTk
 from tkinter import filedialog
-from create_gear import getBlackPixels
+from gear_animation import loopRevolutions, renderAnimation
+from gear_engine import readGearImage
 from scipy.ndimage import label
 
 
@@ -35,15 +37,7 @@ def loadGearImage(title="Select Gear Image"):
     if not filename:
         return None
 
-    img = Image.open(filename).convert('L')
-    data = np.asarray(img)
-
-    array2d = np.array([
-        [np.median(j) if isinstance(j, (list, np.ndarray)) else j for j in row]
-        for row in data
-    ])
-
-    return array2d
+    return readGearImage(filename)[0]
 
 
 def cleanGearImage(array2d, threshold=128):
@@ -62,25 +56,6 @@ def cleanGearImage(array2d, threshold=128):
     return np.where(cleaned_binary, 0, 255).astype(np.uint8)
 
 
-# -------------------------------------------------
-# Geometry utilities
-# -------------------------------------------------
-
-def rotatePtsArray(coords, origin, angle):
-    """Vectorized rotation of Nx2 array around origin by angle (radians)."""
-    coords = np.array(coords)
-    ox, oy = origin
-    x, y = coords[:, 0], coords[:, 1]
-
-    cos_a = np.cos(angle)
-    sin_a = np.sin(angle)
-
-    x_new = ox + (x - ox) * cos_a - (y - oy) * sin_a
-    y_new = oy + (x - ox) * sin_a + (y - oy) * cos_a
-
-    return np.column_stack((x_new, y_new))
-
-
 # -------------------------------------------------
 # Animation
 # -------------------------------------------------
@@ -90,75 +65,57 @@ def animateGears(
     outputGearArray,
     ratio,
     overlap,
-    frames=90,                 # short animation
+    frames=90,                 # frames per output gear turn
     fps=30,
-    downsample=2,
+    scale=1.0,                 # frame size relative to the input image
+    workers=None,              # frame rendering processes (None = all cores)
     gif_file="pygear_rotation.gif",
     mp4_file="pygear_rotation.mp4"
 ):
-    """Animate gears and save GIF + optional MP4."""
-
-    offset = (ratio + 1 - overlap, 0)
-
-    inCoords, _ = getBlackPixels(inputGearArray, offset)
-    outCoords, _ = getBlackPixels(cleanGearImage(outputGearArray), (0, 0))
-
-    if downsample > 1:
-        inCoords = inCoords[::downsample]
-        outCoords = outCoords[::downsample]
+    """Animate gears and save GIF + optional MP4. Frames are rendered in
+    parallel and streamed to the files, so long animations fit in memory.
+    Non-integer ratios get as many turns as it takes to loop seamlessly.
+    Returns the GearAnimation and the number of output gear turns."""
 
-    outCoords = [(ratio * x, ratio * y) for (x, y) in outCoords]
-
-    inCoords = np.array(inCoords)
-    outCoords = np.array(outCoords)
-
-    fig, ax = plt.subplots(figsize=(6, 6))
-    ax.set_aspect('equal')
-    ax.axis('off')
-
-    scatter_in, = ax.plot(inCoords[:, 0], inCoords[:, 1], 'ro', markersize=2)
-    scatter_out, = ax.plot(outCoords[:, 0], outCoords[:, 1], 'bo', markersize=2)
-
-    def update(frame):
-        theta = 2 * np.pi * frame / frames
-        phi = -theta * ratio
-
-        in_rot = rotatePtsArray(inCoords, offset, phi)
-        out_rot = rotatePtsArray(outCoords, (0, 0), theta)
-
-        scatter_in.set_data(in_rot[:, 0], in_rot[:, 1])
-        scatter_out.set_data(out_rot[:, 0], out_rot[:, 1])
-        return scatter_in, scatter_out
-
-    ani = animation.FuncAnimation(
-        fig,
-        update,
-        frames=frames,
-        interval=1000 / fps,
-        blit=True
-    )
+    revolutions = loopRevolutions(ratio)
+    outputGearArray = cleanGearImage(outputGearArray)
 
     # -----------------------------
     # Save GIF (always)
     # -----------------------------
     print(f"Saving GIF: {gif_file}")
-    gif_writer = PillowWriter(fps=fps)
-    ani.save(gif_file, writer=gif_writer)
+    gears = renderAnimation(inputGearArray, outputGearArray, ratio, overlap, gif_file,
+                            frames*revolutions, fps, scale, revolutions, workers)
     print("GIF saved successfully.")
 
     # -----------------------------
     # Attempt MP4 (optional)
     # -----------------------------
-    try:
-        from matplotlib.animation import FFMpegWriter
-        print(f"Saving MP4: {mp4_file}")
-        mp4_writer = FFMpegWriter(fps=fps, bitrate=1800)
-        ani.save(mp4_file, writer=mp4_writer)
+    print(f"Saving MP4: {mp4_file}")
+    if renderAnimation(inputGearArray, outputGearArray, ratio, overlap, mp4_file,
+                       frames*revolutions, fps, scale, revolutions, workers):
         print("MP4 saved successfully.")
-    except Exception as e:
+    else:
         print("MP4 export skipped (ffmpeg not available).")
 
-    plt.show()
+    return gears, revolutions
+
+
+def showAnimation(root, gears, frames=90, fps=30, revolutions=1):
+    """Play the animation in a popup window until it is closed."""
+    window = tk.Toplevel(root)
+    window.title("Pygear Animation")
+    window.protocol("WM_DELETE_WINDOW", root.destroy)
+    canvas = tk.Label(window)
+    canvas.pack()
+
+    def play(frame=0):
+        canvas.image = ImageTk.PhotoImage(gears.frame(frame, frames * revolutions, revolutions))
+        canvas.config(image=canvas.image)
+        window.after(int(1000 / fps), play, (frame + 1) % (frames * revolutions))
+
+    play()
+    root.mainloop()
 
 
 # -------------------------------------------------
@@ -166,8 +123,6 @@ def animateGears(
 # -------------------------------------------------
 
 if __name__ == "__main__":
-    import tkinter as tk
-
     root = tk.Tk()
     root.withdraw()
 
@@ -186,9 +141,10 @@ if __name__ == "__main__":
     ratio = float(input("Enter gear ratio (output/input, e.g., 2): "))
     overlap = float(input("Enter gear overlap (e.g., 1.0): "))
 
-    animateGears(
+    gears, revolutions = animateGears(
         inputGearArray,
         outputGearArray,
         ratio,
         overlap
     )
+    showAnimation(root, gears, revolutions=revolutions)
@@ -11,13 +11,31 @@ import tkinter as tk
 from tkinter import filedialog, messagebox, ttk
 from PIL import Image, ImageTk
 import numpy as np
-import math
 import os
+import queue
+import threading
+import time
+import gear_profile
+from gear_analysis import autoOverlap
+from gear_cache import GearCache, jobParams
+from gear_engine import (autoSteps, drawCrossbar, getInputCoords, iterProgressive, iterSweep,
+                         makeGear, newCanvas, outputCleanup, outputGearSize, parseRatio,
+                         parseSteps, readGearImage, writeOutputGear)
 
 # Default parameters
 gearRatio = 2
 gearOverlap = 1.0
-computationSteps = 1000
+computationSteps = 1000  # or "auto" to pick them from the drawing's size
+computationEngine = "raster"  # 'swept' carves whole moves between steps: fewer steps, same edges
+inputMode = "pixels"    # 'pixels', 'boundary' or 'outline', see gear_engine.INPUT_MODES
+blackThreshold = 0      # gray levels <= this are black; raise (e.g. 127) for anti-aliased drawings
+maxInputSize = None     # downscale input images larger than this many pixels
+pollInterval = 50       # ms between progress updates while running (20 fps)
+progressivePreview = True  # live coarse-to-fine preview of the output gear on the parameter page
+previewDelay = 300      # ms after the last keystroke before the preview restarts
+targetClearance = 2.0   # widest gap (input pixels) the "Auto" overlap search accepts
+profileTrace = None     # e.g. "pygear_trace.json": write a stage timing trace of each Run
+chromeTrace = False     # write profileTrace in Chrome trace format (chrome://tracing)
 
 # =======================
 # Gear math functions
@@ -29,98 +47,7 @@ def loadGearImage():
     )
     if not filename:
         return None
-    img = Image.open(filename).convert('L')
-    img.load()
-    data = np.asarray(img)
-    array2d = np.array([[np.median(j) if isinstance(j,(list,np.ndarray)) else j for j in i] for i in data])
-    return array2d, img
-
-def getBlackPixels(image, offset):
-    rows = len(image)
-    cols = len(image[0])
-    size = max(rows, cols)
-    scale = 2./size
-    coords = []
-    for row in range(rows):
-        for col in range(cols):
-            if image[row][col] == 0:
-                x = scale*(col - (cols-1)/2.) + offset[0]
-                y = scale*(row - (rows-1)/2.) + offset[1]
-                coords.append((x, y))
-    return coords, size
-
-def rotatePts(points, axis, theta):
-    return [(((x - axis[0])*math.cos(theta) - (y - axis[1])*math.sin(theta)) + axis[0],
-             ((x - axis[0])*math.sin(theta) + (y - axis[1])*math.cos(theta)) + axis[1])
-            for (x,y) in points]
-
-def outputGearImage(image, coords, size, ratio):
-    newImage = image
-    for (x,y) in coords:
-        row = int((y+ratio)*size/(2*ratio))
-        col = int((x+ratio)*size/(2*ratio))
-        try:
-            newImage[row][col] = 255.0
-        except:
-            pass
-    return newImage
-
-def dist(x, y):
-    return math.sqrt(x*x + y*y)
-
-def outputCleanup(image):
-    newImage = image
-    size = len(image)
-    radius = size/2.
-    for row in range(size):
-        for col in range(size):
-            if dist(row-radius, col-radius) >= radius-.5:
-                newImage[row][col] = 255.0
-    markRadius = max(2., size/200.)
-    for i in range(50):
-        theta = i*2*math.pi/50
-        x = int(round(radius + markRadius*math.cos(theta)))
-        y = int(round(radius + markRadius*math.sin(theta)))
-        newImage[y, x] = 255.0
-    return newImage
-
-def writeOutputGear(gear, filename):
-    img = Image.fromarray(gear)
-    img = img.convert('RGB')
-    img.save(filename)
-
-# =======================
-# Correct Crossbar Function
-# =======================
-def drawCrossbar(distance):
-    distance = int(distance) # ensure integer
-    '''Draws the image of the crossbar that holds the two gear axles'''
-    # Size of the image:
-    height = int(round(distance/6.))
-    width = int(np.ceil(distance*7./6))
-    # Coordinates of the axle holes' centers:
-    radius = height/2. - 0.5
-    holeOne = (radius, radius)
-    holeTwo = (distance + radius, radius)
-    # Initialize image as all white
-    crossbarImage = 255.0 * np.ones((height, width))
-    # Draw main horizontal bar (top and bottom rows)
-    crossbarImage[(0, height-1), int(np.ceil(holeOne[0])):int(np.floor(holeTwo[0])+1)] = 0.0
-    # Draw rounded ends along the sides
-    for i in range(distance):
-        theta = np.pi*i/distance - np.pi/2
-        rows = (int(round(holeOne[1] - radius*np.sin(theta))), int(round(holeTwo[1] + radius*np.sin(theta))))
-        cols = (int(round(holeOne[0] - radius*np.cos(theta))), int(round(holeTwo[0] + radius*np.cos(theta))))
-        crossbarImage[rows, cols] = 0.0
-    # Draw axle holes
-    markRadius = max(2., distance/200.) # hole radius
-    for i in range(50):
-        theta = i*2*np.pi/50
-        x = int(round(holeOne[0] + markRadius*np.cos(theta)))
-        y = int(round(holeOne[1] + markRadius*np.sin(theta)))
-        crossbarImage[y, x] = 0.0
-        crossbarImage[y, x+distance] = 0.0
-    return crossbarImage
+    return readGearImage(filename, blackThreshold, maxInputSize)
 
 # =======================
 # GUI
@@ -146,6 +73,24 @@ class PygearGUI(tk.Tk):
         self.progress_label = None
         self.progress_bar = None
 
+        self.gearCache = GearCache()
+        self.cacheKey = None
+
+        self.partial_label = None
+        self.progressQueue = None
+        self.cancelEvent = None
+        self.computeStart = None
+
+        self.preview_label = None
+        self.preview_status = None
+        self.preview_tk_image = None
+        self.previewQueue = None
+        self.previewCancel = None
+        self.previewAfterId = None
+
+        self.autoOverlapButton = None
+        self.autoOverlapQueue = None
+
         self.showMainPage()
 
     # ---------------- Main Page ----------------
@@ -193,17 +138,31 @@ class PygearGUI(tk.Tk):
         self.showGearPage()
 
     # ---------------- Gear Parameter Page ----------------
-    def showGearPage(self):
+    def showGearPage(self, preview=True):
+        '''Parameter page. preview=False leaves the output preview stopped
+        until a parameter is edited (after a cancelled Run).'''
         for widget in self.winfo_children():
             widget.destroy()
 
-        max_size = 500
+        max_size = 300 if progressivePreview else 500
         w, h = self.inputGearImage.size
         scale = min(max_size/w, max_size/h, 1.0)
         new_w, new_h = int(w*scale), int(h*scale)
         img_resized = self.inputGearImage.resize((new_w, new_h))
         self.tk_image = ImageTk.PhotoImage(img_resized)
-        tk.Label(self, image=self.tk_image).pack(pady=10)
+        image_frame = tk.Frame(self)
+        image_frame.pack(pady=10)
+        tk.Label(image_frame, image=self.tk_image).pack(side='left', padx=10)
+
+        # Output gear preview, refined in the background as parameters change
+        if progressivePreview:
+            preview_frame = tk.Frame(image_frame)
+            preview_frame.pack(side='left', padx=10)
+            self.preview_label = tk.Label(preview_frame)
+            self.preview_label.pack()
+            self.preview_status = tk.Label(preview_frame, text="", font=("Arial", 9), fg="gray")
+            self.preview_status.pack()
+            tk.Button(preview_frame, text="Stop Preview", font=("Arial", 9), command=self.stopPreview).pack()
 
         param_frame = tk.Frame(self)
         param_frame.pack(pady=10)
@@ -216,13 +175,14 @@ class PygearGUI(tk.Tk):
         gear_ratio_box = tk.Frame(param_frame, bd=2, relief="solid", bg=box_bg, padx=2, pady=2)
         gear_ratio_box.grid(row=0, column=1, padx=5, pady=5)
         self.gearRatioEntry = tk.Entry(gear_ratio_box, width=10, bg="white", relief="flat")
-        self.gearRatioEntry.insert(0, str(gearRatio))
+        self.gearRatioEntry.insert(0, str(gearRatio if self.ratio is None else self.ratio))
         self.gearRatioEntry.pack()
         tk.Label(param_frame, text=(
             "Determines the relative size between input (driving) and output (driven) gear.\n"
             "1 = both gears are the same size.\n"
             "2 = generated gear (driven output gear) is twice as large as the input gear.\n"
-            "Higher ratio = larger output gear, lower ratio = smaller output gear."
+            "Higher ratio = larger output gear, lower ratio = smaller output gear.\n"
+            "Fractions such as 3/2 or 1.5 are allowed."
         ), font=("Arial", 9), fg="gray", justify="left").grid(row=0, column=2, sticky="w", padx=5)
 
         # ---- Gear Overlap ----
@@ -230,13 +190,17 @@ class PygearGUI(tk.Tk):
         gear_overlap_box = tk.Frame(param_frame, bd=2, relief="solid", bg=box_bg, padx=2, pady=2)
         gear_overlap_box.grid(row=1, column=1, padx=5, pady=5)
         self.gearOverlapEntry = tk.Entry(gear_overlap_box, width=10, bg="white", relief="flat")
-        self.gearOverlapEntry.insert(0, str(gearOverlap))
-        self.gearOverlapEntry.pack()
+        self.gearOverlapEntry.insert(0, str(gearOverlap if self.overlap is None else self.overlap))
+        self.gearOverlapEntry.pack(side="left")
+        self.autoOverlapButton = tk.Button(gear_overlap_box, text="Auto", font=("Arial", 9),
+                                           command=self.autoGearOverlap)
+        self.autoOverlapButton.pack(side="left", padx=2)
         tk.Label(param_frame, text=(
             "Controls how closely the gears mesh.\n"
             "Higher values bring gears closer together.\n"
             "Lower values move them apart.\n"
-            "Adjust to ensure gears fit without gaps or collisions."
+            "Adjust to ensure gears fit without gaps or collisions.\n"
+            "Auto picks the smallest overlap that leaves no gap wider than %g pixels." % targetClearance
         ), font=("Arial", 9), fg="gray", justify="left").grid(row=1, column=2, sticky="w", padx=5)
 
         # ---- Computation Steps ----
@@ -244,73 +208,298 @@ class PygearGUI(tk.Tk):
         computation_steps_box = tk.Frame(param_frame, bd=2, relief="solid", bg=box_bg, padx=2, pady=2)
         computation_steps_box.grid(row=2, column=1, padx=5, pady=5)
         self.computationStepsEntry = tk.Entry(computation_steps_box, width=10, bg="white", relief="flat")
-        self.computationStepsEntry.insert(0, str(computationSteps))
+        self.computationStepsEntry.insert(0, str(computationSteps if self.steps is None else self.steps))
         self.computationStepsEntry.pack()
         tk.Label(param_frame, text=(
             "Number of steps to compute the gear rotation.\n"
             "Higher numbers give smoother, more accurate output.\n"
-            "Lower numbers run faster but may be less precise."
+            "Lower numbers run faster but may be less precise.\n"
+            "\"auto\" picks them from the drawing's size."
         ), font=("Arial", 9), fg="gray", justify="left").grid(row=2, column=2, sticky="w", padx=5)
 
         tk.Button(self, text="Run", font=("Arial", 14), command=self.showRunningMessage).pack(pady=20)
 
+        if progressivePreview:
+            for entry in (self.gearRatioEntry, self.gearOverlapEntry, self.computationStepsEntry):
+                entry.bind("<KeyRelease>", self.schedulePreview)
+            if preview:
+                self.startPreview()
+            else:
+                self.preview_status.config(text="Preview stopped (edit a parameter to restart)")
+
+    def autoGearOverlap(self):
+        '''Starts the gear_analysis.autoOverlap search on a worker thread;
+        pollAutoOverlap fills in the overlap it finds.'''
+        try:
+            ratio = parseRatio(self.gearRatioEntry.get())
+        except ValueError:
+            messagebox.showerror("Error", "Invalid gear ratio.")
+            return
+        self.autoOverlapButton.config(state="disabled", text="...")
+        self.autoOverlapQueue = queue.Queue()
+        args = (self.inputGearArray, ratio, self.autoOverlapQueue)
+        threading.Thread(target=self.runAutoOverlap, args=args, daemon=True).start()
+        self.after(pollInterval, self.pollAutoOverlap, self.autoOverlapQueue)
+
+    def runAutoOverlap(self, inputGearArray, ratio, autoOverlapQueue):
+        '''Runs the overlap search on a worker thread. Never touches Tk: the
+        result is posted to autoOverlapQueue for pollAutoOverlap.'''
+        try:
+            autoOverlapQueue.put(("done", autoOverlap(inputGearArray, ratio, targetClearance)))
+        except Exception as e:
+            autoOverlapQueue.put(("error", e))
+
+    def pollAutoOverlap(self, autoOverlapQueue):
+        '''Waits for the overlap search, then fills in its result, unless the
+        parameter page has been left since it started.'''
+        if (autoOverlapQueue is not self.autoOverlapQueue
+                or not self.autoOverlapButton.winfo_exists()):
+            return
+        try:
+            message = autoOverlapQueue.get_nowait()
+        except queue.Empty:
+            self.after(pollInterval, self.pollAutoOverlap, autoOverlapQueue)
+            return
+        self.autoOverlapQueue = None
+        self.autoOverlapButton.config(state="normal", text="Auto")
+        if message[0] == "error":
+            messagebox.showerror("Error", f"Auto overlap failed:\n{message[1]}")
+            return
+        result = message[1]
+        self.gearOverlapEntry.delete(0, tk.END)
+        self.gearOverlapEntry.insert(0, "%.3f" % result['overlap'])
+        if result['maxGap'] > targetClearance:
+            messagebox.showwarning("Auto Overlap", (
+                "No overlap keeps the gears within %g pixels of contact.\n"
+                "Widest gap at overlap %.3f: %.1f pixels." % (targetClearance, result['overlap'], result['maxGap'])))
+        else:
+            messagebox.showinfo("Auto Overlap", (
+                "Overlap: %.3f\nWidest gap: %.1f pixels" % (result['overlap'], result['maxGap'])))
+        if progressivePreview:
+            self.schedulePreview()
+
+    # ---------------- Progressive Preview ----------------
+    def schedulePreview(self, event=None):
+        '''Restarts the preview once the user pauses typing.'''
+        if self.previewAfterId is not None:
+            self.after_cancel(self.previewAfterId)
+        self.previewAfterId = self.after(previewDelay, self.startPreview)
+
+    def startPreview(self):
+        self.previewAfterId = None
+        self.stopPreview()
+        try:
+            ratio = parseRatio(self.gearRatioEntry.get())
+            overlap = float(self.gearOverlapEntry.get())
+            steps = parseSteps(self.computationStepsEntry.get())
+        except ValueError:
+            self.preview_status.config(text="Preview: invalid parameters")
+            return
+        if steps is None:
+            # The preview is a raster sweep, whatever computationEngine is
+            steps = autoSteps(self.inputGearArray, "raster")
+        self.previewQueue = queue.Queue()
+        self.previewCancel = threading.Event()
+        args = (self.inputGearArray, ratio, overlap, steps, self.previewQueue, self.previewCancel)
+        threading.Thread(target=self.runPreview, args=args, daemon=True).start()
+        self.after(pollInterval, self.pollPreview, self.previewQueue)
+
+    def stopPreview(self):
+        if self.previewCancel is not None:
+            self.previewCancel.set()
+
+    def runPreview(self, inputGearArray, ratio, overlap, steps, previewQueue, cancelEvent):
+        '''Runs the coarse-to-fine sweep on a worker thread, posting each
+        refinement to previewQueue. The last pass is the full job, so it is
+        cached and a following Run returns at once.'''
+        try:
+            for outputGear, factor, done, levelSteps in iterProgressive(
+                    inputGearArray, ratio, overlap, steps, inputMode):
+                if cancelEvent.is_set():
+                    return
+                previewQueue.put(("progress", outputGear, factor, done, levelSteps))
+            outputGear = outputCleanup(outputGear)
+            params = jobParams(ratio, overlap, steps, "raster", inputMode)
+            inputImageSize = max(np.shape(inputGearArray)[:2])
+            try:
+                self.gearCache.put(self.gearCache.key(inputGearArray, **params), outputGear,
+                                   drawCrossbar(inputImageSize*(ratio+1-overlap)/2), params)
+            except OSError:
+                pass  # caching is best effort
+            previewQueue.put(("done",))
+        except Exception as e:
+            previewQueue.put(("error", e))
+
+    def pollPreview(self, previewQueue):
+        '''Shows the latest refinement at a fixed frame rate, until the preview
+        is replaced, finishes or its page is left.'''
+        if previewQueue is not self.previewQueue or not self.preview_label.winfo_exists():
+            if previewQueue is self.previewQueue:
+                self.stopPreview()
+            return
+        latest = None
+        finished = None
+        while True:
+            try:
+                message = previewQueue.get_nowait()
+            except queue.Empty:
+                break
+            if message[0] == "progress":
+                latest = message
+            else:
+                finished = message
+
+        if latest is not None:
+            _, outputGear, factor, done, levelSteps = latest
+            stride = max(1, -(-len(outputGear) // 300))
+            thumbnail = outputCleanup(outputGear[::stride, ::stride].copy())
+            self.preview_tk_image = ImageTk.PhotoImage(Image.fromarray(thumbnail))
+            self.preview_label.config(image=self.preview_tk_image)
+            self.preview_status.config(
+                text=f"Preview: 1/{factor} resolution, {done}/{levelSteps} steps")
+        if finished is not None:
+            if finished[0] == "done":
+                # Run only finds the preview in the cache with the raster engine
+                self.preview_status.config(text="Preview complete (Run will reuse it)"
+                                           if computationEngine == "raster" else "Preview complete")
+            else:
+                self.preview_status.config(text=f"Preview failed: {finished[1]}")
+            return
+        if self.previewCancel.is_set():
+            self.preview_status.config(text=self.preview_status.cget("text") + " (stopped)")
+            return
+        self.after(pollInterval, self.pollPreview, previewQueue)
+
     # ---------------- Running Page ----------------
     def showRunningMessage(self):
         try:
-            self.ratio = int(self.gearRatioEntry.get())
+            self.ratio = parseRatio(self.gearRatioEntry.get())
             self.overlap = float(self.gearOverlapEntry.get())
-            self.steps = int(self.computationStepsEntry.get())
+            self.steps = parseSteps(self.computationStepsEntry.get())
         except ValueError:
             messagebox.showerror("Error", "Invalid input parameters.")
             return
+        if self.steps is None:
+            self.steps = autoSteps(self.inputGearArray, computationEngine)
+        self.stopPreview()
+        if profileTrace:
+            gear_profile.enable(gear_profile.Profiler("create_gear"))
+
+        # Reuse a gear generated earlier from the same drawing and parameters
+        self.cacheKey = self.gearCache.key(self.inputGearArray,
+                                           **jobParams(self.ratio, self.overlap, self.steps, computationEngine,
+                                                     inputMode))
+        cached = self.gearCache.get(self.cacheKey)
+        if cached is not None:
+            self.outputGear = cached[0]
+            self.showGearPreview()
+            return
 
         for widget in self.winfo_children():
             widget.destroy()
 
-        tk.Label(self, text="Running... please wait a full minute,\nit takes a while to process...", font=("Arial", 16)).pack(pady=20)
+        tk.Label(self, text="Running...", font=("Arial", 16)).pack(pady=20)
         self.progress_label = tk.Label(self, text="Progress: 0%", font=("Arial", 14))
         self.progress_label.pack(pady=5)
 
         self.progress_bar = ttk.Progressbar(self, length=400, mode='determinate')
         self.progress_bar.pack(pady=10)
 
-        self.update()
-        self.after(100, self.runComputationStepwise, 0, None, None)
+        self.partial_label = tk.Label(self)
+        self.partial_label.pack(pady=10)
 
-    # ---------------- Stepwise Computation ----------------
-    def runComputationStepwise(self, step=0, outputGear=None, inputCoords=None):
-        ratio = self.ratio
-        overlap = self.overlap
-        steps = self.steps
-
-        if inputCoords is None:
-            offset = (ratio + 1 - overlap, 0)
-            inputCoords, inputImageSize = getBlackPixels(self.inputGearArray, offset)
-            outputImageSize = inputImageSize * ratio
-            outputGear = np.zeros([outputImageSize, outputImageSize])
-            self.inputCoords = inputCoords
-            self.outputGearSize = outputImageSize
-            self.inputImageSize = inputImageSize
-            self.theta = 2*math.pi / steps
-            self.phi = 2*math.pi / (steps*ratio)
-
-        if step < steps:
-            coords = rotatePts(self.inputCoords, (ratio + 1 - overlap, 0), self.theta*step)
-            addPoints = [c for c in coords if dist(*c) < ratio]
-            for extra in range(ratio):
-                rotateBy = self.phi*step + 2*math.pi*extra/ratio
-                addPointsRot = rotatePts(addPoints, (0,0), rotateBy)
-                outputGear = outputGearImage(outputGear, addPointsRot, self.outputGearSize, ratio)
-
-            percent = int((step+1)/steps*100)
-            self.progress_label.config(text=f"Progress: {percent}%")
+        tk.Button(self, text="Cancel", font=("Arial", 14), command=self.cancelComputation).pack(pady=10)
+
+        self.progressQueue = queue.Queue()
+        self.cancelEvent = threading.Event()
+        self.computeStart = time.perf_counter()
+        args = (self.inputGearArray, self.ratio, self.overlap, self.steps,
+                self.cacheKey, self.progressQueue, self.cancelEvent)
+        threading.Thread(target=self.runComputation, args=args, daemon=True).start()
+        self.after(pollInterval, self.pollComputation)
+
+    # ---------------- Background Computation ----------------
+    def runComputation(self, inputGearArray, ratio, overlap, steps, cacheKey, progressQueue, cancelEvent):
+        '''Runs the sweep on a worker thread. Never touches Tk: everything is
+        posted to progressQueue as (kind, ...) messages for pollComputation.'''
+        try:
+            if computationEngine not in ("raster", "swept"):
+                # No partial bitmaps to show: run the engine in one go
+                outputGear, crossbar = makeGear(inputGearArray, ratio, overlap, steps,
+                                                computationEngine, inputMode)
+            else:
+                offset = (ratio + 1 - overlap, 0)
+                swept = computationEngine == "swept"
+                inputCoords, inputImageSize = getInputCoords(inputGearArray, offset, inputMode,
+                                                             None if swept else steps)
+                outputGear = newCanvas(outputGearSize(inputImageSize, ratio))
+                # Small blocks keep progress updates smooth and cancelling quick
+                with gear_profile.stage("sweep"):
+                    for done in iterSweep(outputGear, inputCoords, ratio, overlap, steps,
+                                          maxBlock=max(1, steps // 100), swept=swept):
+                        if cancelEvent.is_set():
+                            progressQueue.put(("cancelled",))
+                            return
+                        progressQueue.put(("progress", done, outputGear))
+                outputGear = outputCleanup(outputGear)
+                crossbar = drawCrossbar(inputImageSize*(ratio+1-overlap)/2)
+            try:
+                self.gearCache.put(cacheKey, outputGear, crossbar,
+                                   jobParams(ratio, overlap, steps, computationEngine, inputMode))
+            except OSError:
+                pass  # caching is best effort
+            progressQueue.put(("done", outputGear))
+        except Exception as e:
+            progressQueue.put(("error", e))
+
+    def pollComputation(self):
+        '''Drains the worker's messages at a fixed frame rate and updates the
+        progress bar, ETA and partial preview with the latest state.'''
+        latest = None
+        while True:
+            try:
+                message = self.progressQueue.get_nowait()
+            except queue.Empty:
+                break
+            if message[0] == "progress":
+                latest = message
+                continue
+            if message[0] == "done":
+                self.outputGear = message[1]
+                self.showGearPreview()
+            elif message[0] == "cancelled":
+                self.finishProfile()
+                self.showGearPage(preview=False)
+            elif message[0] == "error":
+                self.finishProfile()
+                messagebox.showerror("Error", f"Gear generation failed:\n{message[1]}")
+                self.showGearPage()
+            return
+
+        if latest is not None:
+            _, done, partialGear = latest
+            steps = self.steps
+            elapsed = time.perf_counter() - self.computeStart
+            rate = done / elapsed if elapsed > 0 else 0.0
+            eta = (steps - done) / rate if rate > 0 else 0.0
+            percent = int(done/steps*100)
+            self.progress_label.config(
+                text=f"Progress: {percent}%  ({rate:.0f} steps/s, about {eta:.0f}s left)")
             self.progress_bar['value'] = percent
-            self.update()
-            self.after(1, self.runComputationStepwise, step+1, outputGear, self.inputCoords)
-        else:
-            outputGear = outputCleanup(outputGear)
-            self.outputGear = outputGear
-            self.showGearPreview()
+            # Strided thumbnail of the bitmap being carved
+            stride = max(1, len(partialGear) // 300)
+            self.tk_image = ImageTk.PhotoImage(Image.fromarray(partialGear[::stride, ::stride]))
+            self.partial_label.config(image=self.tk_image)
+        self.after(pollInterval, self.pollComputation)
+
+    def cancelComputation(self):
+        self.cancelEvent.set()
+
+    def finishProfile(self):
+        '''Writes the trace of the Run being profiled, if any (see profileTrace).'''
+        profiler = gear_profile.disable()
+        if profiler is not None:
+            profiler.write(profileTrace, chromeTrace)
 
     # ---------------- Gear Preview + Save ----------------
     def showGearPreview(self):
@@ -357,6 +546,7 @@ class PygearGUI(tk.Tk):
         outFile = filedialog.asksaveasfilename(defaultextension=".png", initialfile="crossbar.png")
         if outFile:
             writeOutputGear(self.crossbar, outFile)
+        self.finishProfile()
         self.showFinalPreviewPage()
 
     # ---------------- Final Preview Page ----------------
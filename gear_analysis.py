@@ -0,0 +1,402 @@
+# -*- coding: utf-8 -*-
+"""
+pygear mesh analysis
+Checks how an input gear and its generated gear mesh over a full rotation,
+without rendering anything.
+
+autoOverlap is built on the envelope engine in gear_engine: the input gear is
+described as a polar outline and the generated gear as a polar profile
+(radius per angle), so each check is a few array operations at low
+resolution. meshReport checks a finished pair of gear bitmaps pixel by pixel
+and can be run from the command line to gate production runs:
+
+    python gear_analysis.py input.png output_gear.png --ratio 2 --overlap 1.0 \
+        --report mesh.csv
+
+It exits with status 1 when the gears interfere or leave too large a gap.
+"""
+
+import argparse
+import csv
+import json
+import math
+import os
+import sys
+
+import numpy as np
+
+import gear_engine
+import gear_profile
+
+# =======================
+# Mesh gaps
+# =======================
+
+class SweptOutline:
+    '''Polar input outline rotated about its own axle for every sweep step.
+    The rotated offsets do not depend on the overlap (which only moves the
+    axle), so they are computed once and reused for every candidate overlap.'''
+
+    def __init__(self, inputRadius, steps):
+        self.steps = steps
+        self.bins = len(inputRadius)
+        alpha = (np.arange(self.bins) + 0.5)*(2*math.pi/self.bins)
+        theta = (2*math.pi/steps)*np.arange(steps)[:, None]
+        self.dx = inputRadius*np.cos(alpha + theta)
+        self.dy = inputRadius*np.sin(alpha + theta)
+
+    def polar(self, ratio, overlap):
+        '''Radius and angle of every rotated outline point (steps x bins) in the
+        output gear's frame, for one turn of the input gear.'''
+        x = self.dx + float(ratio + 1 - overlap)
+        y = self.dy
+        phi = 2*math.pi/(self.steps*float(ratio))
+        angle = np.arctan2(y, x) + phi*np.arange(self.steps)[:, None]
+        return np.sqrt(x*x + y*y), angle
+
+def meshGaps(swept, ratio, overlap, bins=None):
+    '''Generates the output gear at overlap (as an envelope profile of bins
+    angles) and measures, at each of steps*ratioTurns angles of a full
+    rotation period (see gear_engine.ratioTurns), the radial gap between the
+    input gear and the generated gear. The gap is zero where the gears
+    touch; a positive gap means no contact (backlash), a negative one
+    interference. Returns the gaps, in the input gear's scaled units, and
+    the output profile.'''
+    bins = bins or swept.bins
+    turns = gear_engine.ratioTurns(ratio)
+    r, angle = swept.polar(ratio, overlap)
+    inside = r < ratio
+    profile = np.full(bins, float(ratio))
+    gaps = np.empty((turns, swept.steps))
+    for extra in range(turns):
+        np.minimum.at(profile, gear_engine.angleBins(angle[inside] + 2*math.pi*extra/turns, bins),
+                      r[inside])
+    for extra in range(turns):
+        radial = r - profile[gear_engine.angleBins(angle + 2*math.pi*extra/turns, bins)]
+        gaps[extra] = radial.min(axis=1)
+    return gaps.ravel(), profile
+
+# =======================
+# Overlap optimizer
+# =======================
+
+# Overlaps autoOverlap checks, evenly spaced from low to high, before
+# refining the first one within the target clearance.
+OVERLAP_SCAN_POINTS = 11
+
+@gear_profile.profiled('autoOverlap')
+def autoOverlap(image, ratio, targetClearance=2.0, low=0.0, high=1.0, steps=720,
+                bins=None, outlineBins=1024, maxSize=256, tolerance=0.002,
+                scanPoints=OVERLAP_SCAN_POINTS):
+    '''Searches gearOverlap for the smallest value at which the input gear and
+    the gear generated from it stay within targetClearance (in input pixels) of
+    contact at every angle of a full rotation, i.e. no gaps wider than that.
+    Runs at low resolution: the input is shrunk to at most maxSize pixels and
+    swept at steps steps as a polar outline of outlineBins angles; the swept
+    outline is shared by all candidates. The generated gear's profile has bins
+    angles, by default about one per pixel of its rim. Gaps below the
+    downscale factor (in pixels) are within the check's resolution.
+    The widest gap is not monotonic in the overlap: it shrinks as the axles
+    move closer, until the teeth cut too deep and gaps open up again. So
+    scanPoints evenly spaced overlaps are checked first, and only the step
+    where the gap first drops to targetClearance is refined by bisection.
+    If no overlap gets there, the one with the narrowest gap is returned.
+    Returns a dict with the chosen overlap, the largest gap found at it (in
+    input pixels) and the number of candidates evaluated.'''
+    image = np.asarray(image)
+    size = max(image.shape[:2])
+    factor = 1
+    while size // (factor*2) >= maxSize:
+        factor *= 2
+    if bins is None:
+        rim = 2*math.pi*ratio*(size/factor)/2.
+        bins = max(1024, 1 << int(math.ceil(math.log2(rim))))
+    inputRadius, _ = gear_engine.getPolarOutline(gear_engine.downscaleGear(image, factor),
+                                                 outlineBins)
+    swept = SweptOutline(inputRadius, steps)
+    toPixels = size/2.
+    evaluated = {}
+
+    def evaluate(overlap):
+        if overlap not in evaluated:
+            gaps, _ = meshGaps(swept, ratio, overlap, bins)
+            evaluated[overlap] = float(gaps.max()*toPixels)
+        return evaluated[overlap]
+
+    grid = [float(overlap) for overlap in np.linspace(low, high, max(scanPoints, 2))]
+    within = [overlap for overlap in grid if evaluate(overlap) <= targetClearance]
+    if not within:
+        best = min(grid, key=evaluate)
+    elif within[0] == grid[0]:
+        best = grid[0]
+    else:
+        # Bracket of the first crossing: too wide a gap at low, within at high
+        high = within[0]
+        low = grid[grid.index(high) - 1]
+        while high - low > tolerance:
+            middle = (low + high)/2.
+            if evaluate(middle) <= targetClearance:
+                high = middle
+            else:
+                low = middle
+        best = high
+    return {'overlap': best, 'maxGap': evaluate(best), 'evaluations': len(evaluated)}
+
+# =======================
+# Bitmap mesh check
+# =======================
+
+# Largest gap, in pixels, the distance transform measures; wider gaps are
+# reported as this value.
+DEFAULT_MAX_DISTANCE = 32
+
+# Pass/fail limits of meshReport: interference area (pixels) and gap
+# (pixels) allowed at any angle. A pixel or two of overlap is rasterization
+# noise where the teeth touch.
+DEFAULT_MAX_INTERFERENCE = 4
+DEFAULT_MAX_BACKLASH = 3.0
+
+def labelRuns(mask):
+    '''Connected regions (4-connected) of a boolean mask, found on its
+    horizontal runs of True pixels. Returns the runs as [start, end) keys
+    row*(width + 1) + col, sorted, and the region label of each run.'''
+    height, width = mask.shape
+    stride = width + 1
+    edges = np.diff(np.pad(mask, ((0, 0), (1, 1))).astype(np.int8), axis=1)
+    startRow, startCol = np.nonzero(edges == 1)
+    _, endCol = np.nonzero(edges == -1)
+    starts = startRow*stride + startCol
+    ends = startRow*stride + endCol
+    # A run touches the runs above and below whose column spans overlap it
+    labels = np.full(len(starts), -1)
+    region = 0
+    for seed in range(len(starts)):
+        if labels[seed] >= 0:
+            continue
+        labels[seed] = region
+        pending = [seed]
+        while pending:
+            run = pending.pop()
+            for row in (startRow[run] - 1, startRow[run] + 1):
+                if not 0 <= row < height:
+                    continue
+                first = np.searchsorted(ends, row*stride + startCol[run], 'right')
+                last = np.searchsorted(starts, row*stride + endCol[run], 'left')
+                for neighbour in range(first, last):
+                    if labels[neighbour] < 0:
+                        labels[neighbour] = region
+                        pending.append(neighbour)
+        region += 1
+    return starts, ends, labels
+
+def paintRuns(shape, starts, ends):
+    '''Boolean mask of the given shape with the runs of labelRuns set.'''
+    height, width = shape
+    marks = np.zeros(height*(width + 1) + 1, dtype=np.int32)
+    np.add.at(marks, starts, 1)
+    np.add.at(marks, ends, -1)
+    return np.cumsum(marks)[:-1].reshape(height, width + 1)[:, :width] > 0
+
+def solidMask(image):
+    '''Black pixels of a gear drawing plus everything they enclose, so an
+    outline drawing counts as the solid gear it describes: every pixel except
+    the white ones 4-connected to the image border.'''
+    black = np.asarray(image) == 0
+    # A white frame joins all of the outside into one region, the first run's
+    white = np.pad(~black, 1, constant_values=True)
+    starts, ends, labels = labelRuns(white)
+    outside = labels == labels[0]
+    return ~paintRuns(white.shape, starts[outside], ends[outside])[1:-1, 1:-1]
+
+def largestRegion(mask):
+    '''Only the largest connected region of a boolean mask, e.g. a generated
+    gear without the stray specks a coarse sweep leaves around it.'''
+    mask = np.asarray(mask, dtype=bool)
+    starts, ends, labels = labelRuns(mask)
+    if len(labels) == 0:
+        return mask
+    largest = np.argmax(np.bincount(labels, weights=ends - starts))
+    keep = labels == largest
+    return paintRuns(mask.shape, starts[keep], ends[keep])
+
+def distanceTransform(mask, maxDistance=DEFAULT_MAX_DISTANCE):
+    '''Euclidean distance from every pixel to the nearest True pixel of mask,
+    exact up to maxDistance and clipped to it beyond. Separable: the distance
+    along each column first, then the nearest column within maxDistance.'''
+    mask = np.asarray(mask, dtype=bool)
+    rows, cols = mask.shape
+    far = float(maxDistance)**2
+    index = np.arange(rows, dtype=np.float32)[:, None]
+    above = np.where(mask, index, -np.inf)
+    np.maximum.accumulate(above, axis=0, out=above)
+    below = np.where(mask, index, np.inf)
+    below = np.minimum.accumulate(below[::-1], axis=0)[::-1]
+    column = np.minimum(np.minimum(index - above, below - index)**2, far).astype(np.float32)
+    squared = column.copy()
+    for shift in range(1, int(maxDistance) + 1):
+        offset = float(shift*shift)
+        if offset >= far:
+            break
+        np.minimum(squared[:, shift:], column[:, :-shift] + offset, out=squared[:, shift:])
+        np.minimum(squared[:, :-shift], column[:, shift:] + offset, out=squared[:, :-shift])
+    return np.sqrt(squared)
+
+@gear_profile.profiled('meshReport')
+def meshReport(inputGearArray, outputGearArray, ratio, overlap, steps=720,
+               maxInterference=DEFAULT_MAX_INTERFERENCE, maxBacklash=DEFAULT_MAX_BACKLASH,
+               maxDistance=DEFAULT_MAX_DISTANCE, keepLargest=True,
+               memoryBudget=gear_engine.DEFAULT_MEMORY_BUDGET):
+    '''Turns a pair of gear bitmaps through one full rotation period, steps
+    angles (one turn of the output gear, or q turns for a p/q ratio; see
+    gear_engine.ratioTurns), and measures at each angle the overlap area of
+    the two gears (interference, in pixels) and the smallest distance between
+    them (gap, in pixels, 0 where they touch). The input gear's pixels are
+    moved into the output gear's frame the way the sweep moves them, so no
+    frames are rendered; only the input pixels that can ever reach the output
+    gear are checked. keepLargest drops everything but the output gear's
+    largest region (stray specks, as animate_gears does). Returns a dict with
+    the per-angle 'angle' (degrees of the output gear), 'interference' and
+    'gap' arrays and a 'summary' dict whose 'passed' says whether every angle
+    is within maxInterference and maxBacklash.'''
+    period = gear_engine.ratioTurns(ratio)
+    ratioLabel = ratio if isinstance(ratio, int) else gear_engine.formatRatio(ratio)
+    ratio = float(ratio)
+    solid = solidMask(inputGearArray)
+    solidImage = np.where(solid, 0, 255).astype(np.uint8)
+    outputGear = np.asarray(outputGearArray) == 0
+    if keepLargest:
+        outputGear = largestRegion(outputGear)
+    outputSize = len(outputGear)
+    axle = ratio + 1 - overlap
+    gapToOutput = distanceTransform(outputGear, maxDistance)
+
+    # Input pixels nearer the input axle than this never reach the output
+    # gear's farthest pixel
+    rowIdx, colIdx = np.nonzero(outputGear)
+    center = (outputSize - 1)/2.
+    outputRadius = ratio
+    if len(rowIdx):
+        outputRadius = (np.hypot(rowIdx - center, colIdx - center).max() + 1)*2*ratio/outputSize
+    reach = axle - outputRadius
+    points, inputSize = gear_engine.getInputCoords(solidImage, (0, 0), 'pixels')
+    points = points[np.hypot(points.x, points.y) >= reach]
+    edge, _ = gear_engine.getInputCoords(solidImage, (0, 0), 'boundary')
+    edge = edge[np.hypot(edge.x, edge.y) >= reach - 2.*maxDistance/inputSize]
+    # The lookups run in float32; convert once, not per block
+    points = (points.x.astype(np.float32), points.y.astype(np.float32))
+    edge = (edge.x.astype(np.float32), edge.y.astype(np.float32))
+
+    def lookup(coords, alpha, table):
+        # Input gear turned by alpha about its axle, seen from the output gear
+        # turned alpha/ratio the other way (as in gear_engine.sweepSteps), in
+        # output pixels; both turns and the axle offset folded into one affine
+        # map. table has a one-pixel border standing in for everything outside.
+        scale = outputSize/(2.*ratio)
+        turn = alpha + alpha/ratio
+        cosT, sinT = scale*np.cos(turn), scale*np.sin(turn)
+        shiftX = (axle*np.cos(alpha/ratio) + ratio)*scale + 1
+        shiftY = (axle*np.sin(alpha/ratio) + ratio)*scale + 1
+        x, y = coords
+        col = np.clip((x*cosT.astype(np.float32) - y*sinT.astype(np.float32)
+                       + shiftX.astype(np.float32)), 0, outputSize + 1).astype(np.intp)
+        row = np.clip((x*sinT.astype(np.float32) + y*cosT.astype(np.float32)
+                       + shiftY.astype(np.float32)), 0, outputSize + 1).astype(np.intp)
+        return table.ravel()[row*(outputSize + 2) + col]
+
+    insideTable = np.pad(outputGear, 1, constant_values=False)
+    gapTable = np.pad(gapToOutput, 1, constant_values=maxDistance)
+    alphas = 2*math.pi*period/steps*np.arange(steps)
+    interference = np.zeros(steps, dtype=np.int64)
+    gap = np.full(steps, float(maxDistance))
+    block = gear_engine.stepsPerBlock(max(len(points[0]), len(edge[0])), memoryBudget)
+    for start in range(0, steps, block):
+        alpha = alphas[start:start + block, None]
+        if len(points[0]):
+            interference[start:start + block] = lookup(points, alpha, insideTable).sum(axis=1)
+        if len(edge[0]):
+            gap[start:start + block] = lookup(edge, alpha, gapTable).min(axis=1)
+    # Input pixels scale to output pixels by this factor
+    pixelScale = outputSize/float(ratio*inputSize)
+    gap = np.where(interference > 0, 0., gap)
+    interference = interference*pixelScale**2
+    angle = np.degrees(alphas/ratio)
+    worstOverlap = int(np.argmax(interference))
+    worstGap = int(np.argmax(gap))
+    summary = {
+        'ratio': ratioLabel, 'overlap': overlap, 'steps': steps,
+        'maxInterference': float(interference[worstOverlap]),
+        'maxInterferenceAngle': float(angle[worstOverlap]),
+        'maxGap': float(gap[worstGap]),
+        'maxGapAngle': float(angle[worstGap]),
+        'meanGap': float(gap.mean()),
+        'contactFraction': float(np.mean(gap <= 1.)),
+        'interferenceLimit': maxInterference,
+        'backlashLimit': maxBacklash,
+    }
+    summary['passed'] = bool(summary['maxInterference'] <= maxInterference
+                             and summary['maxGap'] <= maxBacklash)
+    return {'angle': angle, 'interference': interference, 'gap': gap, 'summary': summary}
+
+# =======================
+# Reports
+# =======================
+
+def writeMeshReport(report, filename):
+    '''Writes a meshReport as JSON (summary plus per-angle lists) or, for a
+    .csv filename, as one row per angle with the summary in comment lines.'''
+    if os.path.splitext(filename)[1].lower() == '.csv':
+        with open(filename, 'w', newline='') as fp:
+            for key, value in report['summary'].items():
+                fp.write('# {}: {}\n'.format(key, value))
+            writer = csv.writer(fp)
+            writer.writerow(['angle', 'interference', 'gap'])
+            for row in zip(report['angle'], report['interference'], report['gap']):
+                writer.writerow(['{:.4f}'.format(value) for value in row])
+    else:
+        with open(filename, 'w') as fp:
+            json.dump({'summary': report['summary'],
+                       'angle': report['angle'].tolist(),
+                       'interference': report['interference'].tolist(),
+                       'gap': report['gap'].tolist()}, fp, indent=1)
+    return filename
+
+def formatSummary(summary):
+    return ('{}: max interference {:.1f} px at {:.1f} deg, max gap {:.1f} px at {:.1f} deg, '
+            'in contact {:.0%} of the turn').format(
+                'PASS' if summary['passed'] else 'FAIL',
+                summary['maxInterference'], summary['maxInterferenceAngle'],
+                summary['maxGap'], summary['maxGapAngle'], summary['contactFraction'])
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Check that an input gear and its generated gear mesh over a full turn.')
+    parser.add_argument('input', help='input (driving) gear PNG')
+    parser.add_argument('output', help='generated (driven) gear PNG')
+    parser.add_argument('-r', '--ratio', type=gear_engine.parseRatio, default=2,
+                        help='gear ratio, e.g. 2 or 3/2 (default: 2)')
+    parser.add_argument('--overlap', type=float, default=1.0,
+                        help='gear overlap the gear was generated with (default: 1.0)')
+    parser.add_argument('-s', '--steps', type=int, default=720,
+                        help='angles checked over one rotation period: one turn of the '
+                             'output gear, q turns for a p/q ratio (default: 720)')
+    parser.add_argument('--max-interference', type=float, default=DEFAULT_MAX_INTERFERENCE,
+                        help='overlap area, in pixels, allowed at any angle (default: %(default)s)')
+    parser.add_argument('--max-backlash', type=float, default=DEFAULT_MAX_BACKLASH,
+                        help='gap, in pixels, allowed at any angle (default: %(default)s)')
+    parser.add_argument('--threshold', type=int, default=gear_engine.DEFAULT_BLACK_THRESHOLD,
+                        help='gray level at or below which input pixels are black '
+                             '(default: %(default)s)')
+    parser.add_argument('--report', default=None,
+                        help='write the per-angle report to this .json or .csv file')
+    args = parser.parse_args(argv)
+    inputGear, _ = gear_engine.readGearImage(args.input, args.threshold)
+    outputGear, _ = gear_engine.readGearImage(args.output)
+    report = meshReport(inputGear, outputGear, args.ratio, args.overlap, args.steps,
+                        args.max_interference, args.max_backlash)
+    if args.report:
+        writeMeshReport(report, args.report)
+    print(formatSummary(report['summary']))
+    return 0 if report['summary']['passed'] else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
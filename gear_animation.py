@@ -0,0 +1,281 @@
+# -*- coding: utf-8 -*-
+"""
+pygear animation renderer
+Renders a pair of meshing gears straight to GIF / APNG frames with Pillow,
+without matplotlib.
+
+Both gears are turned into masks once; every frame is then two bitmap
+rotations (Image.rotate) pasted onto a palette image, so full-resolution
+animations of hundreds of frames take seconds. Frames can be rendered by a
+pool of processes and are streamed to the file in order, so long
+multi-turn animations only ever hold a few frames in memory.
+"""
+
+import math
+import os
+import shutil
+import struct
+import subprocess
+import zlib
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from fractions import Fraction
+
+import numpy as np
+from PIL import GifImagePlugin, Image
+
+import gear_profile
+
+DEFAULT_FRAMES = 90
+DEFAULT_FPS = 30
+
+# Frame palette: background, input (driving) gear, output (driven) gear.
+BACKGROUND, INPUT_COLOR, OUTPUT_COLOR = 0, 1, 2
+PALETTE = [255, 255, 255,
+           220, 30, 30,
+           30, 60, 220]
+
+# =======================
+# Gear masks
+# =======================
+
+def gearMask(image, side=None):
+    '''Black pixels of a gear image as a square 'L' mask (255 on the gear)
+    centered like getBlackPixelArray and just large enough to hold the gear
+    at any angle, so it can be rotated about its center without clipping.
+    side rescales the gear image to side pixels first.'''
+    black = np.asarray(image) == 0
+    rows, cols = black.shape[:2]
+    size = max(rows, cols)
+    mask = Image.fromarray(np.where(black, 255, 0).astype(np.uint8))
+    if side is not None and side != size:
+        scale = side/float(size)
+        mask = mask.resize((max(1, int(round(cols*scale))), max(1, int(round(rows*scale)))),
+                           Image.NEAREST)
+        rows, cols = mask.height, mask.width
+    # Farthest gear pixel from the image center
+    rowIdx, colIdx = np.nonzero(np.asarray(mask))
+    radius = 0.
+    if len(rowIdx):
+        radius = np.sqrt(((rowIdx - (rows - 1)/2.)**2 + (colIdx - (cols - 1)/2.)**2).max())
+    square = int(math.ceil(2*radius)) + 2
+    square += (square - cols) % 2
+    padded = Image.new('L', (square, square), 0)
+    padded.paste(mask, ((square - cols)//2, (square - rows)//2))
+    return padded
+
+# =======================
+# Frames
+# =======================
+
+class GearAnimation:
+    '''Frames of an input gear driving its output gear, in image orientation.
+    The output gear sits on the left and the input gear ratio + 1 - overlap
+    input radii to its right, both drawn at the input image's resolution
+    (times scale); the frame is just large enough for both at any angle.
+    Frame i of n turns the output gear by i/n of revolutions full turns, and
+    the input gear ratio times as far the other way.'''
+
+    def __init__(self, inputGearArray, outputGearArray, ratio, overlap, scale=1.0):
+        self.ratio = ratio
+        self.overlap = overlap
+        inputSize = max(np.asarray(inputGearArray).shape[:2])
+        # Pixels per unit of the sweep's coordinates (the input gear radius)
+        self.unit = inputSize*scale/2.
+        self.inputMask = gearMask(inputGearArray, int(round(inputSize*scale)))
+        self.outputMask = gearMask(outputGearArray, int(round(2*ratio*self.unit)))
+        self.distance = (ratio + 1 - overlap)*self.unit
+        outputRadius = self.outputMask.width/2.
+        inputRadius = self.inputMask.width/2.
+        half = max(outputRadius, inputRadius)
+        self.width = int(math.ceil(outputRadius + max(self.distance + inputRadius, outputRadius)))
+        self.height = int(math.ceil(2*half))
+        # Frame pixel of the output gear's axle
+        self.center = (outputRadius, half)
+        self.background = Image.new('P', (self.width, self.height), BACKGROUND)
+        self.background.putpalette(PALETTE)
+
+    def _paste(self, frame, mask, axle, degrees, color):
+        rotated = mask.rotate(degrees, resample=Image.NEAREST)
+        corner = (int(round(axle[0] - mask.width/2.)), int(round(axle[1] - mask.height/2.)))
+        frame.paste(color, corner + (corner[0] + mask.width, corner[1] + mask.height), rotated)
+
+    def frame(self, index, frames=DEFAULT_FRAMES, revolutions=1):
+        '''Renders frame index of a frames-long animation of revolutions turns
+        of the output gear as a 'P' image.'''
+        theta = 360.*revolutions*index/frames
+        frame = self.background.copy()
+        # Image.rotate turns counterclockwise on screen; the sweep's angles turn
+        # clockwise in image orientation (y down).
+        self._paste(frame, self.inputMask, (self.center[0] + self.distance, self.center[1]),
+                    theta*self.ratio, INPUT_COLOR)
+        self._paste(frame, self.outputMask, self.center, -theta, OUTPUT_COLOR)
+        return frame
+
+    def frames(self, frames=DEFAULT_FRAMES, revolutions=1):
+        '''Yields every frame of revolutions full turns of the output gear.'''
+        for index in range(frames):
+            yield self.frame(index, frames, revolutions)
+
+def loopRevolutions(ratio, maxTurns=100):
+    '''Smallest number of output gear turns after which both gears are back at
+    their starting angles (the input gear has then turned ratio times as
+    often), so the animation loops seamlessly. 1 for integer ratios.'''
+    return Fraction(ratio).limit_denominator(maxTurns).denominator
+
+# =======================
+# Writers
+# =======================
+
+def animationKind(filename):
+    '''File format written for filename: 'GIF', 'PNG' (APNG) or 'MP4'.'''
+    extension = os.path.splitext(filename)[1].lower()
+    if extension in ('.png', '.apng'):
+        return 'PNG'
+    if extension == '.mp4':
+        return 'MP4'
+    return 'GIF'
+
+def frameDuration(fps):
+    '''Frame duration in milliseconds.'''
+    return int(round(1000./fps))
+
+def encodeFrame(frame, kind, fps=DEFAULT_FPS):
+    '''Encodes one 'P' frame on its own for writeGif, writeApng or writeMp4:
+    GIF image blocks, zlib-compressed PNG scanlines or raw RGB bytes.'''
+    if kind == 'GIF':
+        return b''.join(GifImagePlugin.getdata(frame, duration=frameDuration(fps)))
+    if kind == 'PNG':
+        pixels = np.asarray(frame)
+        # Filter type 0 (none) in front of every scanline
+        rows = np.hstack((np.zeros((len(pixels), 1), np.uint8), pixels))
+        return zlib.compress(rows.tobytes(), 6)
+    return frame.convert('RGB').tobytes()
+
+def writeGif(encoded, background, filename):
+    '''Writes a looping GIF from frames encoded by encodeFrame, one at a
+    time. background supplies the size and palette.'''
+    header, _ = GifImagePlugin.getheader(background.copy(), info={'loop': 0, 'optimize': False})
+    count = 0
+    with open(filename, 'wb') as fp:
+        fp.write(b''.join(header))
+        for data in encoded:
+            fp.write(data)
+            count += 1
+        fp.write(b';')
+    return count
+
+def _pngChunk(fp, kind, data):
+    fp.write(struct.pack('>I', len(data)) + kind + data
+             + struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff))
+
+def writeApng(encoded, background, filename, frames, fps=DEFAULT_FPS):
+    '''Writes a looping animated PNG of frames frames from frames encoded by
+    encodeFrame, one at a time. background supplies the size and palette.'''
+    width, height = background.size
+    delay = struct.pack('>HH', frameDuration(fps), 1000)
+    sequence = 0
+    count = 0
+    with open(filename, 'wb') as fp:
+        fp.write(b'\x89PNG\r\n\x1a\n')
+        _pngChunk(fp, b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 3, 0, 0, 0))
+        _pngChunk(fp, b'acTL', struct.pack('>II', frames, 0))
+        _pngChunk(fp, b'PLTE', bytes(PALETTE))
+        for data in encoded:
+            _pngChunk(fp, b'fcTL', struct.pack('>IIIII', sequence, width, height, 0, 0)
+                      + delay + b'\x00\x00')
+            sequence += 1
+            if count == 0:
+                _pngChunk(fp, b'IDAT', data)
+            else:
+                _pngChunk(fp, b'fdAT', struct.pack('>I', sequence) + data)
+                sequence += 1
+            count += 1
+        _pngChunk(fp, b'IEND', b'')
+    return count
+
+def writeMp4(encoded, size, filename, fps=DEFAULT_FPS):
+    '''Pipes raw RGB frames (see encodeFrame) of the given size to ffmpeg as
+    an H.264 MP4. Returns False (and writes nothing) when ffmpeg is not on
+    the PATH.'''
+    ffmpeg = shutil.which('ffmpeg')
+    if ffmpeg is None:
+        return False
+    command = [ffmpeg, '-y', '-loglevel', 'error', '-f', 'rawvideo', '-pix_fmt', 'rgb24',
+               '-s', '{}x{}'.format(*size), '-r', str(fps), '-i', '-',
+               '-vf', 'pad=ceil(iw/2)*2:ceil(ih/2)*2:color=white',
+               '-pix_fmt', 'yuv420p', filename]
+    process = subprocess.Popen(command, stdin=subprocess.PIPE)
+    try:
+        for data in encoded:
+            process.stdin.write(data)
+    finally:
+        process.stdin.close()
+        process.wait()
+    return process.returncode == 0
+
+# =======================
+# Streaming export
+# =======================
+
+# GearAnimation each worker process renders from, set up once per worker.
+_workerAnimation = None
+
+def _initFrameWorker(animation):
+    global _workerAnimation
+    gear_profile.disable()
+    _workerAnimation = animation
+
+def _renderFrame(index, frames, revolutions, kind, fps):
+    return encodeFrame(_workerAnimation.frame(index, frames, revolutions), kind, fps)
+
+def iterEncodedFrames(animation, frames, revolutions=1, kind='GIF', fps=DEFAULT_FPS,
+                      workers=1, window=None):
+    '''Renders and encodes (see encodeFrame) every frame of the animation,
+    yielding them in order. With workers > 1 (or None for all cores) frames
+    are rendered in a process pool, at most window (default 2 per worker)
+    ahead of the consumer, so memory holds only a few frames at any time.'''
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers <= 1:
+        for index in range(frames):
+            yield encodeFrame(animation.frame(index, frames, revolutions), kind, fps)
+        return
+    window = max(1, window or 2*workers)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_initFrameWorker,
+                             initargs=(animation,)) as pool:
+        pending = deque()
+        for index in range(frames):
+            if len(pending) >= window:
+                yield pending.popleft().result()
+            pending.append(pool.submit(_renderFrame, index, frames, revolutions, kind, fps))
+        while pending:
+            yield pending.popleft().result()
+
+@gear_profile.profiled('animation')
+def renderAnimation(inputGearArray, outputGearArray, ratio, overlap, filename,
+                    frames=DEFAULT_FRAMES, fps=DEFAULT_FPS, scale=1.0, revolutions=1,
+                    workers=1, window=None, maxFrames=None, maxSize=None):
+    '''Renders revolutions full turns of the output gear (revolutions*ratio
+    turns of the input gear) to filename: a GIF, an APNG for .png / .apng or
+    an MP4 (through ffmpeg) for .mp4. Frames are rendered by workers
+    processes and streamed to the file in order (see iterEncodedFrames).
+    maxFrames caps the frame count and maxSize the frame's larger side, in
+    pixels, by lowering scale. Returns the GearAnimation used, or None when
+    an MP4 was asked for and ffmpeg is missing.'''
+    animation = GearAnimation(inputGearArray, outputGearArray, ratio, overlap, scale)
+    # Frame sizes are rounded up, so a step may land a few pixels over
+    while maxSize is not None and max(animation.width, animation.height) > maxSize:
+        scale *= min(0.99, maxSize/float(max(animation.width, animation.height)))
+        animation = GearAnimation(inputGearArray, outputGearArray, ratio, overlap, scale)
+    if maxFrames is not None:
+        frames = min(frames, maxFrames)
+    kind = animationKind(filename)
+    encoded = iterEncodedFrames(animation, frames, revolutions, kind, fps, workers, window)
+    if kind == 'GIF':
+        writeGif(encoded, animation.background, filename)
+    elif kind == 'PNG':
+        writeApng(encoded, animation.background, filename, frames, fps)
+    elif not writeMp4(encoded, animation.background.size, filename, fps):
+        return None
+    return animation
@@ -0,0 +1,296 @@
+# -*- coding: utf-8 -*-
+"""
+pygear benchmarks
+Times the gear generation pipeline, stage by stage, on fixed synthetic input
+gears, so engine changes can be measured instead of guessed at.
+
+Every case is one synthetic gear (drawn procedurally at a given size and
+stroke width, so runs are repeatable on any machine) generated at one ratio
+and step count. Each stage is timed on its own -- load, getBlackPixels (the
+input point extraction), sweep, outputCleanup, drawCrossbar, write and
+animation -- and its peak memory is measured with tracemalloc in a separate
+pass, so tracing does not skew the timings. Results are written as JSON:
+
+    python gear_benchmark.py --sizes 256 1024 4096 --strokes 2 8 --ratios 2 3 \
+        --steps 250 1000 --output bench.json
+
+and can be compared with an earlier run, flagging stages that got slower:
+
+    python gear_benchmark.py --output new.json --compare bench.json
+
+It exits with status 1 when a stage regressed by more than --tolerance.
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+from PIL import Image
+
+import gear_animation
+import gear_engine
+
+DEFAULT_SIZES = (256, 1024, 4096)
+DEFAULT_STROKES = (2, 8)
+DEFAULT_RATIOS = (2,)
+DEFAULT_STEPS = (250, 1000)
+# Teeth on every synthetic gear.
+DEFAULT_TEETH = 12
+# Frames rendered by the animation stage, and its largest frame side.
+DEFAULT_ANIMATION_FRAMES = 30
+DEFAULT_ANIMATION_SIZE = 512
+# Slowdown, as a fraction, above which --compare reports a stage as regressed.
+DEFAULT_TOLERANCE = 0.10
+# Stages must also be this many seconds slower, so timer noise on fast
+# stages is not reported.
+DEFAULT_MIN_SECONDS = 0.01
+
+STAGES = ('load', 'getBlackPixels', 'sweep', 'outputCleanup', 'drawCrossbar', 'write',
+          'animation')
+
+# =======================
+# Synthetic gears
+# =======================
+
+def syntheticGear(size, stroke=2, teeth=DEFAULT_TEETH, filled=False):
+    '''Procedural input gear: a size x size B/W uint8 array (0 = black) of a
+    wavy toothed outline stroke pixels wide, or the filled shape. Radius
+    0.4 * size with teeth 0.05 * size deep, centered.'''
+    center = (size - 1)/2.
+    row, col = np.ogrid[:size, :size]
+    radius = np.hypot(row - center, col - center)
+    outline = size*(0.4 + 0.05*np.sin(teeth*np.arctan2(row - center, col - center)))
+    if filled:
+        black = radius <= outline
+    else:
+        black = np.abs(radius - outline) <= stroke/2.
+    return np.where(black, 0, 255).astype(np.uint8)
+
+# =======================
+# Cases
+# =======================
+
+def benchmarkCases(sizes=DEFAULT_SIZES, strokes=DEFAULT_STROKES, ratios=DEFAULT_RATIOS,
+                   steps=DEFAULT_STEPS):
+    '''Every (size, stroke, ratio, steps) combination, smallest first.'''
+    return [(size, stroke, ratio, stepCount) for size in sorted(sizes)
+            for stroke in strokes for ratio in ratios for stepCount in steps]
+
+class StageTimer:
+    '''Runs stages, recording each one's wall time and, if memory is set, its
+    peak traced allocation in bytes (tracemalloc must be running).'''
+
+    def __init__(self, memory=False):
+        self.memory = memory
+        self.seconds = {}
+        self.peakBytes = {}
+
+    def run(self, stage, function, *args, **kwargs):
+        if self.memory:
+            tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        result = function(*args, **kwargs)
+        self.seconds[stage] = time.perf_counter() - start
+        if self.memory:
+            self.peakBytes[stage] = tracemalloc.get_traced_memory()[1] - base
+        return result
+
+def _sweep(image, inputCoords, inputImageSize, ratio, overlap, steps, engine, workers):
+    if engine == 'envelope':
+        profile = gear_engine.envelopeProfile(inputCoords, ratio, overlap, steps)
+        size = gear_engine.outputGearSize(inputImageSize, ratio)
+        return gear_engine.renderProfile(profile, size, ratio)
+    outputGear = gear_engine.newCanvas(gear_engine.outputGearSize(inputImageSize, ratio))
+    swept = engine == 'swept'
+    if workers > 1:
+        return gear_engine.sweepParallel(outputGear, inputCoords, ratio, overlap, steps, workers,
+                                         swept=swept)
+    for _ in gear_engine.iterSweep(outputGear, inputCoords, ratio, overlap, steps, swept=swept):
+        pass
+    return outputGear
+
+def _write(outputGear, crossbar, directory):
+    gear_engine.writeOutputGear(outputGear, os.path.join(directory, 'gear.png'))
+    gear_engine.writeOutputGear(crossbar, os.path.join(directory, 'crossbar.png'))
+
+def runStages(inputPath, ratio, overlap, steps, directory, engine='raster',
+              inputMode='pixels', workers=1, animationFrames=DEFAULT_ANIMATION_FRAMES,
+              memory=False):
+    '''Runs the whole pipeline once on the gear image at inputPath, writing
+    into directory, and returns the StageTimer and the number of input points.
+    animationFrames=0 skips the animation stage.'''
+    timer = StageTimer(memory)
+    image, _ = timer.run('load', gear_engine.readGearImage, inputPath)
+    if engine == 'envelope':
+        inputCoords, inputImageSize = timer.run('getBlackPixels', gear_engine.getPolarOutline,
+                                                image)
+    else:
+        inputCoords, inputImageSize = timer.run('getBlackPixels', gear_engine.getInputCoords,
+                                                image, (ratio + 1 - overlap, 0), inputMode,
+                                                None if engine == 'swept' else steps)
+    outputGear = timer.run('sweep', _sweep, image, inputCoords, inputImageSize, ratio, overlap,
+                           steps, engine, workers)
+    outputGear = timer.run('outputCleanup', gear_engine.outputCleanup, outputGear)
+    crossbar = timer.run('drawCrossbar', gear_engine.drawCrossbar,
+                         inputImageSize*(ratio + 1 - overlap)/2)
+    timer.run('write', _write, outputGear, crossbar, directory)
+    if animationFrames:
+        timer.run('animation', gear_animation.renderAnimation, image, outputGear, ratio,
+                  overlap, os.path.join(directory, 'animation.gif'), frames=animationFrames,
+                  maxSize=DEFAULT_ANIMATION_SIZE)
+    return timer, len(inputCoords)
+
+def benchmarkCase(size, stroke, ratio, steps, overlap=1.0, engine='raster',
+                  inputMode='pixels', workers=1, repeat=1,
+                  animationFrames=DEFAULT_ANIMATION_FRAMES, memory=True):
+    '''Benchmarks one case: the best of repeat timed runs per stage, plus (if
+    memory) one tracemalloc run for peak memory. Returns a result dict.'''
+    with tempfile.TemporaryDirectory(prefix='pygear-bench-') as directory:
+        inputPath = os.path.join(directory, 'input.png')
+        Image.fromarray(syntheticGear(size, stroke)).save(inputPath)
+        seconds = {}
+        for _ in range(max(1, repeat)):
+            timer, points = runStages(inputPath, ratio, overlap, steps, directory, engine,
+                                      inputMode, workers, animationFrames)
+            for stage, value in timer.seconds.items():
+                seconds[stage] = min(value, seconds.get(stage, value))
+        peakBytes = {}
+        if memory:
+            tracemalloc.start()
+            try:
+                timer, _ = runStages(inputPath, ratio, overlap, steps, directory, engine,
+                                     inputMode, workers, animationFrames, memory=True)
+                peakBytes = dict(timer.peakBytes, total=max(timer.peakBytes.values()))
+            finally:
+                tracemalloc.stop()
+    seconds['total'] = sum(seconds.values())
+    return {
+        'size': size, 'stroke': stroke, 'ratio': gear_engine.formatRatio(ratio),
+        'steps': steps, 'overlap': overlap, 'engine': engine, 'inputMode': inputMode,
+        'workers': workers, 'points': points,
+        'outputSize': gear_engine.outputGearSize(size, ratio),
+        'stepsPerSecond': steps/seconds['sweep'] if seconds['sweep'] else None,
+        'seconds': seconds,
+        'peakBytes': peakBytes,
+    }
+
+def environment():
+    '''What a result file was measured on.'''
+    return {
+        'engineVersion': gear_engine.ENGINE_VERSION,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+
+def runBenchmarks(cases, report=print, **options):
+    '''benchmarkCase for every (size, stroke, ratio, steps) in cases (see
+    benchmarkCases), reporting each result as it finishes. options are passed
+    on to benchmarkCase. Returns the results file contents as a dict.'''
+    results = []
+    for size, stroke, ratio, steps in cases:
+        result = benchmarkCase(size, stroke, ratio, steps, **options)
+        results.append(result)
+        report(formatResult(result))
+    return {'environment': environment(), 'results': results}
+
+# =======================
+# Results
+# =======================
+
+def caseKey(result):
+    '''What identifies a case across result files.'''
+    return (result['size'], result['stroke'], str(result['ratio']), result['steps'],
+            result['overlap'], result['engine'], result['inputMode'], result['workers'])
+
+def formatResult(result):
+    stages = ', '.join('{} {:.3f}s'.format(stage, result['seconds'][stage])
+                       for stage in STAGES if stage in result['seconds'])
+    memory = ''
+    if result['peakBytes']:
+        memory = ', peak {:.1f} MB'.format(result['peakBytes']['total']/2.**20)
+    return 'size {} stroke {} ratio {} steps {}: {} (total {:.3f}s{})'.format(
+        result['size'], result['stroke'], result['ratio'], result['steps'], stages,
+        result['seconds']['total'], memory)
+
+def compareResults(new, old, tolerance=DEFAULT_TOLERANCE, minSeconds=DEFAULT_MIN_SECONDS):
+    '''Matches the cases of two results files and returns (case, stage, old
+    seconds, new seconds) for every stage that got more than tolerance (and
+    minSeconds) slower. Cases only in one of the files are skipped.'''
+    previous = {caseKey(result): result for result in old['results']}
+    regressions = []
+    for result in new['results']:
+        before = previous.get(caseKey(result))
+        if before is None:
+            continue
+        for stage, seconds in result['seconds'].items():
+            oldSeconds = before['seconds'].get(stage)
+            if (oldSeconds is not None and seconds > oldSeconds*(1 + tolerance)
+                    and seconds - oldSeconds > minSeconds):
+                regressions.append((caseKey(result), stage, oldSeconds, seconds))
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Benchmark the gear generation pipeline on synthetic gears.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(DEFAULT_SIZES),
+                        help='input gear sizes in pixels (default: %(default)s)')
+    parser.add_argument('--strokes', type=int, nargs='+', default=list(DEFAULT_STROKES),
+                        help='outline stroke widths in pixels (default: %(default)s)')
+    parser.add_argument('-r', '--ratios', type=gear_engine.parseRatio, nargs='+',
+                        default=list(DEFAULT_RATIOS), help='gear ratios (default: 2)')
+    parser.add_argument('-s', '--steps', type=int, nargs='+', default=list(DEFAULT_STEPS),
+                        help='computation steps (default: %(default)s)')
+    parser.add_argument('--overlap', type=float, default=1.0,
+                        help='gear overlap (default: %(default)s)')
+    parser.add_argument('--engine', choices=gear_engine.ENGINES, default='raster',
+                        help='generation engine (default: raster)')
+    parser.add_argument('--input-mode', choices=gear_engine.INPUT_MODES, default='pixels',
+                        help='input points swept by the raster engine (default: pixels)')
+    parser.add_argument('-w', '--workers', type=int, default=1,
+                        help='sweep worker processes (default: 1)')
+    parser.add_argument('--repeat', type=int, default=1,
+                        help='timed runs per case; the fastest counts (default: 1)')
+    parser.add_argument('--animation-frames', type=int, default=DEFAULT_ANIMATION_FRAMES,
+                        help='frames of the animation stage, 0 to skip it '
+                             '(default: %(default)s)')
+    parser.add_argument('--no-memory', action='store_true',
+                        help='skip the tracemalloc pass that measures peak memory')
+    parser.add_argument('-o', '--output', default='benchmark.json',
+                        help='results JSON file (default: %(default)s)')
+    parser.add_argument('--compare', default=None,
+                        help='earlier results JSON file to check the new results against')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help='slowdown, as a fraction, reported as a regression '
+                             '(default: %(default)s)')
+    args = parser.parse_args(argv)
+    cases = benchmarkCases(args.sizes, args.strokes, args.ratios, args.steps)
+    results = runBenchmarks(cases, overlap=args.overlap, engine=args.engine,
+                            inputMode=args.input_mode, workers=args.workers,
+                            repeat=args.repeat, animationFrames=args.animation_frames,
+                            memory=not args.no_memory)
+    with open(args.output, 'w') as fp:
+        json.dump(results, fp, indent=1)
+    print('Results written to {}'.format(args.output))
+    if args.compare is None:
+        return 0
+    with open(args.compare) as fp:
+        regressions = compareResults(results, json.load(fp), args.tolerance)
+    for key, stage, oldSeconds, newSeconds in regressions:
+        print('REGRESSION size {} stroke {} ratio {} steps {}: {} {:.3f}s -> {:.3f}s '
+              '({:+.0%})'.format(key[0], key[1], key[2], key[3], stage, oldSeconds, newSeconds,
+                                 newSeconds/oldSeconds - 1))
+    print('{} regression(s) against {}'.format(len(regressions), args.compare))
+    return 1 if regressions else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
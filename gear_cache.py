@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+"""
+pygear result cache
+On-disk, content-addressed cache of generated gears, shared by the GUI
+(create_gear.py) and the batch CLI (pygear_cli.py).
+
+Entries are keyed by a hash of the binarized input pixels, the generation
+parameters and gear_engine.ENGINE_VERSION, so re-running the same drawing
+with the same settings returns instantly. The cache is bounded in size and
+evicts the least recently used entries first.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import time
+from fractions import Fraction
+
+import numpy as np
+
+import gear_engine
+import gear_profile
+
+# Default cache location; override with the PYGEAR_CACHE_DIR environment variable.
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'pygear')
+
+# Total size the cache may grow to before old entries are evicted, in bytes.
+DEFAULT_MAX_BYTES = 1 * 2**30
+
+ENTRY_SUFFIX = '.npz'
+
+def packBitmap(bitmap):
+    '''Packs a 0/255 bitmap to one bit per pixel (white = 1).'''
+    return np.packbits(np.asarray(bitmap) != 0)
+
+def unpackBitmap(packed, shape, dtype):
+    '''Inverse of packBitmap.'''
+    bits = np.unpackbits(packed, count=shape[0]*shape[1]).reshape(shape)
+    return (bits*255).astype(dtype)
+
+def jobParams(ratio, overlap, steps, engine='raster', inputMode='pixels'):
+    '''The generation parameters a cache entry is keyed on. Fractional ratios
+    are keyed as "p/q", so 1.5 and 3/2 share an entry.'''
+    ratio = Fraction(ratio).limit_denominator(gear_engine.MAX_RATIO_DENOMINATOR)
+    ratio = int(ratio) if ratio.denominator == 1 else str(ratio)
+    return {'ratio': ratio, 'overlap': overlap, 'steps': steps, 'engine': engine,
+            'inputMode': inputMode}
+
+class GearCache:
+    '''Size-bounded LRU cache of output gear bitmaps, crossbars and metadata,
+    stored as one .npz file per entry in directory. Recency is tracked with
+    the entry files' modification times.'''
+
+    def __init__(self, directory=None, maxBytes=DEFAULT_MAX_BYTES):
+        self.directory = directory or os.environ.get('PYGEAR_CACHE_DIR', DEFAULT_CACHE_DIR)
+        self.maxBytes = maxBytes
+        os.makedirs(self.directory, exist_ok=True)
+
+    @staticmethod
+    def key(image, **params):
+        '''Cache key of a job: a hash of the binarized input pixels, the
+        generation parameters and the engine version.'''
+        black = np.asarray(image) == 0
+        digest = hashlib.sha256()
+        digest.update(json.dumps({'shape': black.shape, 'engineVersion': gear_engine.ENGINE_VERSION,
+                                  'params': params}, sort_keys=True).encode())
+        digest.update(np.packbits(black).tobytes())
+        return digest.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key + ENTRY_SUFFIX)
+
+    def get(self, key):
+        '''Returns (outputGear, crossbar, metadata) for key, or None on a miss.'''
+        path = self.path(key)
+        try:
+            with np.load(path) as entry:
+                outputGear = unpackBitmap(entry['outputGear'], tuple(entry['outputShape']), np.uint8)
+                crossbar = unpackBitmap(entry['crossbar'], tuple(entry['crossbarShape']), np.float64)
+                metadata = json.loads(str(entry['metadata']))
+        except (OSError, KeyError, ValueError):
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return outputGear, crossbar, metadata
+
+    def put(self, key, outputGear, crossbar, metadata=None):
+        '''Stores an entry (atomically) and evicts old entries beyond maxBytes.'''
+        metadata = dict(metadata or {}, created=time.time(),
+                        engineVersion=gear_engine.ENGINE_VERSION)
+        handle, tmpPath = tempfile.mkstemp(suffix=ENTRY_SUFFIX, dir=self.directory)
+        try:
+            with os.fdopen(handle, 'wb') as tmpFile:
+                np.savez(tmpFile,
+                         outputGear=packBitmap(outputGear), outputShape=np.shape(outputGear),
+                         crossbar=packBitmap(crossbar), crossbarShape=np.shape(crossbar),
+                         metadata=json.dumps(metadata))
+            os.replace(tmpPath, self.path(key))
+        except BaseException:
+            if os.path.exists(tmpPath):
+                os.remove(tmpPath)
+            raise
+        self.evict()
+
+    def entries(self):
+        '''(mtime, size, path) of every entry, oldest first.'''
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(ENTRY_SUFFIX):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        return sorted(entries)
+
+    def evict(self):
+        '''Removes least recently used entries until the cache fits maxBytes.'''
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.maxBytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+
+    def clear(self):
+        for _, _, path in self.entries():
+            os.remove(path)
+
+def cachedMakeGear(image, ratio, overlap, steps, engine='raster', inputMode='pixels',
+                   workers=1, cache=None, progress=None, canvasPath=None):
+    '''gear_engine.makeGear backed by a GearCache (a default one if cache is
+    None). Returns the output gear and crossbar bitmaps and whether they came
+    from the cache.'''
+    if cache is None:
+        cache = GearCache()
+    params = jobParams(ratio, overlap, steps, engine, inputMode)
+    key = cache.key(image, **params)
+    entry = cache.get(key)
+    gear_profile.event('cacheHit' if entry is not None else 'cacheMiss', key=key)
+    if entry is not None:
+        outputGear, crossbar, _ = entry
+        return outputGear, crossbar, True
+    start = time.perf_counter()
+    outputGear, crossbar = gear_engine.makeGear(image, ratio, overlap, steps, engine,
+                                                inputMode, workers, canvasPath, progress)
+    cache.put(key, outputGear, crossbar, dict(params, seconds=time.perf_counter() - start))
+    return outputGear, crossbar, False
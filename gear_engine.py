@@ -0,0 +1,1383 @@
+# -*- coding: utf-8 -*-
+"""
+pygear engine
+Shared gear generation math for create_gear.py, main_no_gui.py and pygear_cli.py.
+
+The input gear is kept as a PointSet, a compact array of pixel positions
+(4 bytes a point, plus up to 48 more for the tables a sweep builds and drops
+when it ends), so every sweep step (rotation, radius test and
+rasterization) is a handful of NumPy array operations instead of a Python
+loop over each black pixel.
+
+Based on original gear math by Sam Ettinger (2016)
+"""
+
+import functools
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from fractions import Fraction
+from multiprocessing import shared_memory
+import numpy as np
+from PIL import Image, ImageDraw
+
+import gear_profile
+
+# Bump whenever a change alters the bitmaps the engine produces (which
+# points are carved, where they land, the cleanup), so results cached under
+# an older version are not reused (see gear_cache). Changes that only
+# reorder or batch the same work keep it.
+#   2: radius test fixed for overlaps at or past ratio + 1
+ENGINE_VERSION = 2
+
+# =======================
+# Image loading
+# =======================
+
+# Gray levels at or below this count as black. 0 keeps only pure black pixels;
+# raise it (e.g. to 127) for anti-aliased drawings and screenshots.
+DEFAULT_BLACK_THRESHOLD = 0
+
+@gear_profile.profiled('load')
+def readGearImage(filename, threshold=DEFAULT_BLACK_THRESHOLD, maxSize=None):
+    '''Loads a gear drawing as a B/W uint8 array: 0 where the grayscale value
+    is at or below threshold, 255 elsewhere. Transparent areas count as white.
+    If maxSize is given, the image is first downscaled so that its larger
+    side is at most maxSize pixels.
+    Returns the array and the (downscaled) grayscale PIL image.'''
+    img = Image.open(filename)
+    if 'A' in img.getbands() or 'transparency' in img.info:
+        img = img.convert('RGBA')
+        background = Image.new('RGBA', img.size, 'white')
+        img = Image.alpha_composite(background, img)
+    img = img.convert('L')
+    if maxSize is not None and max(img.size) > maxSize:
+        scale = maxSize/max(img.size)
+        newSize = (max(1, round(img.width*scale)), max(1, round(img.height*scale)))
+        img = img.resize(newSize, Image.LANCZOS)
+    return binarizeImage(np.asarray(img), threshold), img
+
+def binarizeImage(image, threshold=DEFAULT_BLACK_THRESHOLD):
+    '''Thresholds a grayscale array to 0 (black) and 255 (white) as uint8.'''
+    return np.where(np.asarray(image) <= threshold, 0, 255).astype(np.uint8)
+
+# =======================
+# Gear ratios
+# =======================
+
+# Largest denominator of a fractional gear ratio p/q.
+MAX_RATIO_DENOMINATOR = 100
+
+def parseRatio(text):
+    '''Gear ratio from text such as "2", "1.5" or "3/2": an int for whole
+    ratios, else a Fraction. Raises ValueError unless it is positive and
+    exactly p/q with q at most MAX_RATIO_DENOMINATOR.'''
+    typed = Fraction(str(text).strip())
+    ratio = typed.limit_denominator(MAX_RATIO_DENOMINATOR)
+    if ratio <= 0:
+        raise ValueError("gear ratio must be positive, got {!r}".format(text))
+    if ratio != typed:
+        raise ValueError("gear ratio {!r} is not p/q with q at most {} (nearest is {})"
+                         .format(text, MAX_RATIO_DENOMINATOR, ratio))
+    return int(ratio) if ratio.denominator == 1 else ratio
+
+def ratioTurns(ratio):
+    '''Input gear turns in the least common full-rotation period of a p/q
+    ratio (p; the output gear turns q times meanwhile). Every further input
+    turn carves the same points again, turned 2*pi*q/p further around the
+    output axle, so the sweep runs one input turn and carves it p times, a
+    p-th of a turn apart. Equals the ratio for whole ratios.'''
+    return Fraction(ratio).limit_denominator(MAX_RATIO_DENOMINATOR).numerator
+
+def formatRatio(ratio):
+    '''Gear ratio as text: "2" for whole ratios, "3/2" otherwise.'''
+    return str(Fraction(ratio).limit_denominator(MAX_RATIO_DENOMINATOR))
+
+def outputGearSize(inputImageSize, ratio):
+    '''Side, in pixels, of the output gear bitmap for an input of
+    inputImageSize pixels.'''
+    return int(round(inputImageSize*ratio))
+
+# =======================
+# Point arrays
+# =======================
+
+def pixelsToCoords(rowIdx, colIdx, shape, offset):
+    '''Scales pixel positions of an image with the given shape to [-1, 1] and
+    shifts them by offset. Returns an Nx2 float array and the image size.'''
+    rows, cols = shape[:2]
+    size = max(rows, cols)
+    scale = 2./size
+    coords = np.empty((len(rowIdx), 2))
+    coords[:, 0] = scale*(colIdx - (cols-1)/2.) + float(offset[0])
+    coords[:, 1] = scale*(rowIdx - (rows-1)/2.) + float(offset[1])
+    return coords, size
+
+class PointSet:
+    '''Input gear points, compactly: an Nx2 array of (col, row) pixel
+    positions plus the map to sweep coordinates, x = scale*(col - center[0])
+    + offset[0] and likewise y from row (as in pixelsToCoords). Whole pixels
+    are kept as int16 (int32 past 32767 pixels), 4 bytes a point instead of
+    the 16 of an Nx2 float array; resampled outlines stay float64.
+    Slices (points[a:b], points[::k]) and shifted() share the pixel array;
+    boolean or index arrays select a copy. x and y are float64 and
+    bit for bit equal to pixelsToCoords' coordinates.
+    cache holds per-run data derived from the points: float64 offsets and
+    squared radii (see axleOffsets) and the prune index (see sweepIndex), up
+    to 48 bytes a point for a sweep about one axle. It is shared with
+    shifted views, which have the same pixels, and dropped by releaseCache
+    once a sweep ends (see iterSweep and sweepGrid).'''
+
+    def __init__(self, pixels, scale=1., center=(0., 0.), offset=(0., 0.), cache=None):
+        self.pixels = pixels
+        self.scale = scale
+        self.center = center
+        self.offset = (float(offset[0]), float(offset[1]))
+        self.cache = {} if cache is None else cache
+
+    @classmethod
+    def fromPixels(cls, rowIdx, colIdx, shape, offset=(0, 0)):
+        '''Points at pixel positions of an image with the given shape, scaled
+        to [-1, 1] and shifted by offset.'''
+        rows, cols = shape[:2]
+        size = max(rows, cols)
+        dtype = np.float64
+        if np.issubdtype(np.asarray(rowIdx).dtype, np.integer):
+            dtype = np.int16 if size <= np.iinfo(np.int16).max else np.int32
+        pixels = np.empty((len(rowIdx), 2), dtype=dtype)
+        pixels[:, 0] = colIdx
+        pixels[:, 1] = rowIdx
+        return cls(pixels, 2./size, ((cols-1)/2., (rows-1)/2.), offset)
+
+    def __len__(self):
+        return len(self.pixels)
+
+    def __getitem__(self, index):
+        if isinstance(index, (int, np.integer)):
+            raise TypeError("index a PointSet with a slice or an index array")
+        return self.withPixels(self.pixels[index])
+
+    @property
+    def x(self):
+        return self.scale*(self.pixels[:, 0] - self.center[0]) + self.offset[0]
+
+    @property
+    def y(self):
+        return self.scale*(self.pixels[:, 1] - self.center[1]) + self.offset[1]
+
+    @property
+    def nbytes(self):
+        return self.pixels.nbytes
+
+    def releaseCache(self):
+        '''Drops the per-run data in cache, for this point set and its views.'''
+        self.cache.clear()
+
+    def withPixels(self, pixels):
+        '''Other pixel positions with the same map to sweep coordinates.'''
+        return PointSet(pixels, self.scale, self.center, self.offset)
+
+    def shifted(self, offset):
+        '''The same points moved by offset, sharing the pixel array.'''
+        return PointSet(self.pixels, self.scale, self.center,
+                        (self.offset[0] + offset[0], self.offset[1] + offset[1]), self.cache)
+
+    def __getstate__(self):
+        # Caches are rebuilt where needed rather than pickled to workers
+        state = dict(self.__dict__)
+        state['cache'] = {}
+        return state
+
+def asPointSet(points):
+    '''points as a PointSet: returned as is, or an Nx2 coordinate array wrapped
+    with an identity map.'''
+    if isinstance(points, PointSet):
+        return points
+    return PointSet(np.asarray(points, dtype=np.float64))
+
+def blackPixelIndices(image):
+    '''Row and column indices of the black pixels of an image.'''
+    return np.nonzero(np.asarray(image) == 0)
+
+def getBlackPixelArray(image, offset):
+    '''Array version of getBlackPixels: returns an Nx2 float array of the black
+    pixels, scaled to [-1, 1] and shifted by offset, plus the image size.'''
+    image = np.asarray(image)
+    rowIdx, colIdx = blackPixelIndices(image)
+    return pixelsToCoords(rowIdx, colIdx, image.shape, offset)
+
+def boundaryPixelIndices(image, width=1):
+    '''Row and column indices of the black pixels within width pixels
+    (8-connected) of a non-black pixel or the image border. Interior pixels of
+    a filled or thick-stroked drawing never shape the carved profile.'''
+    image = np.asarray(image)
+    black = np.pad(image == 0, 1)
+    interior = black
+    for _ in range(width):
+        eroded = interior.copy()
+        for dr in (-1, 0, 1):
+            for dc in (-1, 0, 1):
+                eroded &= np.roll(interior, (dr, dc), axis=(0, 1))
+        interior = eroded
+    boundary = (black & ~interior)[1:-1, 1:-1]
+    return np.nonzero(boundary)
+
+def boundaryWidth(image, steps):
+    '''Band width, in input pixels, for 'boundary' mode: the farthest a point
+    moves relative to the output gear in one step, so a point of the band
+    lands on nearly every output pixel the full shape passes over. Filled
+    drawings can still differ from 'pixels' by a few pixels (see
+    compareInputModes).'''
+    rows, cols = np.asarray(image).shape[:2]
+    size = max(rows, cols)
+    # Input radius is at most sqrt(2) (image corner); output radius below ratio
+    # moves phi*ratio = theta per step.
+    return int(math.ceil(2*math.pi/steps*(math.sqrt(2) + 1)*size/2.))
+
+def traceContours(mask):
+    '''Marching squares over a boolean mask. Returns a list of closed contours,
+    each an Mx2 float array of (row, col) points lying halfway between pixel
+    centers inside and outside the mask.'''
+    padded = np.pad(np.asarray(mask, dtype=bool), 1)
+    height, width = padded.shape
+    tl = padded[:-1, :-1]
+    tr = padded[:-1, 1:]
+    br = padded[1:, 1:]
+    bl = padded[1:, :-1]
+    case = tl*1 + tr*2 + br*4 + bl*8
+    # Each crossed cell edge is a vertex, keyed by the edge's top/left pixel:
+    # even keys for horizontal edges, odd keys for vertical edges.
+    i, j = np.indices(case.shape)
+    T = 2*(i*width + j)
+    B = 2*((i + 1)*width + j)
+    L = 2*(i*width + j) + 1
+    R = 2*(i*width + j + 1) + 1
+    segments = {1: [(T, L)], 2: [(T, R)], 3: [(L, R)], 4: [(R, B)],
+                5: [(T, L), (R, B)], 6: [(T, B)], 7: [(L, B)], 8: [(L, B)],
+                9: [(T, B)], 10: [(T, R), (L, B)], 11: [(R, B)], 12: [(L, R)],
+                13: [(T, R)], 14: [(T, L)]}
+    ends = []
+    for c, pairs in segments.items():
+        cells = case == c
+        for a, b in pairs:
+            ends.append(np.column_stack((a[cells], b[cells])))
+    ends = np.concatenate(ends) if ends else np.empty((0, 2), dtype=int)
+    # Every vertex is shared by exactly two segments, so the segments form
+    # disjoint loops; walk them.
+    neighbours = {}
+    for a, b in ends.tolist():
+        neighbours.setdefault(a, []).append(b)
+        neighbours.setdefault(b, []).append(a)
+    contours = []
+    visited = set()
+    for first in neighbours:
+        if first in visited:
+            continue
+        loop = [first]
+        visited.add(first)
+        previous, current = first, neighbours[first][0]
+        while current != first:
+            loop.append(current)
+            visited.add(current)
+            a, b = neighbours[current]
+            previous, current = current, (b if a == previous else a)
+        keys = np.array(loop)
+        pixel, vertical = keys // 2, keys % 2
+        row = pixel // width + 0.5*vertical - 1
+        col = pixel % width + 0.5*(1 - vertical) - 1
+        contours.append(np.column_stack((row, col)))
+    return contours
+
+def resamplePolyline(points, spacing):
+    '''Resamples a closed polyline (Mx2 array) at a fixed arc-length spacing.'''
+    closed = np.vstack((points, points[:1]))
+    segLengths = np.hypot(*np.diff(closed, axis=0).T)
+    arc = np.concatenate(([0.], np.cumsum(segLengths)))
+    if arc[-1] == 0:
+        return points[:1].astype(float)
+    samples = np.arange(0., arc[-1], spacing)
+    return np.column_stack((np.interp(samples, arc, closed[:, 0]),
+                            np.interp(samples, arc, closed[:, 1])))
+
+def outlinePixels(image, spacing=0.5):
+    '''Traces the outline of the black region and resamples it every spacing
+    pixels. Returns the samples' (fractional) rows and columns.'''
+    contours = traceContours(np.asarray(image) == 0)
+    if contours:
+        points = np.concatenate([resamplePolyline(c, spacing) for c in contours])
+    else:
+        points = np.empty((0, 2))
+    return points[:, 0], points[:, 1]
+
+# Input point sets the sweep can run on:
+# 'pixels' every black pixel, 'boundary' only a band of edge pixels of the
+# black region, 'outline' a resampled polyline of its outline. Only 'pixels'
+# carves exactly the full shape: 'boundary' can differ by a few pixels, and
+# 'outline' only carves cleanly when the outline moves less than a pixel per
+# step.
+INPUT_MODES = ('pixels', 'boundary', 'outline')
+
+@gear_profile.profiled('getBlackPixels')
+def getInputCoords(image, offset, inputMode='pixels', steps=None, outlineSpacing=0.5):
+    '''Returns the input gear points for the sweep (see INPUT_MODES) as a
+    PointSet, plus the image size. In 'boundary' mode the band is made
+    wide enough for the given number of steps (one pixel if steps is None).'''
+    image = np.asarray(image)
+    if inputMode == 'pixels':
+        rowIdx, colIdx = blackPixelIndices(image)
+    elif inputMode == 'boundary':
+        width = 1 if steps is None else boundaryWidth(image, steps)
+        rowIdx, colIdx = boundaryPixelIndices(image, width)
+    elif inputMode == 'outline':
+        rowIdx, colIdx = outlinePixels(image, outlineSpacing)
+    else:
+        raise ValueError("inputMode must be one of {}, got {!r}".format(INPUT_MODES, inputMode))
+    return PointSet.fromPixels(rowIdx, colIdx, image.shape, offset), max(image.shape[:2])
+
+def rasterizePoints(image, coords, size, ratio, value=255):
+    '''Draws an Nx2 array of coordinates as white pixels (or value) on image,
+    in place. Points falling outside the image are dropped. A 1-D image is a
+    bit-packed bitmap (see newPackedCanvas); its pixels are just set.'''
+    ratio = float(ratio)
+    rows = ((coords[:, 1] + ratio)*size/(2*ratio)).astype(np.intp)
+    cols = ((coords[:, 0] + ratio)*size/(2*ratio)).astype(np.intp)
+    inside = (rows >= 0) & (rows < size) & (cols >= 0) & (cols < size)
+    if gear_profile.active() is not None:
+        gear_profile.count('pixelsWritten', int(np.count_nonzero(inside)))
+    if image.ndim == 1:
+        flat = rows[inside]*size + cols[inside]
+        np.bitwise_or.at(image, flat >> 3, (128 >> (flat & 7)).astype(np.uint8))
+    else:
+        image[rows[inside], cols[inside]] = value
+    return image
+
+# =======================
+# Output canvas
+# =======================
+
+# Rows of the output bitmap handled at once by the tiled passes below.
+DEFAULT_TILE_ROWS = 1024
+
+def newCanvas(size, path=None):
+    '''Allocates a blank (all black) size x size uint8 output bitmap, in RAM
+    or, when path is given, as a disk-backed np.memmap so that huge gears do
+    not have to fit in memory.'''
+    if path is None:
+        return np.zeros((size, size), dtype=np.uint8)
+    return np.memmap(path, dtype=np.uint8, mode='w+', shape=(size, size))
+
+def newPackedCanvas(size):
+    '''Allocates a blank size x size bitmap packed 8 pixels per byte, row-major.'''
+    return np.zeros((size*size + 7)//8, dtype=np.uint8)
+
+def unpackRows(packed, size, start, stop):
+    '''Unpacks rows start..stop-1 of a packed bitmap to a boolean array.'''
+    first, last = start*size, stop*size
+    bits = np.unpackbits(packed[first//8:(last + 7)//8])
+    bits = bits[first % 8:first % 8 + last - first]
+    return bits.reshape(stop - start, size).astype(bool)
+
+def unpackInto(canvas, packed, tileRows=DEFAULT_TILE_ROWS):
+    '''Whitens the canvas pixels that are set in a packed bitmap of the same
+    size, a band of rows at a time.'''
+    size = len(canvas)
+    for start in range(0, size, tileRows):
+        stop = min(start + tileRows, size)
+        canvas[start:stop][unpackRows(packed, size, start, stop)] = 255
+    return canvas
+
+# =======================
+# Cleanup and crossbar
+# =======================
+
+@functools.lru_cache(maxsize=8)
+def haloSpans(size, tileRows=DEFAULT_TILE_ROWS):
+    '''For each row of a size x size output bitmap, the [start, stop) columns
+    inside the gear's disk; the rest of the row is halo. Cached per size, and
+    only O(size) in memory, so repeated cleanups skip the distance math.'''
+    radius = size/2.
+    col = np.arange(size) - radius
+    start = np.zeros(size, dtype=np.intp)
+    stop = np.zeros(size, dtype=np.intp)
+    for first in range(0, size, tileRows):
+        row = (np.arange(first, min(first + tileRows, size)) - radius)[:, None]
+        inside = np.sqrt(row*row + col*col) < radius - .5
+        count = inside.sum(axis=1)
+        start[first:first + len(row)] = np.where(count > 0, inside.argmax(axis=1), 0)
+        stop[first:first + len(row)] = start[first:first + len(row)] + count
+    start.flags.writeable = False
+    stop.flags.writeable = False
+    return start, stop
+
+@gear_profile.profiled('outputCleanup')
+def outputCleanup(image, tileRows=DEFAULT_TILE_ROWS):
+    '''Remove the 'halo' around output image; adds a mark indicating the center.
+    Works a band of rows at a time, so a memmap canvas is never loaded whole.'''
+    size = len(image)
+    radius = size/2.
+    start, stop = haloSpans(size)
+    col = np.arange(size)
+    for first in range(0, size, tileRows):
+        last = min(first + tileRows, size)
+        halo = (col < start[first:last, None]) | (col >= stop[first:last, None])
+        image[first:last][halo] = 255
+    # Mark the center
+    markRadius = max(2., size/200.)
+    theta = np.arange(50)*2*np.pi/50
+    x = np.round(radius + markRadius*np.cos(theta)).astype(np.intp)
+    y = np.round(radius + markRadius*np.sin(theta)).astype(np.intp)
+    image[y, x] = 255
+    return image
+
+@gear_profile.profiled('drawCrossbar')
+def drawCrossbar(distance):
+    '''Draws the image of the crossbar that holds the two gear axles'''
+    distance = int(distance) # ensure integer
+    # Size of the image:
+    height = int(round(distance/6.))
+    width = int(np.ceil(distance*7./6))
+    # Coordinates of the axle holes' centers:
+    radius = height/2. - 0.5
+    holeOne = (radius, radius)
+    holeTwo = (distance + radius, radius)
+    # Initialize image as all white
+    crossbarImage = 255.0 * np.ones((height, width))
+    # Draw main horizontal bar (top and bottom rows)
+    crossbarImage[(0, height-1), int(np.ceil(holeOne[0])):int(np.floor(holeTwo[0])+1)] = 0.0
+    # Draw rounded ends along the sides
+    theta = np.pi*np.arange(distance)/distance - np.pi/2
+    sinT = radius*np.sin(theta)
+    cosT = radius*np.cos(theta)
+    crossbarImage[np.round(holeOne[1] - sinT).astype(np.intp),
+                  np.round(holeOne[0] - cosT).astype(np.intp)] = 0.0
+    crossbarImage[np.round(holeTwo[1] + sinT).astype(np.intp),
+                  np.round(holeTwo[0] + cosT).astype(np.intp)] = 0.0
+    # Draw axle holes
+    markRadius = max(2., distance/200.) # hole radius
+    theta = np.arange(50)*2*np.pi/50
+    x = np.round(holeOne[0] + markRadius*np.cos(theta)).astype(np.intp)
+    y = np.round(holeOne[1] + markRadius*np.sin(theta)).astype(np.intp)
+    crossbarImage[y, x] = 0.0
+    crossbarImage[y, x + distance] = 0.0
+    return crossbarImage
+
+# =======================
+# Sweep
+# =======================
+
+# Working memory the sweep may use for one block of steps, in bytes.
+DEFAULT_MEMORY_BUDGET = 64 * 2**20
+
+# Rough bytes of working memory per rotated point per step in sweepBlock:
+# the x/y tensors, their temporaries and the radius mask.
+BYTES_PER_POINT_STEP = 48
+
+# Largest distance, in output pixels, between the samples the swept engine
+# carves along each point's move from one step to the next.
+SWEPT_SPACING = 0.25
+
+# Rough bytes of working memory per sample carveSwept takes along a move:
+# the sample coordinates, their temporaries and the rasterized indices.
+BYTES_PER_SWEPT_SAMPLE = 80
+
+# Largest distance, in output pixels, autoSteps lets a point move in one step
+# for each engine. The raster engine leaves gaps beyond a pixel; the swept
+# engine carves each move along a parabola, which follows the true path
+# closely at this length.
+AUTO_STEP_PIXELS = {'raster': 1., 'swept': 8., 'envelope': 1.}
+
+def parseSteps(text):
+    '''Sweep step count from text: a positive int, or None for "auto" (see
+    autoSteps). Raises ValueError otherwise.'''
+    if str(text).strip().lower() == 'auto':
+        return None
+    steps = int(text)
+    if steps < 1:
+        raise ValueError("steps must be at least 1, got {!r}".format(text))
+    return steps
+
+def autoSteps(image, engine='raster'):
+    '''Number of sweep steps for an input gear image with the given engine:
+    just enough that no input point moves more than AUTO_STEP_PIXELS[engine]
+    output pixels in one step. A point at radius r from the input axle (in
+    input gear radii) and within the output gear moves at most 2*pi*(r + 1)
+    /steps per step, and the output has inputImageSize/2 pixels per radius.'''
+    # The farthest black pixel is on the boundary
+    points, inputImageSize = getInputCoords(image, (0, 0), 'boundary')
+    radius = math.sqrt((points.x**2 + points.y**2).max()) if len(points) else 1.
+    return max(1, int(math.ceil(math.pi*(radius + 1)*inputImageSize
+                                / AUTO_STEP_PIXELS[engine])))
+
+def sweptMoveSamples(steps, ratio, size, spacing=None):
+    '''Most samples carveSwept takes along one point's move over a step, on
+    an output bitmap of size pixels: relative to the output gear, a point at
+    most sqrt(2) (an image corner) from the input axle moves at most
+    2*pi/steps*(sqrt(2) + 1) per step (see boundaryWidth).'''
+    if spacing is None:
+        spacing = SWEPT_SPACING
+    move = 2*math.pi/steps*(math.sqrt(2) + 1)*size/(2*float(ratio))
+    return int(math.ceil(move/spacing)) + 1
+
+def stepsPerBlock(numPoints, memoryBudget=DEFAULT_MEMORY_BUDGET, swept=False,
+                  moveSamples=1):
+    '''Number of sweep steps to process together so that the KxN rotated
+    coordinate tensors of one block fit in memoryBudget bytes. The swept
+    engine rotates every point three times per step, and samples each move
+    at up to moveSamples points (see sweptMoveSamples).'''
+    bytesPerPoint = BYTES_PER_POINT_STEP
+    if swept:
+        bytesPerPoint = 3*BYTES_PER_POINT_STEP + moveSamples*BYTES_PER_SWEPT_SAMPLE
+    return max(1, int(memoryBudget // (max(numPoints, 1)*bytesPerPoint)))
+
+def sweepBlock(outputGear, inputCoords, start, stop, ratio, overlap, steps,
+               extras=None, value=255, size=None, swept=False):
+    '''Runs sweep steps start..stop-1 in one array pass (see sweepSteps).'''
+    return sweepSteps(outputGear, inputCoords, range(start, stop), ratio, overlap,
+                      steps, extras, value, size, swept)
+
+def sweepSteps(outputGear, inputCoords, blockSteps, ratio, overlap, steps,
+               extras=None, value=255, size=None, swept=False):
+    '''Runs the given sweep steps in one array pass: rotates the input points
+    that can reach the output gear at each step (see sweepCandidates) about
+    the input axle, keeps the points inside the output gear's radius and
+    carves all of them into outputGear, once for each of the ratioTurns
+    copies around the output axle (or only the copies in extras). swept
+    carves each point's whole move to the next step instead (see carveSwept).
+    size is only needed when outputGear is a packed bitmap.'''
+    blockSteps = [int(step) for step in blockSteps]
+    gear_profile.count('steps', len(blockSteps))
+    axle = ratio + 1 - overlap
+    if swept:
+        rotated = rotateAboutAxle(inputCoords, blockSteps, axle, steps, ratio)
+        return carveSwept(outputGear, rotated, blockSteps, ratio, steps, extras, value, size)
+    turned = turnAboutAxle(inputCoords, blockSteps, axle, steps, ratio)
+    return carveRotated(outputGear, turned, blockSteps, ratio, steps, extras, value, size)
+
+# Largest output rotation table (ratioTurns copies x steps angles) that
+# carveRotations keeps between blocks and runs; 16 bytes an entry.
+MAX_TABLE_ENTRIES = 2**20
+
+@functools.lru_cache(maxsize=8)
+def stepTable(steps):
+    '''cos and sin of the input gear's turn at every half step 0, 0.5, ...,
+    steps + 0.5 of a sweep of steps steps, computed once per step count.'''
+    theta = 2*math.pi / steps
+    turn = [theta*(half/2.) for half in range(2*steps + 2)]
+    cosT = np.array([math.cos(angle) for angle in turn])
+    sinT = np.array([math.sin(angle) for angle in turn])
+    cosT.flags.writeable = False
+    sinT.flags.writeable = False
+    return cosT, sinT
+
+def stepRotations(blockSteps, steps):
+    '''Kx1 cos and sin columns of the input gear's turn at each of the K
+    (whole or half) sweep steps in blockSteps, looked up in stepTable.'''
+    cosT, sinT = stepTable(steps)
+    index = (2*np.asarray(blockSteps, dtype=np.float64)).astype(np.intp)
+    return cosT[index][:, None], sinT[index][:, None]
+
+@functools.lru_cache(maxsize=4)
+def carveTable(steps, ratio):
+    '''cos and sin, as ratioTurns x steps arrays, of the output gear's turn
+    at every sweep step for every ratioTurns copy.'''
+    turns = ratioTurns(ratio)
+    phi = 2*math.pi / (steps*float(ratio))
+    cosR = np.empty((turns, steps))
+    sinR = np.empty((turns, steps))
+    for extra in range(turns):
+        rotateBy = [phi*step + 2*math.pi*extra/turns for step in range(steps)]
+        cosR[extra] = [math.cos(angle) for angle in rotateBy]
+        sinR[extra] = [math.sin(angle) for angle in rotateBy]
+    cosR.flags.writeable = False
+    sinR.flags.writeable = False
+    return cosR, sinR
+
+def carveRotations(blockSteps, steps, ratio, extra):
+    '''cos and sin of the output gear's turn at each sweep step in blockSteps
+    for ratioTurns copy extra: looked up in carveTable, or computed for the
+    block when the table would exceed MAX_TABLE_ENTRIES.'''
+    turns = ratioTurns(ratio)
+    if turns*steps <= MAX_TABLE_ENTRIES:
+        cosR, sinR = carveTable(steps, ratio)
+        return cosR[extra][blockSteps], sinR[extra][blockSteps]
+    phi = 2*math.pi / (steps*float(ratio))
+    rotateBy = [phi*step + 2*math.pi*extra/turns for step in blockSteps]
+    return (np.array([math.cos(angle) for angle in rotateBy]),
+            np.array([math.sin(angle) for angle in rotateBy]))
+
+def axleOffsets(inputCoords, axle):
+    '''x and y offsets of the input points (a PointSet or Nx2 array) from the
+    input axle at (axle, 0), and their squared distances to it: the points in
+    polar form about the axle, which no sweep step changes. Kept in the
+    PointSet's cache, so every block, worker task and ratioTurns copy of a
+    sweep reuses them.'''
+    inputCoords = asPointSet(inputCoords)
+    axle = float(axle)
+    key = ('axleOffsets', inputCoords.offset, axle)
+    if key not in inputCoords.cache:
+        dx = inputCoords.x - axle
+        dy = inputCoords.y
+        inputCoords.cache[key] = (dx, dy, dx*dx + dy*dy)
+    return inputCoords.cache[key]
+
+# Radial bands around the input axle that sweepIndex splits the input points
+# into, and the slack (radians) added to each band's angular window.
+PRUNE_BANDS = 8
+PRUNE_MARGIN = 1e-6
+
+def sweepIndex(inputCoords, axle, reach):
+    '''Index of the input points by their polar coordinates about the input
+    axle at (axle, 0), predicting which of them can be within reach of the
+    output axle. A point at distance r from the input axle, turned to angle
+    beta, is at squared distance r*r + 2*axle*r*cos(beta) + axle*axle from the
+    output axle, so it is within reach only while beta is within a half width
+    w(r) of pi, and never if w(r) is empty. The points that can be are split
+    into PRUNE_BANDS radial bands, each with the widest w of its points and
+    its points sorted by angle (the angles listed twice, the second time
+    plus 2*pi, so a window can wrap around), as (angles, order, halfWidth)
+    tuples. Kept in the PointSet's cache.'''
+    inputCoords = asPointSet(inputCoords)
+    axle = float(axle)
+    reach = float(reach)
+    key = ('sweepIndex', inputCoords.offset, axle, reach)
+    if key in inputCoords.cache:
+        return inputCoords.cache[key]
+    dx, dy, radius2 = axleOffsets(inputCoords, axle)
+    radius = np.sqrt(radius2)
+    if axle > 0:
+        with np.errstate(divide='ignore', invalid='ignore'):
+            bound = (reach*reach - axle*axle - radius2)/(2*axle*radius)
+        bound[radius == 0] = np.inf if axle < reach else -np.inf
+    else:
+        bound = np.full(len(radius), np.inf)
+    reachable = np.nonzero(bound > -1 - PRUNE_MARGIN)[0]
+    halfWidth = math.pi - np.arccos(np.clip(bound[reachable], -1, 1)) + PRUNE_MARGIN
+    angle = np.arctan2(dy[reachable], dx[reachable]) % (2*math.pi)
+    index = []
+    if len(reachable):
+        edges = np.linspace(radius[reachable].min(), radius[reachable].max(), PRUNE_BANDS + 1)
+        band = np.digitize(radius[reachable], edges[1:-1])
+        for number in range(PRUNE_BANDS):
+            members = np.nonzero(band == number)[0]
+            if len(members) == 0:
+                continue
+            members = members[np.argsort(angle[members], kind='stable')]
+            angles = angle[members]
+            index.append((np.concatenate((angles, angles + 2*math.pi)), reachable[members],
+                          float(halfWidth[members].max())))
+    inputCoords.cache[key] = index
+    return index
+
+def sweepCandidates(inputCoords, blockSteps, axle, steps, reach, lead=0):
+    '''(step, point) index pairs of the input points that sweepIndex
+    predicts can be within reach of the output axle at each of the K sweep
+    steps in blockSteps, or at any time up to lead steps later: a superset
+    of the points the radius tests keep, so only these need turning. Each
+    step only looks at the points of each radial band within the band's
+    angular window, found by binary search in the sorted angles.'''
+    theta = 2*math.pi / steps
+    turn = theta*np.asarray(blockSteps, dtype=np.float64)
+    numSteps = len(turn)
+    stepParts = []
+    pointParts = []
+    for angles, order, halfWidth in sweepIndex(inputCoords, axle, reach):
+        numPoints = len(order)
+        width = 2*halfWidth + theta*lead
+        if width >= 2*math.pi:
+            first = np.zeros(numSteps, dtype=np.intp)
+            count = np.full(numSteps, numPoints, dtype=np.intp)
+        else:
+            low = (math.pi - halfWidth - theta*lead - turn) % (2*math.pi)
+            first = np.searchsorted(angles, low)
+            count = np.minimum(np.searchsorted(angles, low + width) - first, numPoints)
+        total = int(count.sum())
+        # Runs first[k], first[k] + 1, ... of count[k] positions, one per step
+        runStart = np.cumsum(count) - count
+        position = np.arange(total) + np.repeat(first - runStart, count)
+        stepParts.append(np.repeat(np.arange(numSteps), count))
+        pointParts.append(order[position % numPoints])
+    if not stepParts:
+        return np.zeros(0, dtype=np.intp), np.zeros(0, dtype=np.intp)
+    stepIdx = np.concatenate(stepParts)
+    pointIdx = np.concatenate(pointParts)
+    if gear_profile.active() is not None:
+        gear_profile.count('pointsPruned', numSteps*len(asPointSet(inputCoords)) - len(stepIdx))
+    return stepIdx, pointIdx
+
+@gear_profile.profiled('rotate')
+def rotateAboutAxle(inputCoords, blockSteps, axle, steps, reach):
+    '''The input points (a PointSet or Nx2 array, already shifted to the
+    input axle at (axle, 0)) turned about the axle as carveSwept takes them:
+    for the sweepCandidates pairs of the K sweep steps in blockSteps that can
+    come within reach of the output axle over the step, the pairs' step
+    indices and 3xM x and y arrays of the points at the step, half a step
+    and one step later.'''
+    axle = float(axle)
+    stepIdx, pointIdx = sweepCandidates(inputCoords, blockSteps, axle, steps, reach, 1)
+    cosT, sinT = stepRotations(sweptSteps(blockSteps), steps)
+    dx, dy, _ = axleOffsets(inputCoords, axle)
+    dx = dx[pointIdx]
+    dy = dy[pointIdx]
+    rows = stepIdx + len(blockSteps)*np.arange(3)[:, None]
+    cosT = cosT[rows, 0]
+    sinT = sinT[rows, 0]
+    x = (dx*cosT - dy*sinT) + axle
+    y = dx*sinT + dy*cosT
+    return stepIdx, x, y
+
+@gear_profile.profiled('rotate')
+def turnAboutAxle(inputCoords, blockSteps, axle, steps, reach):
+    '''The input points turned about the input axle at (axle, 0) by each of
+    the K sweep steps in blockSteps, as carveRotated takes them: for the
+    sweepCandidates pairs that can be within reach of the output axle, their
+    step and point indices and x offsets from the axle, (dx*cos - dy*sin),
+    along with the axle, the points' axleOffsets and the steps' rotations.
+    The y offsets are left for carveRotated to compute for the points it
+    keeps.'''
+    axle = float(axle)
+    stepIdx, pointIdx = sweepCandidates(inputCoords, blockSteps, axle, steps, reach)
+    cosT, sinT = stepRotations(blockSteps, steps)
+    cosT = cosT[:, 0]
+    sinT = sinT[:, 0]
+    dx, dy, radius2 = axleOffsets(inputCoords, axle)
+    u = dx[pointIdx]*cosT[stepIdx] - dy[pointIdx]*sinT[stepIdx]
+    return stepIdx, pointIdx, u, axle, dx, dy, radius2, cosT, sinT
+
+@gear_profile.profiled('carve')
+def carveRotated(outputGear, turned, blockSteps, ratio, steps, extras=None, value=255,
+                 size=None):
+    '''Carves rotated input points (see turnAboutAxle) that fall inside the
+    output gear's radius into outputGear, turned back with the output gear.
+    A point at squared distance r2 from the input axle, turned to x offset u
+    from it, is at squared distance r2 + 2*axle*u + axle**2 from the output
+    axle, so the radius test needs no y, and y is only computed for the
+    points kept. (The test is not divided through by axle, which may be zero
+    or negative when the overlap exceeds ratio + 1.)'''
+    if size is None:
+        size = len(outputGear)
+    turns = ratioTurns(ratio)
+    stepIdx, pointIdx, u, axle, dx, dy, radius2, cosT, sinT = turned
+    blockSteps = np.asarray(blockSteps, dtype=np.intp)
+    ratio = float(ratio)
+    keep = radius2[pointIdx] + 2*axle*u + axle*axle < ratio*ratio
+    stepIdx = stepIdx[keep]
+    pointIdx = pointIdx[keep]
+    x = u[keep] + axle
+    y = dx[pointIdx]*sinT[stepIdx] + dy[pointIdx]*cosT[stepIdx]
+    if gear_profile.active() is not None:
+        gear_profile.count('pointSteps', keep.size)
+        gear_profile.count('pointsKept', len(x))
+    addPointsRot = np.empty((len(x), 2))
+    for extra in (range(turns) if extras is None else extras):
+        cosR, sinR = carveRotations(blockSteps, steps, ratio, extra)
+        cosR = cosR[stepIdx]
+        sinR = sinR[stepIdx]
+        addPointsRot[:, 0] = x*cosR - y*sinR
+        addPointsRot[:, 1] = x*sinR + y*cosR
+        rasterizePoints(outputGear, addPointsRot, size, ratio, value)
+    return outputGear
+
+@gear_profile.profiled('carve')
+def carveSwept(outputGear, rotated, blockSteps, ratio, steps, extras=None, value=255,
+               size=None, spacing=None):
+    '''carveRotated for the swept engine. rotated holds the step indices and
+    x and y of the rotated input points at their step in blockSteps, then
+    the same points half a step and one step later (see rotateAboutAxle).
+    Each point's move over the step is carved as the parabola through those
+    three positions in the output gear's frame, sampled every spacing output
+    pixels (default SWEPT_SPACING), so no gaps are left between steps
+    however few there are.'''
+    if size is None:
+        size = len(outputGear)
+    if spacing is None:
+        spacing = SWEPT_SPACING
+    turns = ratioTurns(ratio)
+    ratio = float(ratio)
+    phi = 2*math.pi / (steps*ratio)
+    stepIdx, (x0, xMid, x1), (y0, yMid, y1) = rotated
+    keep = ((x0*x0 + y0*y0 < ratio*ratio) | (xMid*xMid + yMid*yMid < ratio*ratio)
+            | (x1*x1 + y1*y1 < ratio*ratio))
+    stepIdx = stepIdx[keep]
+    x0, xMid, x1 = x0[keep], xMid[keep], x1[keep]
+    y0, yMid, y1 = y0[keep], yMid[keep], y1[keep]
+    if gear_profile.active() is not None:
+        gear_profile.count('pointSteps', keep.size)
+        gear_profile.count('pointsKept', len(x0))
+    angle = np.array([phi*step for step in blockSteps])[stepIdx]
+    positions = []
+    for px, py, turn in ((x0, y0, 0.), (xMid, yMid, .5), (x1, y1, 1.)):
+        cosR, sinR = np.cos(angle + phi*turn), np.sin(angle + phi*turn)
+        positions.append((px*cosR - py*sinR, px*sinR + py*cosR))
+    (startX, startY), (midX, midY), (endX, endY) = positions
+    length = np.hypot(midX - startX, midY - startY) + np.hypot(endX - midX, endY - midY)
+    samples = np.maximum(np.ceil(length*(size/(2*ratio))/spacing), 1).astype(np.intp)
+    # Each parabola as start + t*linear + t*t*quadratic, sampled at
+    # t = 0, 1/n, ..., (n-1)/n (the move's end is the next step's start).
+    # Moves are grouped by their sample count n to work on n-wide blocks.
+    order = np.argsort(samples, kind='stable')
+    bounds = np.cumsum(np.bincount(samples))
+    curves = []
+    for start, mid, end in ((startX, midX, endX), (startY, midY, endY)):
+        start, mid, end = start[order], mid[order], end[order]
+        curves.append((start, 4*mid - 3*start - end, 2*(start + end) - 4*mid))
+    sampleX, sampleY = [], []
+    for count in np.unique(samples):
+        group = slice(bounds[count - 1], bounds[count])
+        t = np.arange(count)/float(count)
+        px, py = [(start[group, None] + t*(linear[group, None] + t*quadratic[group, None]))
+                  .ravel() for start, linear, quadratic in curves]
+        inside = px*px + py*py < ratio*ratio
+        sampleX.append(px[inside])
+        sampleY.append(py[inside])
+    sampleX, sampleY = np.concatenate(sampleX), np.concatenate(sampleY)
+    # The other copies of the output gear's turn are the same samples turned
+    # by a whole number of teeth, so they are rotated rather than resampled.
+    for extra in (range(turns) if extras is None else extras):
+        if extra == 0:
+            coords = np.column_stack((sampleX, sampleY))
+        else:
+            cosR, sinR = math.cos(2*math.pi*extra/turns), math.sin(2*math.pi*extra/turns)
+            coords = np.column_stack((sampleX*cosR - sampleY*sinR, sampleX*sinR + sampleY*cosR))
+        rasterizePoints(outputGear, coords, size, ratio, value)
+    return outputGear
+
+def sweptSteps(blockSteps):
+    '''Steps (fractional ones included) carveSwept needs rotated points at
+    for the given sweep steps: each step, then each half step later, then
+    each step plus one.'''
+    return (blockSteps + [step + .5 for step in blockSteps]
+            + [step + 1 for step in blockSteps])
+
+def generateGear(image, ratio, overlap, steps, progress=None,
+                 memoryBudget=DEFAULT_MEMORY_BUDGET, workers=1, inputMode='pixels',
+                 canvasPath=None, swept=False):
+    '''Sweeps the input gear image around the output axle and returns the
+    (uncleaned) uint8 output gear bitmap and the input image size.
+    With canvasPath the bitmap is a np.memmap backed by that file.
+    Steps are processed in blocks sized to fit memoryBudget bytes.
+    workers > 1 (or None for all cores) runs the sweep in a process pool.
+    inputMode picks the input points that are swept (see INPUT_MODES).
+    swept carves each point's move between steps (see carveSwept).
+    progress, if given, is called as progress(step, steps) after each block,
+    with step the last step completed.'''
+    offset = (ratio + 1 - overlap, 0)
+    # Swept moves leave no gaps for a wider boundary band to fill
+    inputCoords, inputImageSize = getInputCoords(image, offset, inputMode,
+                                                 None if swept else steps)
+    outputImageSize = outputGearSize(inputImageSize, ratio)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    outputGear = newCanvas(outputImageSize, canvasPath)
+    if workers > 1:
+        sweepParallel(outputGear, inputCoords, ratio, overlap, steps, workers,
+                      progress, memoryBudget, swept)
+        return outputGear, inputImageSize
+    with gear_profile.stage('sweep'):
+        for done in iterSweep(outputGear, inputCoords, ratio, overlap, steps, memoryBudget,
+                              swept=swept):
+            if progress is not None:
+                progress(done - 1, steps)
+    return outputGear, inputImageSize
+
+def iterSweep(outputGear, inputCoords, ratio, overlap, steps,
+              memoryBudget=DEFAULT_MEMORY_BUDGET, maxBlock=None, swept=False):
+    '''Runs the whole sweep into outputGear block by block, yielding the number
+    of steps done after each block, so callers can report progress, show the
+    partial bitmap or stop early. maxBlock caps the steps per block.'''
+    block = stepsPerBlock(len(inputCoords), memoryBudget, swept,
+                          sweptMoveSamples(steps, ratio, len(outputGear)))
+    if maxBlock is not None:
+        block = max(1, min(block, maxBlock))
+    try:
+        for start in range(0, steps, block):
+            stop = min(start + block, steps)
+            sweepBlock(outputGear, inputCoords, start, stop, ratio, overlap, steps,
+                       swept=swept)
+            yield stop
+    finally:
+        # Also when the caller stops early
+        asPointSet(inputCoords).releaseCache()
+
+# =======================
+# Progressive preview
+# =======================
+
+# Output size, in pixels, of the first (coarsest) progressive preview.
+DEFAULT_PREVIEW_SIZE = 256
+
+def interleavedSteps(steps):
+    '''All step indices 0..steps-1 in bit-reversed (van der Corput) order, so
+    every prefix is spread evenly around the full rotation and each further
+    chunk fills in new angles between the ones already swept.'''
+    bits = max(1, int(steps - 1).bit_length())
+    index = np.arange(steps)
+    reversedIndex = np.zeros(steps, dtype=np.int64)
+    for bit in range(bits):
+        reversedIndex |= ((index >> bit) & 1) << (bits - 1 - bit)
+    return index[np.argsort(reversedIndex, kind='stable')]
+
+def downscaleGear(image, factor):
+    '''Shrinks a B/W gear array by an integer factor, keeping a pixel black if
+    any pixel of its factor x factor block is black, so thin outlines survive.'''
+    image = np.asarray(image)
+    if factor <= 1:
+        return image
+    rows, cols = image.shape[:2]
+    padded = np.full((-(-rows // factor)*factor, -(-cols // factor)*factor), 255, dtype=image.dtype)
+    padded[:rows, :cols] = image
+    blocks = padded.reshape(padded.shape[0] // factor, factor, padded.shape[1] // factor, factor)
+    return blocks.min(axis=(1, 3))
+
+def progressiveLevels(inputImageSize, ratio, steps, previewSize=DEFAULT_PREVIEW_SIZE,
+                      minSteps=32):
+    '''(downscale factor, steps) of each progressive pass: power-of-two
+    downscales from about previewSize output pixels up to full resolution,
+    with steps scaled to each resolution. The last pass is the full job.'''
+    factor = 1
+    while inputImageSize*ratio // (factor*2) >= previewSize:
+        factor *= 2
+    levels = []
+    while factor > 1:
+        levels.append((factor, min(steps, max(minSteps, steps // factor))))
+        factor //= 2
+    levels.append((1, steps))
+    return levels
+
+def iterProgressive(image, ratio, overlap, steps, inputMode='pixels',
+                    previewSize=DEFAULT_PREVIEW_SIZE, minSteps=32,
+                    memoryBudget=DEFAULT_MEMORY_BUDGET):
+    '''Coarse-to-fine version of generateGear for previews. Sweeps a downscaled
+    copy of the input at a few steps first, then refines at higher step counts
+    and resolutions (see progressiveLevels). Within a pass, steps are swept in
+    interleavedSteps order into the same canvas, so each chunk adds new angles
+    to the work already done.
+    Yields (outputGear, factor, done, levelSteps) after each chunk; outputGear
+    is the uncleaned canvas of the current pass. Once the last pass finishes,
+    outputGear is exactly generateGear's result.'''
+    image = np.asarray(image)
+    offset = (ratio + 1 - overlap, 0)
+    for factor, levelSteps in progressiveLevels(max(image.shape[:2]), ratio, steps,
+                                                previewSize, minSteps):
+        inputCoords, inputImageSize = getInputCoords(downscaleGear(image, factor), offset,
+                                                     inputMode, levelSteps)
+        outputGear = newCanvas(outputGearSize(inputImageSize, ratio))
+        order = interleavedSteps(levelSteps)
+        block = min(stepsPerBlock(len(inputCoords), memoryBudget),
+                    max(minSteps, levelSteps // 16))
+        for start in range(0, levelSteps, block):
+            sweepSteps(outputGear, inputCoords, order[start:start + block], ratio,
+                       overlap, levelSteps)
+            yield outputGear, factor, min(start + block, levelSteps), levelSteps
+
+# =======================
+# Parallel sweep
+# =======================
+
+# Shared-memory input points, attached once per worker process.
+_workerShm = None
+_workerCoords = None
+
+def _sharePoints(points):
+    '''Copies the pixel array of points (a PointSet or Nx2 array) to new
+    shared memory. Returns the SharedMemory and the _initSweepWorker
+    arguments that attach a worker to it.'''
+    points = asPointSet(points)
+    pixels = np.ascontiguousarray(points.pixels)
+    shm = shared_memory.SharedMemory(create=True, size=max(pixels.nbytes, 1))
+    np.ndarray(pixels.shape, dtype=pixels.dtype, buffer=shm.buf)[:] = pixels
+    return shm, (shm.name, pixels.shape, pixels.dtype.str, points[:0])
+
+def _initSweepWorker(shmName, shape, dtype, template):
+    global _workerShm, _workerCoords
+    # Forked workers inherit the parent's profiler; their records would be lost
+    gear_profile.disable()
+    _workerShm = shared_memory.SharedMemory(name=shmName)
+    _workerCoords = template.withPixels(np.ndarray(shape, dtype=dtype, buffer=_workerShm.buf))
+
+def _sweepWorker(start, stop, extras, size, ratio, overlap, steps, memoryBudget,
+                 swept=False):
+    '''Sweeps steps start..stop-1 for the ratioTurns copies in extras into a
+    bit-packed partial bitmap and returns it.'''
+    partial = newPackedCanvas(size)
+    block = stepsPerBlock(len(_workerCoords), memoryBudget, swept,
+                          sweptMoveSamples(steps, ratio, size))
+    for blockStart in range(start, stop, block):
+        blockStop = min(blockStart + block, stop)
+        sweepBlock(partial, _workerCoords, blockStart, blockStop, ratio, overlap,
+                   steps, extras, size=size, swept=swept)
+    return partial
+
+def splitSweep(steps, ratio, workers):
+    '''Splits the sweep into (start, stop, extras) tasks for workers processes.
+    Steps are split first; the ratioTurns copies are only split as well when
+    there are fewer steps than workers.'''
+    turns = ratioTurns(ratio)
+    stepChunks = min(steps, 2*workers)
+    extraChunks = min(turns, -(-2*workers // stepChunks))
+    bounds = np.linspace(0, steps, stepChunks + 1).astype(int)
+    extraGroups = [list(range(turns))[i::extraChunks] for i in range(extraChunks)]
+    return [(int(start), int(stop), extras)
+            for start, stop in zip(bounds[:-1], bounds[1:]) if stop > start
+            for extras in extraGroups]
+
+@gear_profile.profiled('sweep')
+def sweepParallel(outputGear, inputCoords, ratio, overlap, steps, workers,
+                  progress=None, memoryBudget=DEFAULT_MEMORY_BUDGET, swept=False):
+    '''Runs the sweep across a pool of worker processes and carves the result
+    into outputGear. The input points' compact pixel array is shared with the
+    workers through shared memory; each task fills its own bit-packed partial
+    bitmap and the partials are OR-merged as they come back.'''
+    size = len(outputGear)
+    shm, initargs = _sharePoints(inputCoords)
+    try:
+        merged = newPackedCanvas(size)
+        tasks = splitSweep(steps, ratio, workers)
+        done = 0
+        with ProcessPoolExecutor(max_workers=workers, initializer=_initSweepWorker,
+                                 initargs=initargs) as pool:
+            futures = {pool.submit(_sweepWorker, start, stop, extras, size, ratio,
+                                   overlap, steps, memoryBudget, swept): (stop - start)*len(extras)
+                       for start, stop, extras in tasks}
+            for future in as_completed(futures):
+                merged |= future.result()
+                done += futures[future]
+                if progress is not None:
+                    progress(max(done // ratioTurns(ratio), 1) - 1, steps)
+    finally:
+        shm.close()
+        shm.unlink()
+    gear_profile.count('steps', steps)
+    return unpackInto(outputGear, merged)
+
+# =======================
+# Envelope engine
+# =======================
+
+# Angular resolution of the envelope engine's polar profiles.
+DEFAULT_ANGLE_BINS = 4096
+
+def angleBins(angles, bins):
+    '''Index of the angle bin (of bins over a full turn) each angle falls in.'''
+    return (np.floor(np.mod(angles, 2*math.pi)*(bins/(2*math.pi))).astype(np.intp)) % bins
+
+@gear_profile.profiled('getBlackPixels')
+def getPolarOutline(image, bins=DEFAULT_ANGLE_BINS):
+    '''Describes the input gear as a polar outline around the image center:
+    the largest radius of a black pixel in each of bins angle bins (scaled like
+    getBlackPixelArray). Empty bins are interpolated from their neighbours.
+    Returns the radius array and the image size.'''
+    coords, size = getBlackPixelArray(image, (0, 0))
+    x, y = coords[:, 0], coords[:, 1]
+    radius = np.full(bins, -1.)
+    np.maximum.at(radius, angleBins(np.arctan2(y, x), bins), np.sqrt(x*x + y*y))
+    filled = np.nonzero(radius >= 0)[0]
+    if len(filled) == 0:
+        return np.zeros(bins), size
+    if len(filled) < bins:
+        radius = np.interp(np.arange(bins), filled, radius[filled], period=bins)
+    return radius, size
+
+@gear_profile.profiled('sweep')
+def envelopeProfile(inputRadius, ratio, overlap, steps, bins=DEFAULT_ANGLE_BINS,
+                    memoryBudget=DEFAULT_MEMORY_BUDGET):
+    '''Output gear profile as the envelope of the input gear in the output
+    gear's rotating frame: the smallest radius any input outline point reaches
+    in each output angle bin over the sweep (at most ratio).
+    inputRadius is a polar outline as returned by getPolarOutline.'''
+    turns = ratioTurns(ratio)
+    ratio = float(ratio)
+    alpha = (np.arange(len(inputRadius)) + 0.5)*(2*math.pi/len(inputRadius))
+    axis = (ratio + 1 - overlap, 0)
+    outline = np.column_stack((inputRadius*np.cos(alpha) + axis[0],
+                               inputRadius*np.sin(alpha) + axis[1]))
+    theta = 2*math.pi / steps
+    phi = 2*math.pi / (steps*ratio)
+    profile = np.full(bins, ratio)
+    dx = outline[:, 0] - axis[0]
+    dy = outline[:, 1] - axis[1]
+    block = stepsPerBlock(len(outline), memoryBudget)
+    for start in range(0, steps, block):
+        blockSteps = np.arange(start, min(start + block, steps))[:, None]
+        cosT = np.cos(theta*blockSteps)
+        sinT = np.sin(theta*blockSteps)
+        x = (dx*cosT - dy*sinT) + axis[0]
+        y = (dx*sinT + dy*cosT) + axis[1]
+        r = np.sqrt(x*x + y*y)
+        keep = r < ratio
+        r = r[keep]
+        angle = (np.arctan2(y, x) + phi*blockSteps)[keep]
+        for extra in range(turns):
+            np.minimum.at(profile, angleBins(angle + 2*math.pi*extra/turns, bins), r)
+    gear_profile.count('steps', steps)
+    return profile
+
+@gear_profile.profiled('renderProfile')
+def renderProfile(profile, size, ratio, canvas=None, tileRows=DEFAULT_TILE_ROWS):
+    '''Renders a polar output profile into a size x size uint8 bitmap (canvas,
+    or a new one) in the sweep's convention: 0 (black) inside the gear, 255
+    where it was carved away. Rendered a band of rows at a time.'''
+    if canvas is None:
+        canvas = newCanvas(size)
+    ratio = float(ratio)
+    center = (np.arange(size) + 0.5)*(2*ratio)/size - ratio
+    x = center[None, :]
+    for start in range(0, size, tileRows):
+        y = center[start:start + tileRows, None]
+        inside = np.sqrt(x*x + y*y) < profile[angleBins(np.arctan2(y, x), len(profile))]
+        canvas[start:start + len(y)] = np.where(inside, 0, 255)
+    return canvas
+
+def generateGearEnvelope(image, ratio, overlap, steps, bins=DEFAULT_ANGLE_BINS,
+                         canvasPath=None):
+    '''Envelope engine counterpart of generateGear: computes the output gear as
+    a polar profile of bins output radii and only renders it to a bitmap at the
+    end. Assumes both gears are star-shaped around their axles.
+    Returns the (uncleaned) output gear bitmap, a np.memmap backed by
+    canvasPath if given, and the input image size.'''
+    inputRadius, inputImageSize = getPolarOutline(image, bins)
+    profile = envelopeProfile(inputRadius, ratio, overlap, steps, bins)
+    outputImageSize = outputGearSize(inputImageSize, ratio)
+    canvas = newCanvas(outputImageSize, canvasPath)
+    return renderProfile(profile, outputImageSize, ratio, canvas), inputImageSize
+
+def compareInputModes(image, ratio, overlap, steps, inputMode, workers=1):
+    '''Runs the sweep with inputMode and with every black pixel, and returns
+    the number of output pixels that differ between the two inside the disk
+    kept by outputCleanup. 0 means inputMode gives the same gear.'''
+    reduced, _ = generateGear(image, ratio, overlap, steps, workers=workers,
+                              inputMode=inputMode)
+    full, _ = generateGear(image, ratio, overlap, steps, workers=workers)
+    radius = len(full)/2.
+    row, col = np.ogrid[:len(full), :len(full)]
+    inside = np.sqrt((row - radius)**2 + (col - radius)**2) < radius - .5
+    return int(np.count_nonzero((reduced != full) & inside))
+
+# =======================
+# Pipeline
+# =======================
+
+# Engines makeGear can run: the raster sweep, the raster sweep carving each
+# point's move between steps (fewer steps for the same edges), or the polar
+# envelope.
+ENGINES = ('raster', 'swept', 'envelope')
+
+def makeGear(image, ratio, overlap, steps, engine='raster', inputMode='pixels',
+             workers=1, canvasPath=None, progress=None):
+    '''Full pipeline for one input gear array: generates the output gear with
+    the chosen engine (see ENGINES), cleans it up and draws the crossbar.
+    Returns the output gear and crossbar bitmaps.'''
+    if engine == 'envelope':
+        outputGear, inputImageSize = generateGearEnvelope(image, ratio, overlap, steps,
+                                                          canvasPath=canvasPath)
+    elif engine in ('raster', 'swept'):
+        outputGear, inputImageSize = generateGear(image, ratio, overlap, steps, progress,
+                                                  workers=workers, inputMode=inputMode,
+                                                  canvasPath=canvasPath,
+                                                  swept=engine == 'swept')
+    else:
+        raise ValueError("engine must be one of {}, got {!r}".format(ENGINES, engine))
+    outputGear = outputCleanup(outputGear)
+    crossbar = drawCrossbar(inputImageSize*(ratio + 1 - overlap)/2)
+    return outputGear, crossbar
+
+@gear_profile.profiled('write')
+def writeOutputGear(gear, filename):
+    '''Saves a 0/255 bitmap as a grayscale image. PIL reads a uint8 array in
+    place, so a memmap canvas is written without an in-memory copy.'''
+    Image.fromarray(np.asarray(gear, dtype=np.uint8)).save(filename)
+
+# =======================
+# Parameter grid
+# =======================
+
+def gridCombos(ratios, overlaps):
+    '''Every (ratio, overlap) pair of a parameter grid, ratios varying slowest.'''
+    return [(ratio, overlap) for ratio in ratios for overlap in overlaps]
+
+def sweepGridSteps(outputGears, inputCoords, combos, blockSteps, steps, sizes=None,
+                   swept=False):
+    '''sweepSteps for a whole parameter grid: runs the given steps for every
+    (ratio, overlap) in combos, carving into the matching entry of outputGears.
+    inputCoords are the input points at offset (0, 0) (a PointSet or Nx2
+    array). The rotated points are
+    computed once per input axle position and shared by every combination
+    with that axle. sizes is only needed for packed bitmaps. swept carves each
+    point's move between steps (see carveSwept).'''
+    blockSteps = [int(step) for step in blockSteps]
+    gear_profile.count('steps', len(blockSteps))
+    inputCoords = asPointSet(inputCoords)
+    byAxle = {}
+    for index, (ratio, overlap) in enumerate(combos):
+        byAxle.setdefault(float(ratio + 1 - overlap), []).append(index)
+    for axle, indices in byAxle.items():
+        # The largest output gear of the axle sees the most input points
+        reach = max(combos[index][0] for index in indices)
+        rotated = (rotateAboutAxle if swept else turnAboutAxle)(
+            inputCoords.shifted((axle, 0)), blockSteps, axle, steps, reach)
+        for index in indices:
+            (carveSwept if swept else carveRotated)(
+                outputGears[index], rotated, blockSteps, combos[index][0], steps,
+                size=None if sizes is None else sizes[index])
+    return outputGears
+
+def gridMoveSamples(combos, sizes, steps):
+    '''sweptMoveSamples of the combination of a grid with the longest moves.'''
+    return max(sweptMoveSamples(steps, ratio, size) for (ratio, _), size in zip(combos, sizes))
+
+def _gridWorker(start, stop, combos, sizes, steps, memoryBudget, swept=False):
+    '''Sweeps steps start..stop-1 of every combination into bit-packed partial
+    bitmaps and returns them.'''
+    partials = [newPackedCanvas(size) for size in sizes]
+    block = stepsPerBlock(len(_workerCoords), memoryBudget, swept,
+                          gridMoveSamples(combos, sizes, steps))
+    for blockStart in range(start, stop, block):
+        sweepGridSteps(partials, _workerCoords, combos,
+                       range(blockStart, min(blockStart + block, stop)), steps, sizes,
+                       swept)
+    return partials
+
+@gear_profile.profiled('sweep')
+def sweepGrid(outputGears, inputCoords, combos, steps, workers=1, progress=None,
+              memoryBudget=DEFAULT_MEMORY_BUDGET, swept=False):
+    '''Runs the whole sweep for every combination (see sweepGridSteps), block
+    by block, or split by steps across workers processes like sweepParallel.
+    progress, if given, is called as progress(done, steps).'''
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers <= 1:
+        block = stepsPerBlock(len(inputCoords), memoryBudget, swept,
+                              gridMoveSamples(combos, [len(gear) for gear in outputGears], steps))
+        for start in range(0, steps, block):
+            stop = min(start + block, steps)
+            sweepGridSteps(outputGears, inputCoords, combos, range(start, stop), steps,
+                           swept=swept)
+            if progress is not None:
+                progress(stop, steps)
+        asPointSet(inputCoords).releaseCache()
+        return outputGears
+    sizes = [len(gear) for gear in outputGears]
+    shm, initargs = _sharePoints(inputCoords)
+    try:
+        merged = [newPackedCanvas(size) for size in sizes]
+        bounds = np.linspace(0, steps, min(steps, 2*workers) + 1).astype(int)
+        done = 0
+        with ProcessPoolExecutor(max_workers=workers, initializer=_initSweepWorker,
+                                 initargs=initargs) as pool:
+            futures = {pool.submit(_gridWorker, int(start), int(stop), combos, sizes, steps,
+                                   memoryBudget, swept): stop - start
+                       for start, stop in zip(bounds[:-1], bounds[1:]) if stop > start}
+            for future in as_completed(futures):
+                for packed, partial in zip(merged, future.result()):
+                    packed |= partial
+                done += futures[future]
+                if progress is not None:
+                    progress(int(done), steps)
+    finally:
+        shm.close()
+        shm.unlink()
+    gear_profile.count('steps', steps)
+    for gear, packed in zip(outputGears, merged):
+        unpackInto(gear, packed)
+    return outputGears
+
+def generateGrid(image, ratios, overlaps, steps, engine='raster', inputMode='pixels',
+                 workers=1, progress=None, memoryBudget=DEFAULT_MEMORY_BUDGET):
+    '''makeGear for every combination of ratios and overlaps (see gridCombos).
+    Returns a list of (ratio, overlap, outputGear, crossbar) in gridCombos
+    order; each gear is identical to makeGear's for the same parameters.'''
+    return generateCombos(image, gridCombos(ratios, overlaps), steps, engine, inputMode,
+                          workers, progress, memoryBudget)
+
+def generateCombos(image, combos, steps, engine='raster', inputMode='pixels', workers=1,
+                   progress=None, memoryBudget=DEFAULT_MEMORY_BUDGET):
+    '''generateGrid for any list of (ratio, overlap) pairs, sharing the work
+    between them: the input points (or the envelope engine's polar outline)
+    are extracted once, and the raster sweep rotates them once per step and
+    input axle position for all combinations (see sweepGrid).'''
+    if engine == 'envelope':
+        inputRadius, inputImageSize = getPolarOutline(image)
+        gears = []
+        for index, (ratio, overlap) in enumerate(combos):
+            profile = envelopeProfile(inputRadius, ratio, overlap, steps)
+            gears.append(renderProfile(profile, outputGearSize(inputImageSize, ratio), ratio))
+            if progress is not None:
+                progress(index + 1, len(combos))
+    elif engine in ('raster', 'swept'):
+        inputCoords, inputImageSize = getInputCoords(image, (0, 0), inputMode,
+                                                     None if engine == 'swept' else steps)
+        gears = [newCanvas(outputGearSize(inputImageSize, ratio)) for ratio, _ in combos]
+        sweepGrid(gears, inputCoords, combos, steps, workers, progress, memoryBudget,
+                  engine == 'swept')
+    else:
+        raise ValueError("engine must be one of {}, got {!r}".format(ENGINES, engine))
+    return [(ratio, overlap, outputCleanup(gear),
+             drawCrossbar(inputImageSize*(ratio + 1 - overlap)/2))
+            for (ratio, overlap), gear in zip(combos, gears)]
+
+# Height, in pixels, of the label strip under each contact sheet cell.
+SHEET_LABEL_HEIGHT = 20
+
+def contactSheet(results, columns, cellSize=256):
+    '''Lays the gears of a parameter grid (as returned by generateGrid) out on
+    one image, columns to a row, each labelled with its ratio and overlap.
+    All gears are scaled by the same factor, so the largest fills a cellSize
+    cell and relative sizes are kept. Returns a grayscale PIL image.'''
+    rows = -(-len(results) // columns)
+    largest = max(len(gear) for _, _, gear, _ in results)
+    sheet = Image.new('L', (columns*cellSize, rows*(cellSize + SHEET_LABEL_HEIGHT)), 255)
+    draw = ImageDraw.Draw(sheet)
+    for index, (ratio, overlap, gear, _) in enumerate(results):
+        row, col = divmod(index, columns)
+        left = col*cellSize
+        top = row*(cellSize + SHEET_LABEL_HEIGHT)
+        side = max(1, int(round(len(gear)*cellSize/float(largest))))
+        thumb = Image.fromarray(gear).resize((side, side), Image.LANCZOS)
+        sheet.paste(thumb, (left + (cellSize - side)//2, top + (cellSize - side)//2))
+        draw.text((left + 4, top + cellSize + 4),
+                  "ratio {}, overlap {:g}".format(ratio, overlap), fill=0)
+    return sheet
+
+# =======================
+# Gear trains
+# =======================
+
+def trainStages(ratios, overlaps):
+    '''(ratio, overlap) of each gear of a train: one per ratio, with a single
+    overlap shared by all of them or one overlap per ratio.'''
+    if len(overlaps) == 1:
+        overlaps = list(overlaps)*len(ratios)
+    if len(overlaps) != len(ratios):
+        raise ValueError("a gear train needs one overlap, or one per ratio; got {} ratios "
+                         "and {} overlaps".format(len(ratios), len(overlaps)))
+    return list(zip(ratios, overlaps))
+
+# Input points of the train gears generated from earlier gears. Those are
+# filled bitmaps, which 'boundary' sweeps about ten times faster than
+# 'pixels', leaving a few hundred pixels of a 600-pixel gear uncarved (see
+# compareInputModes).
+TRAIN_INPUT_MODE = 'boundary'
+
+def generateTrain(image, stages, steps, engine='raster', inputMode='pixels', workers=1,
+                  progress=None, make=None):
+    '''makeGear for a gear train in one pass: the first gear is generated from
+    image, and every further gear from the gear generated before it, for each
+    (ratio, overlap) in stages (see trainStages). Intermediate gears are
+    passed on as arrays, never written out. The overall ratio is the product
+    of the stage ratios. The first gear sweeps inputMode points, the others
+    TRAIN_INPUT_MODE points. steps None picks autoSteps for each gear's size.
+    make, if given, is called instead of makeGear with the same arguments
+    (e.g. a cached makeGear) and returns the gear and crossbar.
+    progress, if given, is called as progress(done, len(stages)).
+    Returns a list of (ratio, overlap, outputGear, crossbar), one per stage.'''
+    if make is None:
+        make = makeGear
+    results = []
+    for index, (ratio, overlap) in enumerate(stages):
+        outputGear, crossbar = make(image, ratio, overlap, steps or autoSteps(image, engine),
+                                    engine, inputMode if index == 0 else TRAIN_INPUT_MODE,
+                                    workers)
+        results.append((ratio, overlap, outputGear, crossbar))
+        image = outputGear
+        if progress is not None:
+            progress(index + 1, len(stages))
+    return results
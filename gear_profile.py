@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+"""
+pygear profiling
+Opt-in stage timers, counters and events for the generation pipeline.
+
+gear_engine marks its stages (load, getBlackPixels, sweep and the rotate /
+carve work of each sweep block, outputCleanup, drawCrossbar, write) and
+counts points, points kept inside the output gear's radius, pixel writes
+and steps. Nothing is recorded unless a Profiler is enabled:
+
+    profiler = gear_profile.enable()
+    gear_engine.makeGear(image, 2, 1.0, 1000)
+    gear_profile.disable()
+    print(profiler.summary())
+    profiler.write('trace.json', chrome=True)
+
+With no profiler enabled, each hook is a function call and a None check per
+stage or sweep block, never per point. Only the enabling process is
+profiled: sweeps run in worker processes show up as one 'sweep' stage.
+Chrome-format traces open in chrome://tracing or https://ui.perfetto.dev.
+"""
+
+import contextlib
+import functools
+import json
+import os
+import threading
+import time
+
+# The enabled Profiler, or None.
+_active = None
+_NULL_STAGE = contextlib.nullcontext()
+
+class Profiler:
+    '''Records stages (timed spans), instant events and counters, with
+    perf_counter timestamps in seconds. Picklable, so a job run in another
+    process can send its profile back.'''
+
+    def __init__(self, label=None):
+        self.label = label or 'pygear'
+        self.pid = os.getpid()
+        self.start = time.perf_counter()
+        self.spans = []
+        self.events = []
+        self.counters = {}
+
+    @contextlib.contextmanager
+    def stage(self, name, **args):
+        '''Times the enclosed block as one span of stage name.'''
+        begin = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.spans.append((name, begin, time.perf_counter() - begin,
+                               threading.get_ident(), args))
+
+    def count(self, name, value=1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def event(self, name, **args):
+        '''Records an instant event.'''
+        self.events.append((name, time.perf_counter(), threading.get_ident(), args))
+
+    def stageTotals(self):
+        '''{stage: {'calls': n, 'seconds': total}}, in first-seen order.'''
+        totals = {}
+        for name, _, duration, _, _ in self.spans:
+            total = totals.setdefault(name, {'calls': 0, 'seconds': 0.})
+            total['calls'] += 1
+            total['seconds'] += duration
+        return totals
+
+    def summary(self):
+        '''Stage totals and counters, plus the sweep rate in steps per second
+        (over the 'sweep' stage, or its blocks' rotate and carve work).'''
+        stages = self.stageTotals()
+        sweepSeconds = stages.get('sweep', {}).get('seconds')
+        if sweepSeconds is None:
+            sweepSeconds = sum(stages.get(name, {}).get('seconds', 0.)
+                               for name in ('rotate', 'carve'))
+        stepsPerSecond = None
+        if self.counters.get('steps') and sweepSeconds:
+            stepsPerSecond = self.counters['steps']/sweepSeconds
+        return {'label': self.label, 'stages': stages, 'counters': dict(self.counters),
+                'stepsPerSecond': stepsPerSecond}
+
+    def write(self, filename, chrome=False):
+        '''Writes this profile as a JSON trace (see writeTrace).'''
+        return writeTrace([self], filename, chrome)
+
+# =======================
+# Hooks
+# =======================
+
+def enable(profiler=None):
+    '''Starts recording into profiler (a new Profiler by default) and returns it.'''
+    global _active
+    _active = profiler or Profiler()
+    return _active
+
+def disable():
+    '''Stops recording; returns the profiler that was enabled, if any.'''
+    global _active
+    profiler, _active = _active, None
+    return profiler
+
+def active():
+    '''The enabled Profiler, or None. Check it before computing a counter
+    value that costs anything.'''
+    return _active
+
+def stage(name, **args):
+    '''Context manager timing a stage, or a no-op one when profiling is off.'''
+    if _active is None:
+        return _NULL_STAGE
+    return _active.stage(name, **args)
+
+def profiled(name):
+    '''Decorator timing every call of a function as stage name.'''
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if _active is None:
+                return function(*args, **kwargs)
+            with _active.stage(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorate
+
+def count(name, value=1):
+    if _active is not None:
+        _active.count(name, value)
+
+def event(name, **args):
+    if _active is not None:
+        _active.event(name, **args)
+
+# =======================
+# Traces
+# =======================
+
+def traceDict(profilers):
+    '''Plain JSON trace of several profiles (one per job, say): each one's
+    summary plus its spans and events, timed in seconds from the earliest
+    profile's start.'''
+    origin = min(profiler.start for profiler in profilers)
+    profiles = []
+    for profiler in profilers:
+        profile = profiler.summary()
+        profile['pid'] = profiler.pid
+        profile['spans'] = [{'name': name, 'start': begin - origin, 'seconds': duration,
+                             'thread': thread, 'args': args}
+                            for name, begin, duration, thread, args in profiler.spans]
+        profile['events'] = [{'name': name, 'time': when - origin, 'thread': thread,
+                              'args': args}
+                             for name, when, thread, args in profiler.events]
+        profiles.append(profile)
+    return {'profiles': profiles}
+
+def chromeTraceDict(profilers):
+    '''Chrome trace event format of several profiles: a complete event per
+    span, an instant event per event and each profile's final counters,
+    with one process row per profile.'''
+    origin = min(profiler.start for profiler in profilers)
+    events = []
+    for index, profiler in enumerate(profilers):
+        pid = index + 1
+        events.append({'name': 'process_name', 'ph': 'M', 'pid': pid, 'tid': 0,
+                       'args': {'name': profiler.label}})
+        end = profiler.start
+        for name, begin, duration, thread, args in profiler.spans:
+            events.append({'name': name, 'ph': 'X', 'pid': pid, 'tid': thread,
+                           'ts': (begin - origin)*1e6, 'dur': duration*1e6, 'args': args})
+            end = max(end, begin + duration)
+        for name, when, thread, args in profiler.events:
+            events.append({'name': name, 'ph': 'i', 's': 't', 'pid': pid, 'tid': thread,
+                           'ts': (when - origin)*1e6, 'args': args})
+        if profiler.counters:
+            events.append({'name': 'counters', 'ph': 'C', 'pid': pid, 'tid': 0,
+                           'ts': (end - origin)*1e6, 'args': dict(profiler.counters)})
+    return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+def writeTrace(profilers, filename, chrome=False):
+    '''Writes profiles as a plain JSON trace (see traceDict) or, with chrome,
+    in Chrome trace event format (see chromeTraceDict).'''
+    trace = chromeTraceDict(profilers) if chrome else traceDict(profilers)
+    with open(filename, 'w') as fp:
+        json.dump(trace, fp, indent=None if chrome else 1, default=str)
+    return filename
@@ -0,0 +1,244 @@
+# -*- coding: utf-8 -*-
+"""
+pygear vector export
+Writes the generated gear and its crossbar as SVG or DXF cut files in real
+units (millimetres), for laser cutting without tracing the PNGs by hand.
+
+The gear outline is traced from the output bitmap with marching squares
+(gear_engine.traceContours) and simplified with Douglas-Peucker to within a
+tolerance, so files stay small however many steps the gear was swept with.
+Axle holes and the crossbar (the slot-shaped bar holding the two axles, as
+drawn by gear_engine.drawCrossbar) are written as exact circles, lines and
+arcs.
+
+Shapes are kept in pixels (y down) as tuples:
+    ('loop', Nx2 array of x, y points)      closed polyline
+    ('circle', (x, y), radius)
+    ('slot', (x1, y1), (x2, y2), radius)    two half circles joined by lines
+"""
+
+import math
+import os
+
+import numpy as np
+
+import gear_engine
+
+# Largest distance, in pixels, a simplified outline strays from the traced one.
+DEFAULT_TOLERANCE = 0.5
+# Outline loops enclosing less than this many pixels (stray specks) are dropped.
+DEFAULT_MIN_AREA = 16
+# Millimetres per pixel of the input gear image, unless set otherwise.
+DEFAULT_MM_PER_PIXEL = 0.1
+
+VECTOR_FORMATS = ('svg', 'dxf')
+
+# =======================
+# Outline simplification
+# =======================
+
+def simplifyPolyline(points, tolerance=DEFAULT_TOLERANCE):
+    '''Douglas-Peucker: keeps the fewest points of an open polyline (Nx2
+    array) such that no dropped point is farther than tolerance from the
+    simplified polyline. Both end points are kept.'''
+    points = np.asarray(points, dtype=np.float64)
+    keep = np.zeros(len(points), dtype=bool)
+    keep[[0, -1]] = True
+    pending = [(0, len(points) - 1)]
+    while pending:
+        first, last = pending.pop()
+        if last - first < 2:
+            continue
+        start = points[first]
+        chord = points[last] - start
+        between = points[first + 1:last] - start
+        length = math.hypot(chord[0], chord[1])
+        if length == 0:
+            distance = np.hypot(between[:, 0], between[:, 1])
+        else:
+            # To the chord, not its line: points past an end are measured to it
+            t = np.clip((between[:, 0]*chord[0] + between[:, 1]*chord[1])/(length*length), 0, 1)
+            distance = np.hypot(between[:, 0] - t*chord[0], between[:, 1] - t*chord[1])
+        farthest = int(np.argmax(distance))
+        if distance[farthest] > tolerance:
+            split = first + 1 + farthest
+            keep[split] = True
+            pending.append((first, split))
+            pending.append((split, last))
+    return points[keep]
+
+def simplifyLoop(points, tolerance=DEFAULT_TOLERANCE):
+    '''simplifyPolyline for a closed loop (first point not repeated at the
+    end): split at the point farthest from the first, simplify both halves.'''
+    points = np.asarray(points, dtype=np.float64)
+    if len(points) < 4:
+        return points
+    offsets = points - points[0]
+    split = int(np.argmax(offsets[:, 0]**2 + offsets[:, 1]**2))
+    if split == 0:
+        return points[:1]
+    first = simplifyPolyline(points[:split + 1], tolerance)
+    second = simplifyPolyline(np.vstack((points[split:], points[:1])), tolerance)
+    return np.vstack((first[:-1], second[:-1]))
+
+def loopArea(points):
+    '''Area enclosed by a closed loop (shoelace formula), in square pixels.'''
+    x, y = points[:, 0], points[:, 1]
+    return 0.5*abs(np.dot(x, np.roll(y, -1)) - np.dot(y, np.roll(x, -1)))
+
+# =======================
+# Shapes
+# =======================
+
+def markRadius(size):
+    '''Radius, in pixels, of the center marks and axle holes the bitmaps draw
+    for a gear (or crossbar distance) of size pixels.'''
+    return max(2., size/200.)
+
+def gearShapes(outputGear, tolerance=DEFAULT_TOLERANCE, minArea=DEFAULT_MIN_AREA,
+               holeRadius=None):
+    '''Cut shapes of a cleaned output gear bitmap (black = gear): its
+    simplified outline loops, holes included, and a round axle hole of
+    holeRadius pixels (by default the size of outputCleanup's center mark)
+    in place of the mark. Coordinates are pixels from the gear's axle.'''
+    gear = np.asarray(outputGear) == 0
+    size = len(gear)
+    center = (size - 1)/2.
+    if holeRadius is None:
+        holeRadius = markRadius(size)
+    # Fill in the dotted center mark; the exact hole replaces it
+    reach = int(math.ceil(markRadius(size) + 2))
+    low, high = max(0, int(center) - reach), min(size, int(center) + reach + 2)
+    row, col = np.ogrid[low:high, low:high]
+    gear[low:high, low:high] |= np.hypot(row - center, col - center) <= markRadius(size) + 1.5
+    shapes = []
+    for contour in gear_engine.traceContours(gear):
+        # Specks are dropped before simplifying: there can be thousands
+        if len(contour) < 4 or loopArea(contour) < minArea:
+            continue
+        loop = simplifyLoop(contour[:, ::-1] - center, tolerance)
+        if len(loop) >= 3:
+            shapes.append(('loop', loop))
+    shapes.append(('circle', (0., 0.), holeRadius))
+    return shapes
+
+def crossbarShapes(distance, holeRadius=None):
+    '''Cut shapes of the crossbar drawn by gear_engine.drawCrossbar for axles
+    distance pixels apart: the slot-shaped bar and its two axle holes.
+    Coordinates are pixels from the first (input gear) axle. Unlike the
+    bitmap, distance is not rounded to whole pixels.'''
+    if holeRadius is None:
+        holeRadius = markRadius(distance)
+    barRadius = int(round(distance/6.))/2. - 0.5
+    return [('slot', (0., 0.), (distance, 0.), barRadius),
+            ('circle', (0., 0.), holeRadius),
+            ('circle', (distance, 0.), holeRadius)]
+
+def shapeBounds(shapes):
+    '''(left, top, right, bottom) of shapes, in pixels.'''
+    points = []
+    for shape in shapes:
+        if shape[0] == 'loop':
+            points.append(shape[1])
+        elif shape[0] == 'circle':
+            (x, y), radius = shape[1], shape[2]
+            points.append(np.array([[x - radius, y - radius], [x + radius, y + radius]]))
+        else:
+            (x1, y1), (x2, y2), radius = shape[1], shape[2], shape[3]
+            points.append(np.array([[min(x1, x2) - radius, min(y1, y2) - radius],
+                                    [max(x1, x2) + radius, max(y1, y2) + radius]]))
+    points = np.vstack(points)
+    return tuple(points.min(axis=0)) + tuple(points.max(axis=0))
+
+# =======================
+# Writers
+# =======================
+
+def _number(value):
+    return '{:.3f}'.format(value).rstrip('0').rstrip('.')
+
+def writeSvg(shapes, filename, mmPerPixel=DEFAULT_MM_PER_PIXEL, margin=1.):
+    '''Writes shapes as an SVG of hairline cut paths, sized in millimetres
+    (mmPerPixel per pixel) with margin millimetres around them.'''
+    left, top, right, bottom = shapeBounds(shapes)
+    left, top = left*mmPerPixel - margin, top*mmPerPixel - margin
+    width = right*mmPerPixel + margin - left
+    height = bottom*mmPerPixel + margin - top
+    paths = []
+    for shape in shapes:
+        if shape[0] == 'loop':
+            points = shape[1]*mmPerPixel
+            coords = ' '.join('{},{}'.format(_number(x), _number(y)) for x, y in points)
+            paths.append('M{}Z'.format(coords))
+        elif shape[0] == 'circle':
+            (x, y), r = (shape[1][0]*mmPerPixel, shape[1][1]*mmPerPixel), shape[2]*mmPerPixel
+            paths.append('M{},{}A{r},{r} 0 1 0 {},{}A{r},{r} 0 1 0 {},{}Z'.format(
+                _number(x - r), _number(y), _number(x + r), _number(y), _number(x - r),
+                _number(y), r=_number(r)))
+        else:
+            (x1, y1), (x2, y2) = shape[1], shape[2]
+            x1, y1, x2, y2 = (value*mmPerPixel for value in (x1, y1, x2, y2))
+            r = shape[3]*mmPerPixel
+            paths.append('M{},{}L{},{}A{r},{r} 0 0 1 {},{}L{},{}A{r},{r} 0 0 1 {},{}Z'.format(
+                _number(x1), _number(y1 - r), _number(x2), _number(y2 - r), _number(x2),
+                _number(y2 + r), _number(x1), _number(y1 + r), _number(x1), _number(y1 - r),
+                r=_number(r)))
+    with open(filename, 'w') as fp:
+        fp.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+                 '<svg xmlns="http://www.w3.org/2000/svg" width="{w}mm" height="{h}mm" '
+                 'viewBox="{x} {y} {w} {h}">\n'.format(x=_number(left), y=_number(top),
+                                                       w=_number(width), h=_number(height)))
+        for path in paths:
+            fp.write('<path fill="none" stroke="black" stroke-width="0.1" d="{}"/>\n'.format(path))
+        fp.write('</svg>\n')
+    return filename
+
+def writeDxf(shapes, filename, mmPerPixel=DEFAULT_MM_PER_PIXEL):
+    '''Writes shapes as an R12 DXF in millimetres (mmPerPixel per pixel):
+    closed POLYLINEs for loops, CIRCLEs, and LINEs plus ARCs for slots.
+    DXF's y axis points up, so the drawing is flipped to match the PNGs.'''
+    lines = ['0', 'SECTION', '2', 'HEADER', '9', '$ACADVER', '1', 'AC1009',
+             '9', '$INSUNITS', '70', '4', '0', 'ENDSEC', '0', 'SECTION', '2', 'ENTITIES']
+
+    def point(x, y, code=10):
+        return [str(code), _number(x*mmPerPixel), str(code + 10), _number(-y*mmPerPixel),
+                str(code + 20), '0']
+
+    for shape in shapes:
+        if shape[0] == 'loop':
+            lines += ['0', 'POLYLINE', '8', 'CUT', '66', '1', '70', '1'] + point(0, 0)
+            for x, y in shape[1]:
+                lines += ['0', 'VERTEX', '8', 'CUT'] + point(x, y)
+            lines += ['0', 'SEQEND', '8', 'CUT']
+        elif shape[0] == 'circle':
+            lines += (['0', 'CIRCLE', '8', 'CUT'] + point(*shape[1])
+                      + ['40', _number(shape[2]*mmPerPixel)])
+        else:
+            (x1, y1), (x2, y2), r = shape[1], shape[2], shape[3]
+            # Slot along x: flat sides at y -/+ r, half circles at both ends
+            lines += ['0', 'LINE', '8', 'CUT'] + point(x1, y1 - r) + point(x2, y2 - r, 11)
+            lines += ['0', 'LINE', '8', 'CUT'] + point(x1, y1 + r) + point(x2, y2 + r, 11)
+            lines += (['0', 'ARC', '8', 'CUT'] + point(x1, y1)
+                      + ['40', _number(r*mmPerPixel), '50', '90', '51', '270'])
+            lines += (['0', 'ARC', '8', 'CUT'] + point(x2, y2)
+                      + ['40', _number(r*mmPerPixel), '50', '270', '51', '90'])
+    lines += ['0', 'ENDSEC', '0', 'EOF']
+    with open(filename, 'w') as fp:
+        fp.write('\n'.join(lines) + '\n')
+    return filename
+
+def writeShapes(shapes, filename, mmPerPixel=DEFAULT_MM_PER_PIXEL):
+    '''Writes shapes as SVG or DXF, by filename extension.'''
+    if os.path.splitext(filename)[1].lower() == '.dxf':
+        return writeDxf(shapes, filename, mmPerPixel)
+    return writeSvg(shapes, filename, mmPerPixel)
+
+def exportVectors(outputGear, inputImageSize, ratio, overlap, gearFile, crossbarFile,
+                  mmPerPixel=DEFAULT_MM_PER_PIXEL, tolerance=DEFAULT_TOLERANCE):
+    '''Writes the gear and crossbar cut files (SVG or DXF by extension) for an
+    output gear generated from an input image of inputImageSize pixels, with
+    the same axle distance as makeGear's crossbar bitmap (unrounded).'''
+    distance = inputImageSize*(ratio + 1 - overlap)/2.
+    writeShapes(gearShapes(outputGear, tolerance), gearFile, mmPerPixel)
+    writeShapes(crossbarShapes(distance), crossbarFile, mmPerPixel)
+    return gearFile, crossbarFile
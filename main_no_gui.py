@@ -14,7 +14,8 @@ Add a GUI?
 '''IMPORTANT PARAMETERS'''
 ''''''''''''''''''''''''''
 # Define the gear ratio, which is the number of rotations the input gear com-
-# pletes for each one rotation of the output gear. Must be a positive integer.
+# pletes for each one rotation of the output gear. Must be positive; fractions
+# such as 1.5 (3 turns for every 2 of the output gear) are allowed.
 gearRatio = 2
 
 # Define the gear overlap. This should be a decimal value between 0 and 1.
@@ -24,154 +25,89 @@ gearOverlap = 1.0
 
 # Define the number of computation steps. This is how many tiny rotations the
 # program performs to compute the final bitmap. Higher numbers produce better
-# gear profiles, with a tradeoff in speed. Must be an integer.
+# gear profiles, with a tradeoff in speed. Must be an integer, or 'auto' to
+# pick the fewest steps that give clean edges for the image size and engine.
 computationSteps = 1000
 
+# Define the number of worker processes for the computation. 1 runs it in this
+# process; None uses every CPU core.
+computationWorkers = 1
+
+# Define which input pixels are swept. 'pixels' uses every black pixel,
+# 'boundary' only the edge band of the black region (much faster for filled or
+# thick drawings, but can differ from 'pixels' by a few output pixels; see
+# verifyInputMode), 'outline' a resampled polyline of the outline.
+inputMode = 'pixels'
+
+# Set to True to also run the full-pixel sweep and print how many output
+# pixels differ from the inputMode result.
+verifyInputMode = False
+
+# Define the computation engine. 'raster' carves the output bitmap pixel by
+# pixel; 'swept' does too, but carves each point's whole move from one step to
+# the next, so a few hundred steps give the edges 'raster' needs thousands for;
+# 'envelope' computes the output gear outline as a radius per angle
+# (much faster and lighter, but assumes both gears are star-shaped, i.e. every
+# ray from the axle crosses the outline once).
+computationEngine = 'raster'
+
+# Path of a scratch file to hold the output bitmap on disk (np.memmap) instead
+# of in RAM, for gears too large to fit in memory. None keeps it in RAM.
+outputCanvasFile = None
+
+# Define the gray level at or below which input pixels count as black. 0 only
+# keeps pure black; raise it (e.g. to 127) for anti-aliased screenshots.
+blackThreshold = 0
+
+# Define the largest input image side in pixels; bigger images are downscaled
+# before processing. None keeps the full resolution.
+maxInputSize = None
+
+# Path of a JSON trace of the run's stage timings and counters (see
+# gear_profile.py), or None to not profile. chromeTrace writes it in Chrome
+# trace format, for chrome://tracing or ui.perfetto.dev.
+profileTrace = None
+chromeTrace = False
+
 ''''''''''''''''''''''''''
 '''   END PARAMETERS   '''
 ''''''''''''''''''''''''''
 
-from PIL import Image
-import numpy as np
 from tkinter import filedialog as tkFileDialog
+import gear_profile
+from gear_engine import (autoSteps, compareInputModes, makeGear, parseSteps, readGearImage,
+                         writeOutputGear)
 
 def loadGearImage():
     '''Loads image, converts to a B/W array.'''
     filename = tkFileDialog.askopenfilename()
-    img = Image.open(filename)
-    img.load()
-    data = np.asarray(img)
-    # Convert to a 2-D array
-    newArray = np.array([[np.median(j) for j in i] for i in data])
-    return newArray
-
-def getBlackPixels(image, offset):
-    '''Get the location of black pixels (zeros in an array).
-       Scales result to [-1, 1] and then adds an offset.'''
-    rows = len(image)
-    cols = len(image[0])
-    size = max([rows, cols])
-    scale = 2./size
-    coords =  []
-    for row in range(rows):
-        for col in range(cols):
-            if image[row][col] == 0:
-                x = scale*(col - (cols-1)/2.) + offset[0]
-                y = scale*(row - (rows-1)/2.) + offset[1]
-                coords += [(x, y)]
-    return coords, size
-
-def outputGearImage(image, coords, size, ratio):
-    '''Draws coordinates as pixels on image'''
-    newImage = image
-    for (x,y) in coords:
-        row = int(np.floor((y+ratio)*size/(2*ratio)))
-        col = int(np.floor((x+ratio)*size/(2*ratio)))
-        try:
-            newImage[row][col] = 255.0
-        except:
-            pass
-    return newImage
-    
-
-def rotatePts(points, axis, theta):
-    '''rotates all coordinates in an array by angle theta, around axis'''
-#    centered = [(x-axis[0], y-axis[1]) for (x,y) in points]
-#    rotated = [(x*np.cos(theta)-y*np.sin(theta), x*np.sin(theta)+y*np.cos(theta)) for (x,y) in centered]
-#    uncentered = [(x+axis[0], y+axis[1]) for (x,y) in rotated]
-    uncentered = [(((x - axis[0])*np.cos(theta) - (y - axis[1])*np.sin(theta)) + axis[0], ((x - axis[0])*np.sin(theta) + (y-axis[1])*np.cos(theta)) + axis[1]) for (x,y) in points]
-    return uncentered
-
-def writeOutputGear(gear,filename):
-    img = Image.fromarray(gear)
-    img = img.convert('RGB')
-    img.save(filename)
-    return None
-
-def dist(x, y):
-    return np.sqrt(x*x+y*y)
-
-def outputCleanup(image):
-    '''Remove the 'halo' around output image; adds a mark indicating the center
-    TODO: maybe apply median filter?'''
-    newImage = image
-    size = len(image) # Should be same number of rows/columns
-    radius = size/2.
-    for row in range(size):
-        for col in range(size):
-            if dist(row-radius, col-radius) >= radius-.5:
-                newImage[row][col] = 255.0
-    # Mark the center
-    markRadius = np.max([2., size/200.]) # How big to make the mark
-    for i in range(50):
-        theta = i*2*np.pi/50
-        x = int(np.round(radius + markRadius*np.cos(theta)))
-        y = int(np.round(radius + markRadius*np.sin(theta)))
-        newImage[y][x] = 255.0
-    return newImage
-
-def drawCrossbar(distance):
-    distance = int(distance) # just in case
-    '''Draws the image of the crossbar that holds the two gear axles'''
-    # Size of the image:
-    height = int(np.round(distance/6.))
-    width = int(np.ceil(distance*7./6))
-    # Coordinates of the axle holes' centers:
-    radius = height/2. - 0.5
-    holeOne = (radius, radius)
-    holeTwo = (distance+radius, radius)
-    # Draw the crossbar:
-    crossbarImage = 255.0*np.ones((height, width))
-    crossbarImage[(0, height-1), int(np.ceil(holeOne[0])):int(np.floor(holeTwo[0])+1)] = 0.
-    for i in range(distance):
-        theta = np.pi*i/distance - np.pi/2
-        rows = (int(np.round(holeOne[1] - radius*np.sin(theta))), int(np.round(holeTwo[1] + radius*np.sin(theta))))
-        cols = (int(np.round(holeOne[0] - radius*np.cos(theta))), int(np.round(holeTwo[0] + radius*np.cos(theta))))
-        crossbarImage[rows, cols] = 0.0
-    # Draw crossbar holes
-    markRadius = np.max([2., distance/200.]) # How big to make the mark
-    for i in range(50):
-        theta = i*2*np.pi/50
-        x = int(np.round(holeOne[0] + markRadius*np.cos(theta)))
-        y = int(np.round(holeOne[1] + markRadius*np.sin(theta)))
-        crossbarImage[y][x] = 0.
-        crossbarImage[y][x+distance] = 0.
-    return crossbarImage
-        
-
-def doThings(ratio=gearRatio, overlap=gearOverlap, steps=computationSteps):
+    return readGearImage(filename, blackThreshold, maxInputSize)[0]
+
+def doThings(ratio=gearRatio, overlap=gearOverlap, steps=computationSteps,
+             workers=computationWorkers, mode=inputMode, verify=verifyInputMode,
+             engine=computationEngine, canvasFile=outputCanvasFile, trace=profileTrace):
+    if trace:
+        gear_profile.enable()
     inputGear = loadGearImage()
-    offset = (ratio+1-overlap, 0)
-    inputCoords, inputImageSize = getBlackPixels(inputGear, offset)
-    outputImageSize = inputImageSize*ratio
-    outputGear = np.zeros([outputImageSize, outputImageSize])
-    theta = 2*np.pi/steps
-    phi = 2*np.pi/(steps*ratio)
-    # Rotation math
-    for step in range(steps):
-        coords = rotatePts(inputCoords, offset, theta*step)
-        addPoints = []
-        for coord in coords:
-            if dist(*coord)<ratio:
-                addPoints += [coord]
-        # Rotate the points that contribute to the output gear's profile
-        for extraRotation in range(ratio):
-            rotateBy = phi*step + 2*np.pi*extraRotation/ratio
-            addPointsRot = rotatePts(addPoints, (0,0), rotateBy)
-            # Convert those points into pixels, draw on output gear
-            outputGear = outputGearImage(outputGear, addPointsRot, outputImageSize, ratio)
+    steps = parseSteps(steps) or autoSteps(inputGear, engine)
+    def progress(step, steps):
         print('Progress: {}/{}'.format(step, steps)) # Debug
-    # Clean up image
-    outputGear = outputCleanup(outputGear)
+    # Sweep, clean up image and draw the crossbar
+    outputGear, crossbar = makeGear(inputGear, ratio, overlap, steps, engine, mode,
+                                    workers, canvasFile, progress)
+    if verify and engine == 'raster':
+        mismatch = compareInputModes(inputGear, ratio, overlap, steps, mode, workers)
+        print('{} input vs. all black pixels: {} output pixels differ'.format(mode, mismatch))
     # Should also make little marks for centroids and distances
     # Animate?
     # Save image
     outFilename = tkFileDialog.asksaveasfilename(defaultextension='.png', initialfile='gear_output')
     writeOutputGear(outputGear, outFilename)
     # save the crossbar image too
-    crossbar = drawCrossbar(inputImageSize*(ratio+1-overlap)/2)
     outFilename = tkFileDialog.asksaveasfilename(defaultextension='.png', initialfile='crossbar')
     writeOutputGear(crossbar, outFilename)
+    if trace:
+        print(gear_profile.disable().write(trace, chromeTrace))
     #return inputGear, outputGear
  
 if __name__ == '__main__':
@@ -0,0 +1,479 @@
+# -*- coding: utf-8 -*-
+"""
+pygear batch CLI
+Generates gears (and their crossbars) for many input images without any Tk
+dialogs, for unattended runs on render servers. tkinter is never imported.
+
+Example:
+    python pygear_cli.py drawings/*.png --ratio 2 --overlap 1.0 --steps 1000 -o out
+
+For every input image <name>.png this writes <name>_gear.png and
+<name>_crossbar.png to the output directory and prints per-job timings.
+
+Given several ratios and/or overlaps, every combination is generated instead:
+    python pygear_cli.py drawing.png --ratio 1 2 3 --overlap 0.5 0.75 1.0 -o out
+writes <name>_r<ratio>_o<overlap>_gear.png (and _crossbar.png) for each one,
+plus a contact sheet <name>_sheet.png with all the gears side by side.
+
+With --train, the ratios instead chain into a gear train: each gear is
+generated from the one before it, in memory, and written as
+<name>_g<n>_gear.png (and _crossbar.png), n counting from 1:
+    python pygear_cli.py drawing.png --train --ratio 2 3/2 --overlap 1.0 -o out
+
+--engine swept carves each point's whole move between steps, so a few
+hundred steps give the edges the raster engine needs thousands for, and
+--steps auto picks the step count from the input size and engine:
+    python pygear_cli.py drawings/*.png --engine swept --steps auto -o out
+
+--vector svg dxf also writes the gear and crossbar as cut files next to the
+PNGs (<name>_gear.svg, ...), in millimetres at --mm-per-pixel.
+"""
+
+import argparse
+import functools
+import glob
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import gear_analysis
+import gear_cache
+import gear_engine
+import gear_profile
+import gear_vector
+
+# =======================
+# Jobs
+# =======================
+
+def expandInputs(patterns):
+    '''Expands glob patterns into a sorted list of unique files. Plain paths are
+    kept as given, so a missing file is reported as a failed job.'''
+    paths = []
+    for pattern in patterns:
+        if glob.has_magic(pattern):
+            paths.extend(path for path in glob.glob(pattern) if os.path.isfile(path))
+        else:
+            paths.append(pattern)
+    return sorted(set(paths))
+
+def outputStem(inputPath):
+    '''File name stem all of inputPath's output files start with.'''
+    return os.path.splitext(os.path.basename(inputPath))[0]
+
+def stemCollisions(inputPaths):
+    '''Groups (lists) of input paths whose outputs would overwrite each other:
+    output names only keep the file name stem (compared case-insensitively,
+    as on macOS and Windows file systems), so a/gear.png and b/gear.png both
+    write gear_gear.png.'''
+    byStem = {}
+    for path in inputPaths:
+        byStem.setdefault(outputStem(path).casefold(), []).append(path)
+    return [paths for paths in byStem.values() if len(paths) > 1]
+
+def outputPaths(inputPath, outputDir):
+    '''Gear and crossbar PNG paths written for inputPath.'''
+    stem = outputStem(inputPath)
+    return (os.path.join(outputDir, stem + '_gear.png'),
+            os.path.join(outputDir, stem + '_crossbar.png'))
+
+def runJob(inputPath, outputDir, settings):
+    '''Generates and writes the gear and crossbar for one input image.
+    settings holds the makeGear / readGearImage keyword arguments.
+    Returns the input path and a dict of stage timings in seconds.'''
+    timings = {}
+    start = time.perf_counter()
+    image, _ = gear_engine.readGearImage(inputPath, settings['threshold'],
+                                         settings['maxSize'])
+    timings['load'] = time.perf_counter() - start
+
+    overlap = settings['overlap']
+    if settings['autoOverlap'] is not None:
+        mark = time.perf_counter()
+        search = gear_analysis.autoOverlap(image, settings['ratio'], settings['autoOverlap'])
+        overlap = search['overlap']
+        timings['overlap'] = overlap
+        timings['overlapGap'] = search['maxGap']
+        timings['overlapFound'] = search['maxGap'] <= settings['autoOverlap']
+        timings['search'] = time.perf_counter() - mark
+
+    mark = time.perf_counter()
+    steps = settings['steps'] or gear_engine.autoSteps(image, settings['engine'])
+    args = (image, settings['ratio'], overlap, steps,
+            settings['engine'], settings['inputMode'], settings['workers'])
+    canvasPath = canvasFile(inputPath, settings['canvasDir'])
+    if settings['cacheDir'] is None:
+        outputGear, crossbar = gear_engine.makeGear(*args, canvasPath=canvasPath)
+        timings['cached'] = False
+    else:
+        cache = gear_cache.GearCache(settings['cacheDir'], settings['cacheBytes'])
+        outputGear, crossbar, timings['cached'] = gear_cache.cachedMakeGear(
+            *args, cache=cache, canvasPath=canvasPath)
+    timings['generate'] = time.perf_counter() - mark
+
+    mark = time.perf_counter()
+    gearPath, crossbarPath = outputPaths(inputPath, outputDir)
+    gear_engine.writeOutputGear(outputGear, gearPath)
+    gear_engine.writeOutputGear(crossbar, crossbarPath)
+    writeVectors(image, settings['ratio'], overlap, outputGear, gearPath, crossbarPath, settings)
+    timings['write'] = time.perf_counter() - mark
+
+    if settings['verifyInputMode']:
+        mark = time.perf_counter()
+        timings['inputModeDiff'] = gear_engine.compareInputModes(
+            image, settings['ratio'], overlap, steps, settings['inputMode'], settings['workers'])
+        timings['verify'] = time.perf_counter() - mark
+
+    if settings['checkMesh']:
+        mark = time.perf_counter()
+        report = gear_analysis.meshReport(image, outputGear, settings['ratio'], overlap)
+        gear_analysis.writeMeshReport(report, meshPath(inputPath, outputDir))
+        timings['meshPassed'] = report['summary']['passed']
+        timings['mesh'] = time.perf_counter() - mark
+    del outputGear
+    if canvasPath is not None and os.path.exists(canvasPath):
+        os.remove(canvasPath)
+    timings['total'] = time.perf_counter() - start
+    return inputPath, timings
+
+def canvasFile(inputPath, canvasDir):
+    '''Disk file the output bitmap of inputPath is built in, or None to build
+    it in memory (canvasDir None).'''
+    if canvasDir is None:
+        return None
+    return os.path.join(canvasDir, outputStem(inputPath) + '_gear.canvas')
+
+def writeVectors(image, ratio, overlap, outputGear, gearPath, crossbarPath, settings):
+    '''Writes the gear and crossbar cut files in each of settings['vector']
+    formats next to their PNGs (see gear_vector.exportVectors).'''
+    for kind in settings['vector']:
+        gear_vector.exportVectors(outputGear, max(image.shape), ratio, overlap,
+                                  os.path.splitext(gearPath)[0] + '.' + kind,
+                                  os.path.splitext(crossbarPath)[0] + '.' + kind,
+                                  settings['mmPerPixel'])
+
+def meshPath(inputPath, outputDir):
+    stem = outputStem(inputPath)
+    return os.path.join(outputDir, stem + '_mesh.csv')
+
+def gridPaths(inputPath, outputDir, ratio, overlap):
+    '''Gear and crossbar PNG paths written for one combination of a grid.'''
+    stem = outputStem(inputPath)
+    ratio = gear_engine.formatRatio(ratio).replace('/', '-')
+    return outputPaths('{}_r{}_o{:g}.png'.format(stem, ratio, overlap), outputDir)
+
+def trainPaths(inputPath, outputDir, stage):
+    '''Gear and crossbar PNG paths written for gear stage (from 1) of a train.'''
+    stem = outputStem(inputPath)
+    return outputPaths('{}_g{}.png'.format(stem, stage), outputDir)
+
+def sheetPath(inputPath, outputDir):
+    stem = outputStem(inputPath)
+    return os.path.join(outputDir, stem + '_sheet.png')
+
+def runGrid(inputPath, outputDir, settings):
+    '''Generates every combination of settings['ratios'] and
+    settings['overlaps'] for one input image (see gear_engine.generateGrid),
+    writes their gears and crossbars and a contact sheet of the gears.
+    Combinations found in the cache are not regenerated.
+    Returns the input path and a dict of stage timings in seconds.'''
+    timings = {}
+    start = time.perf_counter()
+    image, _ = gear_engine.readGearImage(inputPath, settings['threshold'],
+                                         settings['maxSize'])
+    timings['load'] = time.perf_counter() - start
+
+    mark = time.perf_counter()
+    steps = settings['steps'] or gear_engine.autoSteps(image, settings['engine'])
+    combos = gear_engine.gridCombos(settings['ratios'], settings['overlaps'])
+    cache = None
+    if settings['cacheDir'] is not None:
+        cache = gear_cache.GearCache(settings['cacheDir'], settings['cacheBytes'])
+    found = {}
+    if cache is not None:
+        for ratio, overlap in combos:
+            key = cache.key(image, **gear_cache.jobParams(ratio, overlap, steps,
+                                                          settings['engine'],
+                                                          settings['inputMode']))
+            hit = cache.get(key)
+            if hit is not None:
+                found[ratio, overlap] = hit[:2]
+    missing = [combo for combo in combos if combo not in found]
+    if missing:
+        for ratio, overlap, outputGear, crossbar in gear_engine.generateCombos(
+                image, missing, steps, settings['engine'], settings['inputMode'],
+                settings['workers']):
+            found[ratio, overlap] = (outputGear, crossbar)
+            if cache is not None:
+                params = gear_cache.jobParams(ratio, overlap, steps,
+                                              settings['engine'], settings['inputMode'])
+                cache.put(cache.key(image, **params), outputGear, crossbar, params)
+    results = [(ratio, overlap) + found[ratio, overlap] for ratio, overlap in combos]
+    timings['cached'] = '{}/{}'.format(len(combos) - len(missing), len(combos))
+    timings['generate'] = time.perf_counter() - mark
+
+    mark = time.perf_counter()
+    for ratio, overlap, outputGear, crossbar in results:
+        gearPath, crossbarPath = gridPaths(inputPath, outputDir, ratio, overlap)
+        gear_engine.writeOutputGear(outputGear, gearPath)
+        gear_engine.writeOutputGear(crossbar, crossbarPath)
+        writeVectors(image, ratio, overlap, outputGear, gearPath, crossbarPath, settings)
+    gear_engine.contactSheet(results, len(settings['overlaps'])).save(
+        sheetPath(inputPath, outputDir))
+    timings['write'] = time.perf_counter() - mark
+    timings['total'] = time.perf_counter() - start
+    return inputPath, timings
+
+def runTrain(inputPath, outputDir, settings):
+    '''Generates the gear train settings['stages'] for one input image (see
+    gear_engine.generateTrain), each gear from the one before it, and writes
+    every gear and crossbar. Gears found in the cache are not regenerated.
+    Returns the input path and a dict of stage timings in seconds.'''
+    timings = {}
+    start = time.perf_counter()
+    image, _ = gear_engine.readGearImage(inputPath, settings['threshold'],
+                                         settings['maxSize'])
+    timings['load'] = time.perf_counter() - start
+
+    mark = time.perf_counter()
+    make = None
+    hits = []
+    if settings['cacheDir'] is not None:
+        cache = gear_cache.GearCache(settings['cacheDir'], settings['cacheBytes'])
+        make = functools.partial(_cachedTrainGear, cache=cache, hits=hits)
+    results = gear_engine.generateTrain(image, settings['stages'], settings['steps'],
+                                        settings['engine'], settings['inputMode'],
+                                        settings['workers'], make=make)
+    timings['cached'] = '{}/{}'.format(sum(hits), len(results))
+    timings['generate'] = time.perf_counter() - mark
+
+    mark = time.perf_counter()
+    stageInputs = [image] + [outputGear for _, _, outputGear, _ in results[:-1]]
+    for stage, (stageInput, (ratio, overlap, outputGear, crossbar)) in enumerate(
+            zip(stageInputs, results), 1):
+        gearPath, crossbarPath = trainPaths(inputPath, outputDir, stage)
+        gear_engine.writeOutputGear(outputGear, gearPath)
+        gear_engine.writeOutputGear(crossbar, crossbarPath)
+        writeVectors(stageInput, ratio, overlap, outputGear, gearPath, crossbarPath, settings)
+    timings['write'] = time.perf_counter() - mark
+    timings['total'] = time.perf_counter() - start
+    return inputPath, timings
+
+def _cachedTrainGear(*args, cache, hits):
+    '''gear_cache.cachedMakeGear as generateTrain's make: appends whether the
+    gear came from the cache to hits.'''
+    outputGear, crossbar, hit = gear_cache.cachedMakeGear(*args, cache=cache)
+    hits.append(hit)
+    return outputGear, crossbar
+
+def formatTimings(inputPath, timings):
+    search = ''
+    if 'search' in timings:
+        search = ', overlap {:.3f} in {:.2f}s'.format(timings['overlap'], timings['search'])
+        if not timings['overlapFound']:
+            search += ' (NO FIT: widest gap {:.1f} px)'.format(timings['overlapGap'])
+    cached = timings['cached']
+    if isinstance(cached, str):
+        cached = ' ({} cached)'.format(cached)
+    else:
+        cached = ' (cached)' if cached else ''
+    verify = ''
+    if 'verify' in timings:
+        verify = ', {} px off pixels mode in {:.2f}s'.format(timings['inputModeDiff'],
+                                                             timings['verify'])
+    mesh = ''
+    if 'mesh' in timings:
+        mesh = ', mesh {} in {:.2f}s'.format('PASS' if timings['meshPassed'] else 'FAIL',
+                                             timings['mesh'])
+    return '{}: load {:.2f}s{}, generate {:.2f}s{}, write {:.2f}s{}{} (total {:.2f}s)'.format(
+        inputPath, timings['load'], search, timings['generate'], cached,
+        timings['write'], verify, mesh, timings['total'])
+
+def runBatch(inputPaths, outputDir, settings, jobs=1, report=print, job=runJob,
+             profiles=None):
+    '''Runs job (runJob, runGrid or runTrain) for every input path, jobs at a
+    time in a process pool, and reports each job's timings as it finishes.
+    If profiles is a list, every job is profiled (see gear_profile) and its
+    Profiler appended to it. Returns the number of failures.'''
+    os.makedirs(outputDir, exist_ok=True)
+    if settings['canvasDir'] is not None:
+        os.makedirs(settings['canvasDir'], exist_ok=True)
+    profile = profiles is not None
+    failures = 0
+    if jobs <= 1 or len(inputPaths) <= 1:
+        results = (_runJobSafe(job, path, outputDir, settings, profile) for path in inputPaths)
+        for path, timings, error, profiler in results:
+            failures += _report(path, timings, error, report)
+            if profile:
+                profiles.append(profiler)
+        return failures
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = [pool.submit(_runJobSafe, job, path, outputDir, settings, profile)
+                   for path in inputPaths]
+        for future in futures:
+            path, timings, error, profiler = future.result()
+            failures += _report(path, timings, error, report)
+            if profile:
+                profiles.append(profiler)
+    return failures
+
+def _runJobSafe(job, inputPath, outputDir, settings, profile=False):
+    profiler = gear_profile.enable(gear_profile.Profiler(inputPath)) if profile else None
+    try:
+        return job(inputPath, outputDir, settings) + (None, profiler)
+    except Exception as e:
+        return inputPath, None, '{}: {}'.format(type(e).__name__, e), profiler
+    finally:
+        if profile:
+            gear_profile.disable()
+
+def _report(inputPath, timings, error, report):
+    if error is not None:
+        report('{}: FAILED ({})'.format(inputPath, error))
+        return 1
+    report(formatTimings(inputPath, timings))
+    failed = timings.get('meshPassed') is False or timings.get('overlapFound') is False
+    return 1 if failed else 0
+
+# =======================
+# Command line
+# =======================
+
+def buildParser():
+    parser = argparse.ArgumentParser(
+        description='Generate meshing gears for input gear images, without a GUI.')
+    parser.add_argument('inputs', nargs='+',
+                        help='input gear PNG paths or glob patterns')
+    parser.add_argument('-o', '--output-dir', default='.',
+                        help='directory for the gear and crossbar PNGs (default: .)')
+    parser.add_argument('-r', '--ratio', type=gear_engine.parseRatio, nargs='+', default=[2],
+                        help='gear ratio, e.g. 2 or 3/2; several values generate every '
+                             'combination with the overlaps (default: 2)')
+    parser.add_argument('--overlap', type=float, nargs='+', default=[1.0],
+                        help='gear overlap, 0.0 to 1.0; several values generate every '
+                             'combination with the ratios (default: 1.0)')
+    parser.add_argument('--train', action='store_true',
+                        help='chain the ratios into a gear train, each gear generated from '
+                             'the one before; give one overlap, or one per ratio')
+    parser.add_argument('--auto-overlap', type=float, nargs='?', const=2.0, default=None,
+                        metavar='GAP',
+                        help='pick the overlap per image: the smallest that leaves no gap '
+                             'wider than GAP pixels between the gears (default GAP: 2.0); '
+                             'overrides --overlap. If no overlap gets the gaps that narrow, '
+                             'the closest is used and the job counts as failed')
+    parser.add_argument('--check-mesh', action='store_true',
+                        help='check each gear pair for interference and backlash over a full '
+                             'turn (see gear_analysis.py), write <name>_mesh.csv and count a '
+                             'failed check as a failed job')
+    parser.add_argument('--vector', nargs='+', choices=gear_vector.VECTOR_FORMATS, default=[],
+                        help='also write the gear and crossbar as SVG and/or DXF cut files')
+    parser.add_argument('--mm-per-pixel', type=float, default=gear_vector.DEFAULT_MM_PER_PIXEL,
+                        help='size of an input image pixel in the cut files, in mm '
+                             '(default: %(default)s)')
+    parser.add_argument('-s', '--steps', type=gear_engine.parseSteps, default=1000,
+                        help='computation steps, or "auto" to pick them from the input '
+                             'size and engine (default: 1000)')
+    parser.add_argument('--engine', choices=gear_engine.ENGINES, default='raster',
+                        help='generation engine (default: raster)')
+    parser.add_argument('--input-mode', choices=gear_engine.INPUT_MODES, default='pixels',
+                        help='input points swept by the raster engine (default: pixels)')
+    parser.add_argument('--canvas-dir', default=None, metavar='DIR',
+                        help='build each output gear bitmap in a disk-backed file in DIR '
+                             'instead of in memory, for gears too large for RAM '
+                             '(single gears only; the file is removed once written)')
+    parser.add_argument('--verify-input-mode', action='store_true',
+                        help='also sweep every black pixel and report how many output pixels '
+                             'the --input-mode gear differs by (raster engine, single gears)')
+    parser.add_argument('--threshold', type=int, default=gear_engine.DEFAULT_BLACK_THRESHOLD,
+                        help='gray level at or below which input pixels are black '
+                             '(default: %(default)s)')
+    parser.add_argument('--max-size', type=int, default=None,
+                        help='downscale inputs whose larger side exceeds this many pixels')
+    parser.add_argument('--cache-dir', default=None,
+                        help='result cache directory (default: $PYGEAR_CACHE_DIR or '
+                             '~/.cache/pygear)')
+    parser.add_argument('--cache-size', type=float, default=gear_cache.DEFAULT_MAX_BYTES/2**20,
+                        help='result cache size limit in MB (default: %(default)d)')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='always regenerate; do not read or write the result cache')
+    parser.add_argument('--profile', default=None, metavar='TRACE',
+                        help='time every pipeline stage and count the points and pixels '
+                             'processed; writes a JSON trace of all jobs to TRACE')
+    parser.add_argument('--chrome-trace', action='store_true',
+                        help='write the --profile trace in Chrome trace format '
+                             '(chrome://tracing, ui.perfetto.dev)')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1,
+                        help='gear jobs run in parallel (default: number of CPUs)')
+    return parser
+
+def main(argv=None):
+    parser = buildParser()
+    args = parser.parse_args(argv)
+    grid = len(args.ratio) > 1 or len(args.overlap) > 1
+    if (grid or args.train) and args.auto_overlap is not None:
+        parser.error('--auto-overlap picks a single overlap; it cannot be used with several '
+                     'ratios or overlaps or --train')
+    if (grid or args.train) and args.canvas_dir is not None:
+        parser.error('--canvas-dir builds a single gear; it cannot be used with several '
+                     'ratios or overlaps or --train')
+    if args.verify_input_mode and (grid or args.train or args.engine != 'raster'):
+        parser.error('--verify-input-mode compares single raster gears; it cannot be used '
+                     'with several ratios or overlaps, --train or another --engine')
+    if (grid or args.train) and args.check_mesh:
+        parser.error('--check-mesh checks a single gear pair; it cannot be used with several '
+                     'ratios or overlaps or --train')
+    stages = None
+    if args.train:
+        try:
+            stages = gear_engine.trainStages(args.ratio, args.overlap)
+        except ValueError as e:
+            parser.error(str(e))
+    inputPaths = expandInputs(args.inputs)
+    if not inputPaths:
+        print('No input images found.', file=sys.stderr)
+        return 2
+    collisions = stemCollisions(inputPaths)
+    if collisions:
+        for paths in collisions:
+            print('Inputs would overwrite each other\'s output files: {}'.format(', '.join(paths)),
+                  file=sys.stderr)
+        print('Rename them or run them into separate output directories.', file=sys.stderr)
+        return 2
+    jobs = max(1, min(args.jobs, len(inputPaths)))
+    settings = {
+        'ratio': args.ratio[0],
+        'overlap': args.overlap[0],
+        'ratios': args.ratio,
+        'overlaps': args.overlap,
+        'stages': stages,
+        'autoOverlap': args.auto_overlap,
+        'checkMesh': args.check_mesh,
+        'vector': args.vector,
+        'mmPerPixel': args.mm_per_pixel,
+        'steps': args.steps,
+        'engine': args.engine,
+        'inputMode': args.input_mode,
+        'canvasDir': args.canvas_dir,
+        'verifyInputMode': args.verify_input_mode,
+        'threshold': args.threshold,
+        'maxSize': args.max_size,
+        # A single job gets the cores for its own sweep instead.
+        'workers': args.jobs if len(inputPaths) == 1 else 1,
+        'cacheDir': None if args.no_cache else (args.cache_dir or gear_cache.GearCache().directory),
+        'cacheBytes': int(args.cache_size*2**20),
+    }
+    profiles = [] if args.profile else None
+    start = time.perf_counter()
+    failures = runBatch(inputPaths, args.output_dir, settings, jobs,
+                        job=runTrain if args.train else runGrid if grid else runJob,
+                        profiles=profiles)
+    print('{} job(s), {} failed, {:.2f}s'.format(len(inputPaths), failures,
+                                                 time.perf_counter() - start))
+    if profiles:
+        gear_profile.writeTrace(profiles, args.profile, args.chrome_trace)
+        print('Profile written to {}'.format(args.profile))
+    return 1 if failures else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
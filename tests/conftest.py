@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""
+Shared helpers for the pygear tests: small synthetic gear drawings and
+straightforward per-step reference sweeps to check the engine against.
+"""
+
+import math
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import gear_engine
+
+def drawGear(size=96, teeth=7, stroke=3, filled=False):
+    '''uint8 drawing of a wavy gear, black (0) on white (255): its outline,
+    stroke pixels wide, or the whole shape if filled.'''
+    rows, cols = np.mgrid[0:size, 0:size]
+    center = (size - 1)/2.
+    radius = np.hypot(cols - center, rows - center)
+    rim = size*(0.4 + 0.05*np.sin(teeth*np.arctan2(rows - center, cols - center)))
+    black = radius < rim if filled else np.abs(radius - rim) < stroke/2.
+    return np.where(black, 0, 255).astype(np.uint8)
+
+def _carve(outputGear, x, y, ratio, angle):
+    '''Turns points by angle about the output axle and sets their pixels.'''
+    size = len(outputGear)
+    cosA, sinA = math.cos(angle), math.sin(angle)
+    rows = np.floor((x*sinA + y*cosA + ratio)*size/(2*ratio)).astype(int)
+    cols = np.floor((x*cosA - y*sinA + ratio)*size/(2*ratio)).astype(int)
+    inside = (rows >= 0) & (rows < size) & (cols >= 0) & (cols < size)
+    outputGear[rows[inside], cols[inside]] = 255
+
+def _inputPoints(image, axle):
+    rowIdx, colIdx = np.nonzero(image == 0)
+    rows, cols = image.shape
+    scale = 2./max(rows, cols)
+    return scale*(colIdx - (cols - 1)/2.), scale*(rowIdx - (rows - 1)/2.)
+
+def referenceSweep(image, ratio, overlap, steps):
+    '''The original one-step-at-a-time sweep of main_no_gui.py, for whole
+    ratios: every black pixel turned about the input axle, kept inside the
+    output gear's radius and carved ratio times around the output axle.'''
+    axle = ratio + 1 - overlap
+    dx, dy = _inputPoints(image, axle)
+    outputGear = np.zeros((gear_engine.outputGearSize(max(image.shape), ratio),)*2, np.uint8)
+    theta = 2*math.pi/steps
+    phi = 2*math.pi/(steps*ratio)
+    for step in range(steps):
+        cosT, sinT = math.cos(theta*step), math.sin(theta*step)
+        x = (dx*cosT - dy*sinT) + axle
+        y = dx*sinT + dy*cosT
+        keep = np.sqrt(x*x + y*y) < ratio
+        for extra in range(ratio):
+            _carve(outputGear, x[keep], y[keep], ratio, phi*step + 2*math.pi*extra/ratio)
+    return outputGear
+
+def bruteForceSweep(image, ratio, overlap, steps):
+    '''Sweep over the whole rotation period of any ratio p/q without copies:
+    the input gear turns p times, steps steps a turn, while the output gear
+    turns q times.'''
+    ratio = float(ratio)
+    axle = ratio + 1 - overlap
+    dx, dy = _inputPoints(image, axle)
+    outputGear = np.zeros((gear_engine.outputGearSize(max(image.shape), ratio),)*2, np.uint8)
+    theta = 2*math.pi/steps
+    for step in range(steps*gear_engine.ratioTurns(ratio)):
+        cosT, sinT = math.cos(theta*step), math.sin(theta*step)
+        x = (dx*cosT - dy*sinT) + axle
+        y = dx*sinT + dy*cosT
+        keep = np.sqrt(x*x + y*y) < ratio
+        _carve(outputGear, x[keep], y[keep], ratio, theta*step/ratio)
+    return outputGear
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for gear_analysis: the overlap search and the bitmap mesh check.
+"""
+
+import numpy as np
+
+import gear_analysis
+import gear_engine
+from conftest import drawGear
+
+def test_autoOverlapFindsTheMeshingOverlap():
+    # The widest gap falls and then rises again with the overlap: at 1.0 the
+    # gap is over 20 pixels, between 0.2 and 0.5 within the 2 pixel target
+    result = gear_analysis.autoOverlap(drawGear(256), 1)
+    assert 0.2 < result['overlap'] < 0.5
+    assert result['maxGap'] <= 2.0
+
+def test_autoOverlapReportsWhenNothingFits():
+    result = gear_analysis.autoOverlap(drawGear(256), 1, targetClearance=0.)
+    assert result['maxGap'] > 0.
+
+def test_labelRunsJoinsRunsThatShareAColumn():
+    mask = np.array([[1, 1, 0, 1],
+                     [0, 0, 0, 1],
+                     [1, 0, 1, 1]], dtype=bool)
+    starts, ends, labels = gear_analysis.labelRuns(mask)
+    # Keys are row*5 + col: runs (0,0-1), (0,3), (1,3), (2,0), (2,2-3)
+    assert starts.tolist() == [0, 3, 8, 10, 12]
+    assert ends.tolist() == [2, 4, 9, 11, 14]
+    assert labels.tolist() == [0, 1, 1, 2, 1]
+    assert np.array_equal(gear_analysis.paintRuns(mask.shape, starts, ends), mask)
+
+def test_labelRunsKeepsDiagonalNeighboursApart():
+    _, _, labels = gear_analysis.labelRuns(np.eye(3, dtype=bool))
+    assert labels.tolist() == [0, 1, 2]
+
+def test_distanceTransformMatchesBruteForce():
+    mask = np.zeros((7, 9), dtype=bool)
+    mask[1, 2] = mask[5, 7] = mask[6, 0] = True
+    rows, cols = np.indices(mask.shape)
+    expected = np.min([np.hypot(rows - row, cols - col) for row, col in zip(*np.nonzero(mask))],
+                      axis=0)
+    assert np.allclose(gear_analysis.distanceTransform(mask, maxDistance=20), expected)
+    assert np.allclose(gear_analysis.distanceTransform(mask, maxDistance=2),
+                       np.minimum(expected, 2))
+
+def test_meshReportPassesTheGearItWasGeneratedFor():
+    image = drawGear()
+    outputGear, _ = gear_engine.makeGear(image, 2, 0.6, 200)
+    summary = gear_analysis.meshReport(image, outputGear, 2, 0.6)['summary']
+    assert summary['passed']
+    assert summary['maxInterference'] <= gear_analysis.DEFAULT_MAX_INTERFERENCE
+    assert summary['maxGap'] <= gear_analysis.DEFAULT_MAX_BACKLASH
+
+def test_meshReportFailsAtTheWrongOverlap():
+    image = drawGear()
+    outputGear, _ = gear_engine.makeGear(image, 2, 0.6, 200)
+    # Axles too close: the teeth run into each other
+    tight = gear_analysis.meshReport(image, outputGear, 2, 0.8)['summary']
+    assert not tight['passed']
+    assert tight['maxInterference'] > gear_analysis.DEFAULT_MAX_INTERFERENCE
+    # Axles too far apart: the teeth lose contact
+    loose = gear_analysis.meshReport(image, outputGear, 2, 0.4)['summary']
+    assert not loose['passed']
+    assert loose['maxGap'] > gear_analysis.DEFAULT_MAX_BACKLASH
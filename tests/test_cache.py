@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the on-disk gear cache, gear_cache.py.
+"""
+
+import os
+
+import numpy as np
+import pytest
+
+import gear_cache
+import gear_engine
+from conftest import drawGear
+
+PARAMS = {'ratio': 2, 'overlap': 1.0, 'steps': 50, 'engine': 'raster', 'inputMode': 'pixels'}
+
+def test_hitReturnsTheSameBitmaps(tmp_path):
+    cache = gear_cache.GearCache(str(tmp_path))
+    image = drawGear(48)
+    outputGear, crossbar, hit = gear_cache.cachedMakeGear(image, 2, 1.0, 50, cache=cache)
+    assert not hit
+    cachedGear, cachedCrossbar, hit = gear_cache.cachedMakeGear(image, 2, 1.0, 50, cache=cache)
+    assert hit
+    assert cachedGear.dtype == outputGear.dtype
+    assert np.array_equal(cachedGear, outputGear)
+    assert np.array_equal(cachedCrossbar, crossbar)
+
+@pytest.mark.parametrize('name, value', [('ratio', '3/2'), ('overlap', 0.9), ('steps', 60),
+                                         ('engine', 'swept'), ('inputMode', 'boundary')])
+def test_keyChangesWithEachParameter(name, value):
+    image = drawGear(48)
+    key = gear_cache.GearCache.key(image, **gear_cache.jobParams(**PARAMS))
+    params = gear_cache.jobParams(**dict(PARAMS, **{name: value}))
+    changed = gear_cache.GearCache.key(image, **params)
+    assert changed != key
+
+def test_keyChangesWithTheInputAndEngineVersion(monkeypatch):
+    image = drawGear(48)
+    key = gear_cache.GearCache.key(image, **PARAMS)
+    assert gear_cache.GearCache.key(drawGear(48, teeth=8), **PARAMS) != key
+    monkeypatch.setattr(gear_engine, 'ENGINE_VERSION', gear_engine.ENGINE_VERSION + 1)
+    assert gear_cache.GearCache.key(image, **PARAMS) != key
+
+def test_sameRatioSpellingsShareAKey():
+    assert gear_cache.jobParams(1.5, 1.0, 50) == gear_cache.jobParams('3/2', 1.0, 50)
+
+def test_evictsLeastRecentlyUsedEntries(tmp_path):
+    cache = gear_cache.GearCache(str(tmp_path))
+    bitmap = np.zeros((64, 64), dtype=np.uint8)
+    for number, key in enumerate('abc'):
+        cache.put(key, bitmap, bitmap)
+        os.utime(cache.path(key), (1000 + number, 1000 + number))
+    entrySize = os.path.getsize(cache.path('a'))
+    # Reading 'a' makes it the most recently used, so 'b' goes first
+    assert cache.get('a') is not None
+    cache.maxBytes = 3*entrySize + entrySize // 2
+    cache.put('d', bitmap, bitmap)
+    assert sorted(os.path.basename(path) for _, _, path in cache.entries()) == [
+        'a.npz', 'c.npz', 'd.npz']
+    assert cache.get('b') is None
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the headless batch CLI, pygear_cli.py.
+"""
+
+import os
+
+import numpy as np
+import pytest
+from PIL import Image
+
+import pygear_cli
+from conftest import drawGear
+
+def writeDrawing(path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    Image.fromarray(drawGear(48)).save(path)
+
+def test_collidingBasenamesAreRefused(tmp_path, capsys):
+    first = str(tmp_path / 'a' / 'gear.png')
+    second = str(tmp_path / 'b' / 'Gear.png')
+    writeDrawing(first)
+    writeDrawing(second)
+    outputDir = tmp_path / 'out'
+    assert pygear_cli.main([first, second, '-o', str(outputDir), '--no-cache']) == 2
+    assert first in capsys.readouterr().err
+    assert not outputDir.exists()
+
+def test_distinctBasenamesAreWritten(tmp_path):
+    first = str(tmp_path / 'a' / 'one.png')
+    second = str(tmp_path / 'b' / 'two.png')
+    writeDrawing(first)
+    writeDrawing(second)
+    outputDir = tmp_path / 'out'
+    assert pygear_cli.main([first, second, '-o', str(outputDir), '--no-cache',
+                            '--steps', '50', '-j', '1']) == 0
+    assert sorted(os.listdir(outputDir)) == ['one_crossbar.png', 'one_gear.png',
+                                             'two_crossbar.png', 'two_gear.png']
+
+def test_autoOverlapWithoutFitFails(tmp_path, capsys):
+    drawing = str(tmp_path / 'gear.png')
+    writeDrawing(drawing)
+    assert pygear_cli.main([drawing, '-o', str(tmp_path / 'out'), '--no-cache', '--steps', '50',
+                            '--auto-overlap=0']) == 1
+    assert 'NO FIT' in capsys.readouterr().out
+
+def test_canvasDirWritesTheSameGear(tmp_path):
+    drawing = str(tmp_path / 'gear.png')
+    writeDrawing(drawing)
+    outputs = []
+    for name, extra in (('ram', []), ('disk', ['--canvas-dir', str(tmp_path / 'canvas')])):
+        outputDir = tmp_path / name
+        assert pygear_cli.main([drawing, '-o', str(outputDir), '--no-cache', '--steps', '50']
+                               + extra) == 0
+        outputs.append(np.asarray(Image.open(outputDir / 'gear_gear.png')))
+    assert np.array_equal(outputs[0], outputs[1])
+    assert os.listdir(tmp_path / 'canvas') == []
+
+def test_trainIsCachedPerStage(tmp_path, capsys):
+    drawing = str(tmp_path / 'gear.png')
+    writeDrawing(drawing)
+    args = [drawing, '-o', str(tmp_path / 'out'), '--cache-dir', str(tmp_path / 'cache'),
+            '--train', '--ratio', '2', '3/2', '--steps', '50']
+    assert pygear_cli.main(args) == 0
+    assert '(0/2 cached)' in capsys.readouterr().out
+    assert pygear_cli.main(args) == 0
+    assert '(2/2 cached)' in capsys.readouterr().out
+    assert sorted(os.listdir(tmp_path / 'out')) == ['gear_g1_crossbar.png', 'gear_g1_gear.png',
+                                                    'gear_g2_crossbar.png', 'gear_g2_gear.png']
+
+def test_verifyInputModeReportsTheDifference(tmp_path, capsys):
+    drawing = str(tmp_path / 'gear.png')
+    writeDrawing(drawing)
+    assert pygear_cli.main([drawing, '-o', str(tmp_path / 'out'), '--no-cache', '--steps', '50',
+                            '--input-mode', 'boundary', '--verify-input-mode']) == 0
+    assert 'px off pixels mode' in capsys.readouterr().out
+
+def test_verifyInputModeNeedsTheRasterEngine(tmp_path):
+    drawing = str(tmp_path / 'gear.png')
+    writeDrawing(drawing)
+    with pytest.raises(SystemExit):
+        pygear_cli.main([drawing, '-o', str(tmp_path / 'out'), '--engine', 'swept',
+                         '--verify-input-mode'])
@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+"""
+Regression tests for the sweep in gear_engine: the vectorized engine must
+carve exactly what the original per-step loop carves, and the other engines,
+previews and grids what it does (the envelope engine only up to the edge).
+"""
+
+import warnings
+from fractions import Fraction
+
+import numpy as np
+import pytest
+
+import gear_analysis
+import gear_engine
+from conftest import bruteForceSweep, drawGear, referenceSweep
+
+@pytest.mark.parametrize('ratio, overlap', [(1, 1.0), (2, 0.6), (3, 0.3)])
+def test_rasterMatchesReferenceLoop(ratio, overlap):
+    image = drawGear()
+    outputGear, _ = gear_engine.generateGear(image, ratio, overlap, 300)
+    assert np.array_equal(outputGear, referenceSweep(image, ratio, overlap, 300))
+
+@pytest.mark.parametrize('swept', [False, True])
+def test_parallelMatchesSerial(swept):
+    image = drawGear()
+    serial, _ = gear_engine.generateGear(image, 2, 0.8, 200, swept=swept)
+    parallel, _ = gear_engine.generateGear(image, 2, 0.8, 200, workers=2, swept=swept)
+    assert np.array_equal(parallel, serial)
+
+@pytest.mark.parametrize('ratio', [2, 3])
+def test_sweptCoversReferenceLoop(ratio):
+    # Swept carves every pixel the loop carves at the same steps, and with
+    # few steps lands close to the loop run with sixteen times as many.
+    image = drawGear()
+    swept, _ = gear_engine.generateGear(image, ratio, 1.0, 40, swept=True)
+    assert np.all(swept[referenceSweep(image, ratio, 1.0, 40) == 255] == 255)
+    assert np.count_nonzero(swept != referenceSweep(image, ratio, 1.0, 640)) < swept.size // 500
+
+@pytest.mark.parametrize('swept', [False, True])
+def test_canvasesMatchInMemoryBitmap(tmp_path, swept):
+    image = drawGear()
+    expected, _ = gear_engine.generateGear(image, 2, 0.8, 120, swept=swept)
+    onDisk, _ = gear_engine.generateGear(image, 2, 0.8, 120, swept=swept,
+                                         canvasPath=str(tmp_path / 'canvas'))
+    assert isinstance(onDisk, np.memmap)
+    assert np.array_equal(onDisk, expected)
+    size = len(expected)
+    packed = gear_engine.newPackedCanvas(size)
+    inputCoords, _ = gear_engine.getInputCoords(image, (2.2, 0), 'pixels', 120)
+    gear_engine.sweepSteps(packed, inputCoords, range(120), 2, 0.8, 120, size=size,
+                           swept=swept)
+    unpacked = gear_engine.unpackInto(gear_engine.newCanvas(size), packed)
+    assert np.array_equal(unpacked, expected)
+
+def test_sweepReleasesPointCaches():
+    image = drawGear()
+    inputCoords, size = gear_engine.getInputCoords(image, (2.2, 0), 'pixels', 100)
+    outputGear = gear_engine.newCanvas(gear_engine.outputGearSize(size, 2))
+    for _ in gear_engine.iterSweep(outputGear, inputCoords, 2, 0.8, 100, maxBlock=10):
+        assert inputCoords.cache
+    assert not inputCoords.cache
+    sweep = gear_engine.iterSweep(outputGear, inputCoords, 2, 0.8, 100, maxBlock=10)
+    next(sweep)
+    sweep.close()
+    assert not inputCoords.cache
+
+@pytest.mark.parametrize('ratio, overlap', [(1, 1.0), (2, 0.6), (2, 1.0)])
+def test_boundaryMatchesPixelsOnThickOutlines(ratio, overlap):
+    # The stroke is wider than the band, so interior pixels are dropped
+    assert gear_engine.compareInputModes(drawGear(stroke=16), ratio, overlap, 300,
+                                         'boundary') == 0
+
+def test_boundaryCloseToPixelsOnFilledDrawings():
+    # Not exact (see boundaryWidth), hence 'pixels' as the default
+    assert gear_engine.compareInputModes(drawGear(filled=True), 1, 1.0, 300, 'boundary') <= 8
+
+@pytest.mark.parametrize('ratio', [Fraction(3, 2), Fraction(5, 3), Fraction(2, 3)])
+def test_fractionalRatioMatchesBruteForce(ratio):
+    # Copies of one input turn must carve what the whole period carves
+    image = drawGear()
+    outputGear, _ = gear_engine.generateGear(image, ratio, 0.8, 300)
+    assert np.array_equal(outputGear, bruteForceSweep(image, ratio, 0.8, 300))
+
+@pytest.mark.parametrize('overlap', [2.0, 2.5])
+def test_axleAtOrPastOutputAxle(overlap):
+    # ratio + 1 - overlap <= 0: the input axle sits on or past the output axle
+    image = drawGear()
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        outputGear, _ = gear_engine.generateGear(image, 1, overlap, 300)
+    assert np.array_equal(outputGear, referenceSweep(image, 1, overlap, 300))
+
+@pytest.mark.parametrize('text, ratio', [('2', 2), ('1.5', Fraction(3, 2)),
+                                         ('7/3', Fraction(7, 3))])
+def test_parseRatioKeepsExactRatios(text, ratio):
+    assert gear_engine.parseRatio(text) == ratio
+
+@pytest.mark.parametrize('text', ['1.001', '3.14159', '0', '-2'])
+def test_parseRatioRefusesRoundedOrNonPositiveRatios(text):
+    with pytest.raises(ValueError):
+        gear_engine.parseRatio(text)
+
+def test_trainSweepsLaterGearsByTheirBoundary():
+    calls = []
+
+    def make(image, ratio, overlap, steps, engine, inputMode, workers):
+        calls.append(inputMode)
+        return gear_engine.makeGear(image, ratio, overlap, steps, engine, inputMode, workers)
+    image = drawGear(48)
+    results = gear_engine.generateTrain(image, [(2, 1.0), (1, 1.0)], 50, make=make)
+    assert calls == ['pixels', gear_engine.TRAIN_INPUT_MODE]
+    expected, _ = gear_engine.makeGear(results[0][2], 1, 1.0, 50, inputMode='boundary')
+    assert np.array_equal(results[1][2], expected)
+
+@pytest.mark.parametrize('ratio, overlap', [(2, 0.6), (3, 0.3)])
+def test_envelopeMatchesRasterUpToTheEdge(ratio, overlap):
+    # The polar profile only approximates the swept bitmap: allow differences
+    # along the raster gear's edge, nowhere else
+    image = drawGear(filled=True)
+    envelope, _ = gear_engine.makeGear(image, ratio, overlap, 400, 'envelope')
+    raster, _ = gear_engine.makeGear(image, ratio, overlap, 400, 'raster')
+    gear = raster == 0
+    padded = np.pad(gear, 1)
+    inner = padded[:-2, 1:-1] & padded[2:, 1:-1] & padded[1:-1, :-2] & padded[1:-1, 2:]
+    fromEdge = gear_analysis.distanceTransform(gear & ~inner)
+    differ = envelope != raster
+    assert np.count_nonzero(differ) < raster.size // 50
+    assert fromEdge[differ].max() <= 3
+
+def test_progressiveEndsWithTheFullSweep():
+    image = drawGear()
+    factors = []
+    for outputGear, factor, done, levelSteps in gear_engine.iterProgressive(
+            image, 2, 0.6, 200, previewSize=48):
+        factors.append(factor)
+    assert factors[0] > 1 and factors[-1] == 1
+    assert (done, levelSteps) == (200, 200)
+    expected, _ = gear_engine.generateGear(image, 2, 0.6, 200)
+    assert np.array_equal(outputGear, expected)
+
+@pytest.mark.parametrize('engine, workers', [('raster', 1), ('swept', 1), ('raster', 2)])
+def test_gridMatchesSingleGears(engine, workers):
+    image = drawGear()
+    results = gear_engine.generateGrid(image, [2, Fraction(3, 2)], [0.6, 1.0], 120, engine,
+                                       workers=workers)
+    assert [(ratio, overlap) for ratio, overlap, _, _ in results] == gear_engine.gridCombos(
+        [2, Fraction(3, 2)], [0.6, 1.0])
+    for ratio, overlap, outputGear, crossbar in results:
+        expected, expectedCrossbar = gear_engine.makeGear(image, ratio, overlap, 120, engine)
+        assert np.array_equal(outputGear, expected)
+        assert np.array_equal(crossbar, expectedCrossbar)
+
+# With the input axle inside the output gear (2, 2.5) every point reaches it
+@pytest.mark.parametrize('ratio, overlap, prunes', [(1, 1.0, True), (2, 0.6, True),
+                                                    (3, 0.3, True), (2, 2.5, False)])
+def test_pruningKeepsEveryPointThatReachesTheOutputGear(ratio, overlap, prunes):
+    image = drawGear()
+    axle = ratio + 1 - overlap
+    steps = 90
+    inputCoords, _ = gear_engine.getInputCoords(image, (axle, 0), 'pixels')
+    stepIdx, pointIdx = gear_engine.sweepCandidates(inputCoords, range(steps), axle, steps,
+                                                    ratio)
+    # Every point turned by every step, unpruned
+    turn = 2*np.pi/steps*np.arange(steps)[:, None]
+    dx, dy = inputCoords.x - axle, inputCoords.y
+    x = dx*np.cos(turn) - dy*np.sin(turn) + axle
+    y = dx*np.sin(turn) + dy*np.cos(turn)
+    reaching = set(zip(*np.nonzero(x*x + y*y < ratio*ratio)))
+    candidates = set(zip(stepIdx.tolist(), pointIdx.tolist()))
+    assert reaching <= candidates
+    assert (len(candidates) < steps*len(inputCoords)) == prunes
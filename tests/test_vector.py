@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the SVG and DXF cut file export, gear_vector.py.
+"""
+
+import xml.etree.ElementTree as ET
+
+import numpy as np
+import pytest
+
+import gear_engine
+import gear_vector
+from conftest import drawGear
+
+def segmentDistance(points, start, end):
+    '''Distance of each of points (Nx2) to the segment start-end.'''
+    chord = end - start
+    length2 = float(np.dot(chord, chord))
+    t = np.zeros(len(points)) if length2 == 0 else np.clip((points - start) @ chord/length2, 0, 1)
+    return np.hypot(*(points - start - t[:, None]*chord).T)
+
+@pytest.mark.parametrize('tolerance', [0.5, 2.])
+def test_simplifyPolylineStaysWithinTolerance(tolerance):
+    rng = np.random.default_rng(1)
+    points = np.cumsum(rng.normal(size=(400, 2)), axis=0)
+    simplified = gear_vector.simplifyPolyline(points, tolerance)
+    assert np.array_equal(simplified[[0, -1]], points[[0, -1]])
+    assert len(simplified) < len(points)
+    distance = np.min([segmentDistance(points, start, end)
+                       for start, end in zip(simplified[:-1], simplified[1:])], axis=0)
+    assert distance.max() <= tolerance + 1e-9
+
+def gearAndShapes():
+    outputGear, _ = gear_engine.makeGear(drawGear(), 2, 0.6, 200)
+    return outputGear, gear_vector.gearShapes(outputGear)
+
+def test_gearShapesReplaceTheCenterMark():
+    outputGear, shapes = gearAndShapes()
+    assert shapes[-1] == ('circle', (0., 0.), gear_vector.markRadius(len(outputGear)))
+    # Only the gear's outline is left: no loop traced around the center mark
+    loops = [points for kind, points, *_ in shapes if kind == 'loop']
+    assert min(np.hypot(*points.T).max() for points in loops) > len(outputGear)/4
+
+def test_writeSvgParses(tmp_path):
+    _, shapes = gearAndShapes()
+    shapes += gear_vector.crossbarShapes(150.)
+    root = ET.parse(str(gear_vector.writeSvg(shapes, str(tmp_path / 'gear.svg')))).getroot()
+    assert root.tag == '{http://www.w3.org/2000/svg}svg'
+    paths = root.findall('{http://www.w3.org/2000/svg}path')
+    assert len(paths) == len(shapes)
+    assert all(path.get('d').startswith('M') and path.get('d').endswith('Z') for path in paths)
+
+def test_writeDxfParses(tmp_path):
+    _, shapes = gearAndShapes()
+    shapes += gear_vector.crossbarShapes(150.)
+    with open(gear_vector.writeDxf(shapes, str(tmp_path / 'gear.dxf'))) as fp:
+        lines = fp.read().splitlines()
+    # Group code / value pairs, codes all integers
+    assert len(lines) % 2 == 0
+    pairs = [(int(code), value) for code, value in zip(lines[::2], lines[1::2])]
+    assert pairs[-1] == (0, 'EOF')
+    entities = [value for code, value in pairs if code == 0]
+    loops = sum(kind == 'loop' for kind, *_ in shapes)
+    assert entities.count('POLYLINE') == entities.count('SEQEND') == loops
+    assert entities.count('CIRCLE') == 3
+    assert entities.count('LINE') == entities.count('ARC') == 2
+    for code, value in pairs:
+        if 10 <= code < 60:
+            float(value)
+
+def test_crossbarHolesMatchTheBitmap():
+    distance = 300
+    crossbar = gear_engine.drawCrossbar(distance)
+    shapes = gear_vector.crossbarShapes(distance)
+    holes = [shape[1] for shape in shapes if shape[0] == 'circle']
+    # The bitmap's hole marks are the black pixels near each end's center
+    rows, cols = np.nonzero(crossbar == 0)
+    radius = len(crossbar)/2. - 0.5
+    centers = []
+    for end in (radius, distance + radius):
+        near = np.hypot(rows - radius, cols - end) < radius/2
+        centers.append((cols[near].mean(), rows[near].mean()))
+    assert centers[1][0] - centers[0][0] == pytest.approx(holes[1][0] - holes[0][0])
+    assert centers[1][1] == pytest.approx(centers[0][1])
+    assert shapes[0][3] == pytest.approx(radius)